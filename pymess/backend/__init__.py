@@ -1,15 +1,68 @@
+import asyncio
+import logging
+import random
+
 from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import timedelta
+from functools import partial
+from threading import BoundedSemaphore, Lock
+
+from asgiref.sync import sync_to_async
 
-from django.db import transaction
+from chamber.exceptions import PersistenceException
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.db.models import Q
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _l
 from django.utils.translation import gettext
 from django.utils.timezone import now
 
 from pymess.config import settings
-from pymess.config import get_router, get_backend, get_default_sender_backend_name
-from pymess.utils import fullname
+from pymess.config import get_router, get_backend, get_backend_names, get_default_sender_backend_name
+from pymess.models.common import get_queue_ordering, get_queue_states
+from pymess.utils import chunked, fullname
+from pymess.utils.circuit_breaker import CircuitBreaker
+from pymess.utils.rate_limit import RateLimiter
+from pymess.utils.templates import template_registry
+
+LOGGER = logging.getLogger(__name__)
+
+_publish_executor = None
+_publish_executor_lock = Lock()
+
+
+def get_publish_executor():
+    """
+    Return thread pool which publishes messages after commit, pool size is defined with
+    PYMESS_PUBLISH_ON_COMMIT_WORKERS
+    """
+    global _publish_executor
+
+    with _publish_executor_lock:
+        if _publish_executor is None:
+            _publish_executor = ThreadPoolExecutor(
+                max_workers=settings.PUBLISH_ON_COMMIT_WORKERS, thread_name_prefix='pymess-publish'
+            )
+        return _publish_executor
+
+
+def _publish_after_commit(publish_function, *args):
+    # The transaction is already committed, error cannot be raised to the caller
+    try:
+        publish_function(*args)
+    except Exception as ex:
+        LOGGER.exception(ex)
+
+
+def _publish_in_thread(publish_function, *args):
+    try:
+        _publish_after_commit(publish_function, *args)
+    finally:
+        close_old_connections()
 
 
 class BaseController:
@@ -21,12 +74,20 @@ class BaseController:
 
     model = None
     backend_type_name = None
+    sending_error_class = None
 
     def __init__(self):
         self._loaded_backends = {}
 
     def get_backend(self, recipient, **kwargs):
         backend_name = self.router.get_backend_name(recipient, **kwargs) or get_default_sender_backend_name(self.backend_type_name)
+        return self.get_backend_by_name(backend_name)
+
+    def get_backend_by_name(self, backend_name):
+        """
+        Return backend instance with the configuration defined in the settings under the name
+        :param backend_name: name of the backend in the settings
+        """
         if backend_name not in self._loaded_backends:
             self._loaded_backends[backend_name] = get_backend(self.backend_type_name, backend_name)
         return self._loaded_backends[backend_name]
@@ -37,30 +98,220 @@ class BaseController:
 
     def get_waiting_or_retry_messages(self):
         """
-        Return queryset of waiting messages to send
+        Return queryset of waiting messages to send, messages which failed are returned after the retry delay and
+        scheduled messages after the time of sending
         """
-        return self.model.objects.filter(state__in={self.model.State.WAITING, self.model.State.ERROR_RETRY})
+        return self.model.objects.filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now()),
+            Q(send_at__isnull=True) | Q(send_at__lte=now()),
+            state__in=get_queue_states(self.model.State),
+        )
+
+    @transaction.atomic
+    def claim_waiting_or_retry_messages(self, limit, exclude_pks=None):
+        """
+        Claim waiting messages to send. Messages are leased in a short transaction (rows locked by another worker are
+        skipped) therefore the messages can be published outside of the transaction and more workers can send
+        messages in parallel. Messages with expired lease are claimed again.
+        :param limit: maximal number of claimed messages
+        :param exclude_pks: primary keys of messages which should not be claimed
+        :return: list of claimed messages
+        """
+        claimed_at = now()
+        messages_qs = self.get_waiting_or_retry_messages().filter(
+            Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=claimed_at)
+        )
+        if exclude_pks:
+            messages_qs = messages_qs.exclude(pk__in=exclude_pks)
+        messages = list(
+            messages_qs.select_for_update(skip_locked=True).order_by(*get_queue_ordering())[:limit]
+        )
+        self.lease_messages(messages, claimed_at)
+        return messages
+
+    def lease_messages(self, messages, leased_at=None):
+        """
+        Lease messages for PYMESS_BATCH_LEASE_SECONDS, leased messages are not claimed by the batch sender
+        :param messages: list of messages
+        :param leased_at: time of the lease, now by default
+        :return: time when the lease expires
+        """
+        lease_expires_at = (leased_at or now()) + timedelta(seconds=settings.BATCH_LEASE_SECONDS)
+        if messages:
+            self.model.objects.filter(pk__in=[message.pk for message in messages]).update(
+                lease_expires_at=lease_expires_at
+            )
+            for message in messages:
+                message.lease_expires_at = lease_expires_at
+        return lease_expires_at
+
+    def release_messages(self, messages):
+        """
+        Release lease of the claimed messages
+        :param messages: list of claimed messages
+        """
+        if messages:
+            self.model.objects.filter(pk__in=[message.pk for message in messages]).update(lease_expires_at=None)
+            for message in messages:
+                message.lease_expires_at = None
 
     def is_turned_on_batch_sending(self):
         return False
 
+    def _get_publish_error(self, backend, message):
+        """
+        Return error why the message cannot be published or None if message can be published
+        :param backend: backend which will publish the message
+        :param message: message object
+        """
+        if message.number_of_send_attempts > backend.get_batch_max_number_of_send_attempts():
+            return gettext('the number of send attempts exceeded the limit')
+        elif (message.send_at or message.created_at) < now() - timedelta(seconds=self.get_batch_max_seconds_to_send()):
+            return gettext('the age of the message exceeds the send limit')
+        elif message.expires_at is not None and message.expires_at <= now():
+            return gettext('the message expired')
+        else:
+            return None
+
+    def _get_expired_messages_conditions(self):
+        """
+        Return pairs (error, condition) of messages which cannot be published, the conditions are the same as
+        the conditions of the _get_publish_error method
+        """
+        current_time = now()
+        backends_max_number_of_send_attempts = {}
+        for backend_name in get_backend_names(self.backend_type_name):
+            backend = self.get_backend_by_name(backend_name)
+            # Messages store only the backend path, if more configured backends use the same path the highest limit
+            # is used to not fail messages which can be still sent
+            backends_max_number_of_send_attempts[fullname(backend)] = max(
+                backends_max_number_of_send_attempts.get(fullname(backend), 0),
+                backend.get_batch_max_number_of_send_attempts()
+            )
+        max_number_of_send_attempts_condition = Q(pk__in=[])
+        for backend_path, max_number_of_send_attempts in backends_max_number_of_send_attempts.items():
+            max_number_of_send_attempts_condition |= Q(
+                backend=backend_path,
+                number_of_send_attempts__gt=max_number_of_send_attempts
+            )
+        min_send_at = current_time - timedelta(seconds=self.get_batch_max_seconds_to_send())
+        return (
+            (gettext('the number of send attempts exceeded the limit'), max_number_of_send_attempts_condition),
+            (
+                gettext('the age of the message exceeds the send limit'),
+                Q(send_at__isnull=True, created_at__lt=min_send_at) | Q(send_at__lt=min_send_at)
+            ),
+            (gettext('the message expired'), Q(expires_at__lte=current_time)),
+        )
+
+    def fail_expired_messages(self):
+        """
+        Set waiting messages which cannot be published (the number of send attempts or the age of the message exceed
+        the limit or the message expired) as failed. Messages are updated with update queries in chunks with size
+        defined by PYMESS_EXPIRED_MESSAGES_CHUNK_SIZE, claimed messages are skipped.
+        :return: number of failed messages
+        """
+        number_of_failed_messages = 0
+        for error, condition in self._get_expired_messages_conditions():
+            expired_messages_qs = self.model.objects.filter(
+                Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now()),
+                condition,
+                state__in=get_queue_states(self.model.State),
+            )
+            while True:
+                message_pks = list(
+                    expired_messages_qs.values_list('pk', flat=True)[:settings.EXPIRED_MESSAGES_CHUNK_SIZE]
+                )
+                if not message_pks:
+                    break
+                number_of_failed_messages += expired_messages_qs.filter(pk__in=message_pks).update(
+                    state=self.model.State.ERROR,
+                    error=error,
+                    changed_at=now(),
+                )
+        return number_of_failed_messages
+
     def publish_or_retry_message(self, message):
         backend = self.get_backend(recipient=message.recipient)
-        if message.number_of_send_attempts > backend.get_batch_max_number_of_send_attempts():
-            backend._set_message_as_failed(message, error=gettext('the number of send attempts exceeded the limit'))
+        error = self._get_publish_error(backend, message)
+        if error:
+            backend._set_message_as_failed(message, error=error)
             return False
-        elif message.created_at < now() - timedelta(seconds=self.get_batch_max_seconds_to_send()):
-            backend._set_message_as_failed(message, error=gettext('the age of the message exceeds the send limit'))
+        elif backend.circuit_breaker and not backend.circuit_breaker.allow_request():
+            self.defer_messages([message], backend.circuit_breaker.get_open_remaining_seconds())
             return False
         else:
-            backend.publish_message(message)
+            backend.wait_for_rate_limit([message])
+            try:
+                with backend.limit_concurrency():
+                    backend.publish_message(message)
+            except Exception:
+                if backend.circuit_breaker:
+                    backend.circuit_breaker.record(is_success=False)
+                raise
+            if backend.circuit_breaker:
+                backend.circuit_breaker.record(is_success=not message.failed)
             return True
 
+    def defer_messages(self, messages, seconds):
+        """
+        Postpone sending of messages without changing their state and the number of send attempts
+        :param messages: list of messages
+        :param seconds: number of seconds after which messages can be sent
+        """
+        next_attempt_at = now() + timedelta(seconds=seconds)
+        self.model.objects.filter(pk__in=[message.pk for message in messages]).update(next_attempt_at=next_attempt_at)
+        for message in messages:
+            message.next_attempt_at = next_attempt_at
+
+    def get_publish_chunks(self, messages):
+        """
+        Prepare messages for publishing in bulk. Messages are grouped by backend, messages which cannot be published
+        (the number of send attempts or the age of the message exceed the limit) are set as failed and the rest
+        of messages is split into chunks which can be published with one backend publish_messages call. Chunks
+        of backends with open circuit breaker are deferred.
+        :param messages: list of messages
+        :return: list of pairs (backend, list of messages)
+        """
+        publish_chunks = []
+        for backend, messages_for_backend in self._get_backend_messages_map(messages).items():
+            messages_to_publish = []
+            for message in messages_for_backend:
+                error = self._get_publish_error(backend, message)
+                if error:
+                    backend._set_message_as_failed(message, error=error)
+                else:
+                    messages_to_publish.append(message)
+            for chunk in chunked(messages_to_publish, backend.get_publish_messages_chunk_size()):
+                if backend.circuit_breaker and not backend.circuit_breaker.allow_request():
+                    self.defer_messages(chunk, backend.circuit_breaker.get_open_remaining_seconds())
+                else:
+                    publish_chunks.append((backend, chunk))
+        return publish_chunks
+
+    def publish_messages_chunk(self, backend, messages):
+        """
+        Publish chunk of messages with the backend, result is recorded to the circuit breaker of the backend
+        :param backend: backend which publishes messages
+        :param messages: list of messages
+        """
+        backend.wait_for_rate_limit(messages)
+        try:
+            with backend.limit_concurrency():
+                backend.publish_messages(messages)
+        except Exception:
+            if backend.circuit_breaker:
+                backend.circuit_breaker.record(is_success=False)
+            raise
+        if backend.circuit_breaker:
+            backend.circuit_breaker.record(is_success=not all(message.failed for message in messages))
+
     @transaction.atomic
     def send(self, recipient, content, related_objects=None, tag=None, template=None, send_immediately=False,
              message_backend=None, **kwargs):
         """
-        Send message with the text content to the phone number (recipient)
+        Send message with the text content to the phone number (recipient). If PYMESS_PUBLISH_ON_COMMIT is True,
+        the message is published after the transaction is committed
         :param recipient: email or phone number of the recipient
         :param content: text content of the message
         :param related_objects: list of related objects that will be linked with the message using generic
@@ -74,8 +325,34 @@ class BaseController:
         backend = message_backend or self.get_backend(recipient, **kwargs)
         message = self.create_message(recipient=recipient, content=content, related_objects=related_objects, tag=tag,
                                       template=template, **kwargs)
-        if send_immediately or not self.is_turned_on_batch_sending():
-            backend.publish_message(message)
+        if (send_immediately or not self.is_turned_on_batch_sending()) and not message.is_scheduled:
+            if settings.PUBLISH_ON_COMMIT:
+                self.publish_on_commit(backend.publish_messages, [message])
+            else:
+                backend.publish_message(message)
+        return message
+
+    async def asend(self, recipient, content, related_objects=None, tag=None, template=None, send_immediately=False,
+                    message_backend=None, **kwargs):
+        """
+        Asynchronous version of the send method. Message is created in the database before it is published because
+        the transaction cannot be held during asynchronous publishing.
+        :param recipient: email or phone number of the recipient
+        :param content: text content of the message
+        :param related_objects: list of related objects that will be linked with the message using generic
+        relation
+        :param tag: string mark that will be saved with the message
+        :param template: template object from which content of the message was create
+        :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+        :param message_backend: message backend instance
+        :param kwargs: extra attributes that will be stored to the message
+        """
+        backend = message_backend or self.get_backend(recipient, **kwargs)
+        message = await sync_to_async(self.create_message)(
+            recipient=recipient, content=content, related_objects=related_objects, tag=tag, template=template, **kwargs
+        )
+        if (send_immediately or not self.is_turned_on_batch_sending()) and not message.is_scheduled:
+            await backend.apublish_message(message)
         return message
 
     def get_batch_max_seconds_to_send(self):
@@ -90,31 +367,112 @@ class BaseController:
         """
         raise NotImplementedError
 
-    def create_message(self, recipient, content, related_objects, tag, template,
-                       priority=settings.DEFAULT_MESSAGE_PRIORITY, **kwargs):
+    def build_message(self, recipient, content, tag, template, priority=settings.DEFAULT_MESSAGE_PRIORITY,
+                      send_at=None, expires_at=None, **kwargs):
         """
-        Create message which will be logged in the database.
+        Build message instance which is not saved to the database.
         :param recipient: email or phone number of the recipient
         :param content: content of the message
-        :param related_objects: list of related objects that will be linked with the message using generic
-        relation
         :param tag: string mark that will be saved with the message
         :param template: template object from which content of the message was created
         :param priority: priority of sending message 1 (highest) to 3 (lowest)
+        :param send_at: time after which the message is sent by the batch sender, the message is sent as soon
+            as possible if it is not set
+        :param expires_at: time after which the message is not sent and it is set as failed
         :param kwargs: extra attributes that will be saved with the message
         """
-        message = self.model.objects.create(
+        if send_at is not None and not self.is_turned_on_batch_sending():
+            self._raise_sending_error(ValueError(gettext('scheduled messages can be sent only in a batch')))
+        return self.model.objects.build(
             recipient=recipient,
             content=content,
             tag=tag,
             template=template,
             template_slug=template.slug if template else None,
             priority=priority,
+            send_at=send_at,
+            expires_at=expires_at,
             **kwargs
         )
-        if related_objects:
-            message.related_objects.create_from_related_objects(*related_objects)
-        return message
+
+    def _raise_sending_error(self, ex):
+        if self.sending_error_class:
+            raise self.sending_error_class(str(ex))
+        else:
+            raise ex
+
+    def create_message(self, recipient, content, related_objects, tag, template, **kwargs):
+        """
+        Create message which will be logged in the database.
+        :param recipient: email or phone number of the recipient
+        :param content: content of the message
+        :param related_objects: list of related objects that will be linked with the message using generic
+        relation
+        :param tag: string mark that will be saved with the message
+        :param template: template object from which content of the message was created
+        :param kwargs: extra attributes that will be passed to the build_message method
+        """
+        try:
+            message = self.build_message(recipient=recipient, content=content, tag=tag, template=template, **kwargs)
+            message.save()
+            if related_objects:
+                message.related_objects.create_from_related_objects(*related_objects)
+            return message
+        except PersistenceException as ex:
+            self._raise_sending_error(ex)
+
+    def _build_related_objects(self, message, related_objects):
+        related_object_field = self.model._meta.get_field('related_objects').field
+        return [
+            related_object_field.model(**{
+                related_object_field.name: message,
+                'object_id': related_object.pk,
+                'content_type': ContentType.objects.get_for_model(related_object),
+            })
+            for related_object in related_objects
+        ]
+
+    @transaction.atomic
+    def bulk_create_messages(self, messages_kwargs):
+        """
+        Create more messages with bulk insert queries. Messages are validated the same way as messages created with
+        the create_message method, but model save methods and signals are not called. Messages are inserted in chunks
+        with size defined by PYMESS_BULK_CREATE_BATCH_SIZE.
+        :param messages_kwargs: iterable of dicts with create_message arguments
+        :return: list of created messages
+        """
+        messages = []
+        for messages_kwargs_chunk in chunked(messages_kwargs, settings.BULK_CREATE_BATCH_SIZE):
+            messages_chunk = []
+            related_objects_chunk = []
+            for message_kwargs in messages_kwargs_chunk:
+                message_kwargs = dict(message_kwargs)
+                related_objects = message_kwargs.pop('related_objects', None)
+                try:
+                    message = self.build_message(**message_kwargs)
+                    message._clean_pre_save()
+                except PersistenceException as ex:
+                    self._raise_sending_error(ex)
+                messages_chunk.append(message)
+                if related_objects:
+                    related_objects_chunk.append((message, related_objects))
+
+            self.model.objects.bulk_create(messages_chunk)
+            for message in messages_chunk:
+                # the same state as after SmartModel save
+                message.is_adding = False
+                message.is_changing = True
+                message._changed_fields.from_db()
+
+            if related_objects_chunk:
+                related_object_model = self.model._meta.get_field('related_objects').related_model
+                related_object_model.objects.bulk_create([
+                    related_object
+                    for message, related_objects in related_objects_chunk
+                    for related_object in self._build_related_objects(message, related_objects)
+                ])
+            messages += messages_chunk
+        return messages
 
     def _get_backend_messages_map(self, messages):
         backends_messages_map = defaultdict(list)
@@ -123,18 +481,65 @@ class BaseController:
             backends_messages_map[backend].append(message)
         return backends_messages_map
 
+    def publish_on_commit(self, publish_function, messages):
+        """
+        Call the publish function with messages after the current transaction is committed, nothing is published if
+        the transaction is rolled back. The function is called in a background thread if
+        PYMESS_PUBLISH_ON_COMMIT_WORKERS is greater than 0, errors are logged. If batch sending is turned on, messages
+        are leased until they are published therefore the batch sender does not send them too. Messages which were
+        not published because of an error are sent by the batch sender after the lease expires.
+        :param publish_function: function which publishes list of messages
+        :param messages: list of messages
+        """
+        if self.is_turned_on_batch_sending():
+            publish_function = partial(
+                self._publish_leased_messages, publish_function, self.lease_messages(messages)
+            )
+
+        if settings.PUBLISH_ON_COMMIT_WORKERS:
+            transaction.on_commit(
+                lambda: get_publish_executor().submit(_publish_in_thread, publish_function, messages)
+            )
+        else:
+            transaction.on_commit(partial(_publish_after_commit, publish_function, messages))
+
+    def _publish_leased_messages(self, publish_function, lease_expires_at, messages):
+        """
+        Publish messages leased before the commit. Lease is renewed first, messages whose lease expired and which
+        were claimed by the batch sender in the meantime are skipped.
+        """
+        with transaction.atomic():
+            leased_message_pks = set(
+                self.model.objects.select_for_update().filter(
+                    pk__in=[message.pk for message in messages], lease_expires_at=lease_expires_at
+                ).values_list('pk', flat=True)
+            )
+            messages = [message for message in messages if message.pk in leased_message_pks]
+            self.lease_messages(messages)
+        if messages:
+            publish_function(messages)
+            self.release_messages(messages)
+
     def bulk_send_messages(self, messages):
         """
         Sends more messages together. If concrete backend provides send more messages at once the method
-        can be overridden
+        can be overridden. Scheduled messages are skipped, they are sent by the batch sender.
         :param messages: list of messages
         """
+        messages = [message for message in messages if not message.is_scheduled]
+        if settings.PUBLISH_ON_COMMIT:
+            self.publish_on_commit(self._bulk_publish_messages, messages)
+        else:
+            self._bulk_publish_messages(messages)
+
+    def _bulk_publish_messages(self, messages):
         for backend, messages_for_backend in self._get_backend_messages_map(messages).items():
-            backend.publish_messages(messages_for_backend)
+            for chunk in chunked(messages_for_backend, backend.get_publish_messages_chunk_size()):
+                backend.publish_messages(chunk)
 
     def bulk_send(self, recipients, content, related_objects=None, tag=None, template=None, **kwargs):
         """
-        Send more messages in one bulk
+        Send more messages in one bulk, messages are created with bulk insert queries
         :param recipients: list of emails or phone numbers of recipients
         :param content: text content of the messages
         :param related_objects: list of related objects that will be linked with the message using generic
@@ -143,11 +548,17 @@ class BaseController:
         :param template: template object from which content of the message was create
         :param kwargs: extra attributes that will be stored with messages
         """
-        with transaction.atomic():
-            messages = [
-                self.create_message(recipient, content, related_objects, tag, template, **kwargs)
-                for recipient in recipients
-            ]
+        messages = self.bulk_create_messages(
+            dict(
+                recipient=recipient,
+                content=content,
+                related_objects=related_objects,
+                tag=tag,
+                template=template,
+                **kwargs
+            )
+            for recipient in recipients
+        )
         self.bulk_send_messages(messages)
         return messages
 
@@ -155,9 +566,52 @@ class BaseController:
 class BaseBackend:
 
     config = {}
+    rate_limiter = None
+    circuit_breaker = None
 
     def __init__(self, config=None):
         self.config = {**self.config, **(config or {})}
+        max_concurrency = self.config.get('MAX_CONCURRENCY')
+        self._concurrency_semaphore = BoundedSemaphore(max_concurrency) if max_concurrency else None
+
+    def limit_concurrency(self):
+        """
+        Returns context manager which limits number of threads publishing messages with the backend at once.
+        The limit is defined with MAX_CONCURRENCY config option.
+        """
+        return self._concurrency_semaphore or nullcontext()
+
+    def set_rate_limit(self, key, rate_limit):
+        """
+        Turn on rate limiting of the backend, the rate is shared between all processes with the same key.
+        :param key: key of the backend
+        :param rate_limit: dict with keys messages_per_second, requests_per_second, messages_burst and requests_burst
+        """
+        self.rate_limiter = RateLimiter(key, **rate_limit)
+
+    def set_circuit_breaker(self, circuit_breaker):
+        """
+        Turn on circuit breaker of the backend instance.
+        :param circuit_breaker: dict with keys failure_rate_threshold, minimum_number_of_calls, window_seconds,
+            open_seconds and half_open_max_calls
+        """
+        self.circuit_breaker = CircuitBreaker(**circuit_breaker)
+
+    def wait_for_rate_limit(self, messages):
+        """
+        Wait until the rate limit of the backend allows to publish messages with one publish_messages call.
+        :param messages: list of messages
+        """
+        if self.rate_limiter:
+            self.rate_limiter.acquire(len(messages), self.get_number_of_publish_requests(messages))
+
+    def get_number_of_publish_requests(self, messages):
+        """
+        Return number of requests sent to the provider by publish_messages call. Backends which send more messages
+        with one request should override it.
+        :param messages: list of messages
+        """
+        return len(messages)
 
     def _get_extra_sender_data(self):
         """
@@ -171,6 +625,16 @@ class BaseBackend:
         """
         return {}
 
+    def _get_message_changes(self, extra_sender_data=None, **kwargs):
+        return dict(
+            backend=fullname(self),
+            extra_sender_data={
+                **self._get_extra_sender_data(),
+                **({} if extra_sender_data is None else extra_sender_data)
+            },
+            **kwargs
+        )
+
     def _update_message(self, message, extra_sender_data=None, **kwargs):
         """
         Method for updating state of the message
@@ -178,13 +642,38 @@ class BaseBackend:
         :param extra_sender_data: extra data that will be saved to the extra_sender_data field
         :param kwargs: changed object kwargs
         """
-        extra_sender_data = {
-            **self._get_extra_sender_data(),
-            **({} if extra_sender_data is None else extra_sender_data)
-        }
-        message.change_and_save(
-            backend=fullname(self),
+        message.change_and_save(**self._get_message_changes(extra_sender_data, **kwargs))
+
+    def _bulk_update_messages(self, messages_changes):
+        """
+        Method for updating more messages with bulk update queries. Changes are applied the same way as with
+        the _update_message method, but messages are not cleaned and model save methods and signals are not called.
+        Messages are updated in chunks with size defined by PYMESS_BULK_CREATE_BATCH_SIZE.
+        :param messages_changes: list of pairs (message, dict of changed object kwargs), the dict can contain
+            extra_sender_data key
+        """
+        if not messages_changes:
+            return
+
+        changed_at = now()
+        changed_fields = {'changed_at'}
+        for message, changes in messages_changes:
+            for field_name, value in self._get_message_changes(**changes).items():
+                setattr(message, field_name, value)
+                changed_fields.add(field_name)
+            message.changed_at = changed_at
+
+        messages = [message for message, _ in messages_changes]
+        messages[0].__class__.objects.bulk_update(
+            messages, changed_fields, batch_size=settings.BULK_CREATE_BATCH_SIZE
+        )
+        for message in messages:
+            message._changed_fields.from_db()
+
+    def _get_message_changes_after_sending(self, message, extra_sender_data=None, **kwargs):
+        return dict(
             extra_sender_data=extra_sender_data,
+            number_of_send_attempts=message.number_of_send_attempts + 1,
             **kwargs
         )
 
@@ -195,22 +684,27 @@ class BaseBackend:
         :param extra_sender_data: extra data that will be saved to the extra_sender_data field
         :param kwargs: changed object kwargs
         """
-        self._update_message(
-            message,
-            extra_sender_data,
-            number_of_send_attempts=message.number_of_send_attempts + 1,
-            **kwargs
-        )
+        self._update_message(message, **self._get_message_changes_after_sending(message, extra_sender_data, **kwargs))
 
-    def _update_message_after_sending_error(self, message, extra_sender_data=None, state=None, **kwargs):
+    def get_retry_delay_seconds(self, number_of_send_attempts, retry_after=None):
         """
-        Method for updating state of the message after it was send with error result
-        :param message: message object
-        :param extra_sender_data: extra data that will be saved to the extra_sender_data field
-        :param state: error state of the message
-        :param kwargs: changed object kwargs
+        Return number of seconds after which the failed message is sent again. Delay grows exponentially with
+        the number of send attempts and a random jitter is applied to spread retries of more messages.
+        :param number_of_send_attempts: number of send attempts including the failed one
+        :param retry_after: minimal delay in seconds requested by the provider (Retry-After header)
         """
-
+        delay = min(
+            settings.RETRY_BACKOFF_BASE_SECONDS * 2 ** max(number_of_send_attempts - 1, 0),
+            settings.RETRY_BACKOFF_MAX_SECONDS
+        )
+        if settings.RETRY_BACKOFF_JITTER:
+            delay = random.uniform(delay / 2, delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _get_message_changes_after_sending_error(self, message, extra_sender_data=None, state=None,
+                                                 retry_after=None, **kwargs):
         number_of_send_attempts = message.number_of_send_attempts + 1
 
         if not state:
@@ -221,14 +715,33 @@ class BaseBackend:
                 ) else message.State.ERROR_RETRY
             )
 
-        self._update_message(
-            message,
-            extra_sender_data,
+        if state == message.State.ERROR_RETRY:
+            kwargs['next_attempt_at'] = now() + timedelta(
+                seconds=self.get_retry_delay_seconds(number_of_send_attempts, retry_after)
+            )
+
+        return dict(
+            extra_sender_data=extra_sender_data,
             state=state,
             number_of_send_attempts=number_of_send_attempts,
             **kwargs
         )
 
+    def _update_message_after_sending_error(self, message, extra_sender_data=None, state=None, retry_after=None,
+                                            **kwargs):
+        """
+        Method for updating state of the message after it was send with error result
+        :param message: message object
+        :param extra_sender_data: extra data that will be saved to the extra_sender_data field
+        :param state: error state of the message
+        :param retry_after: minimal delay of the next attempt in seconds requested by the provider
+        :param kwargs: changed object kwargs
+        """
+        self._update_message(
+            message,
+            **self._get_message_changes_after_sending_error(message, extra_sender_data, state, retry_after, **kwargs)
+        )
+
     def _set_message_as_failed(self, message, **kwargs):
         """
         Method for updating state of the message to the final error state
@@ -255,6 +768,61 @@ class BaseBackend:
         """
         return [self.publish_message(message) for message in sorted(messages, key=lambda m: m.priority)]
 
+    async def apublish_message(self, message):
+        """
+        Send the message asynchronously. Backends without asynchronous implementation publish the message
+        with the publish_message method called in a thread.
+        :param message: SMS message
+        """
+        await sync_to_async(self.publish_message)(message)
+
+    async def apublish_messages(self, messages):
+        """
+        Send bulk of messages asynchronously, messages are published concurrently with the apublish_message method
+        :param messages: list of SMS message
+        """
+        return await asyncio.gather(*(self.apublish_message(message) for message in messages))
+
+    def get_publish_messages_chunk_size(self):
+        """
+        Return maximal number of messages which are published with one publish_messages call. Backends which send
+        more messages with one request to the provider should override it.
+        """
+        return 1
+
+    def _get_message_content_key(self, message):
+        """
+        Return hashable key of the message content, messages with the same key can be sent with one request
+        :param message: message object
+        """
+        raise NotImplementedError
+
+    def _get_message_recipient_key(self, message):
+        """
+        Return key of the message recipient which is used to pair results of the provider with messages
+        :param message: message object
+        """
+        return message.recipient
+
+    def _group_messages_with_the_same_content(self, messages):
+        """
+        Group messages with the same content key, every recipient key is only once in the group therefore results
+        of the provider can be paired with messages by recipient.
+        :param messages: list of messages
+        :return: list of groups (lists) of messages
+        """
+        groups = defaultdict(list)
+        groups_recipients = defaultdict(set)
+        for message in messages:
+            content_key = self._get_message_content_key(message)
+            recipient_key = self._get_message_recipient_key(message)
+            group_index = 0
+            while recipient_key in groups_recipients[content_key, group_index]:
+                group_index += 1
+            groups[content_key, group_index].append(message)
+            groups_recipients[content_key, group_index].add(recipient_key)
+        return list(groups.values())
+
     def get_batch_max_number_of_send_attempts(self):
         """
         Return number attempts to send message
@@ -285,11 +853,55 @@ def send_template(recipient, slug, context_data, locale=None, related_objects=No
     assert template_model is not None, _l('template_model cannot be None')
 
     variant = kwargs.pop('variant', None)
-    query_params = {'slug': slug, 'locale': locale}
-    if variant is not None:
-        query_params['variant'] = variant
+    return template_registry.get(template_model, slug=slug, locale=locale, variant=variant).send(
+        recipient,
+        context_data,
+        related_objects=related_objects,
+        tag=tag,
+        **kwargs
+    )
+
+
+def send_template_bulk(slug, recipients_data, locale=None, tag=None, template_model=None, **kwargs):
+    """
+    Helper for building and sending messages from a template to more recipients in one bulk.
+    :param slug: slug of a template
+    :param recipients_data: iterable of tuples (recipient, context_data, related_objects)
+    :param tag: string mark that will be saved with messages
+    :param template_model: template model instance
+    :param kwargs: extra attributes that will be stored with messages
+    :return: list of created messages
+    """
+
+    assert template_model is not None, _l('template_model cannot be None')
+
+    variant = kwargs.pop('variant', None)
+    return template_registry.get(template_model, slug=slug, locale=locale, variant=variant).send_bulk(
+        recipients_data,
+        tag=tag,
+        **kwargs
+    )
 
-    return template_model.objects.get(**query_params).send(
+
+async def asend_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None,
+                         template_model=None, **kwargs):
+    """
+    Asynchronous version of the send_template helper.
+    :param recipient: email or phone number of the recipient
+    :param slug: slug of a template
+    :param context_data: dict of data that will be sent to the template renderer
+    :param related_objects: list of related objects that will be linked with the message using generic relation
+    :param tag: string mark that will be saved with the message
+    :param template_model: template model instance
+    :param kwargs: extra attributes that will be stored with message
+    :return: message object or None if template cannot be sent
+    """
+
+    assert template_model is not None, _l('template_model cannot be None')
+
+    variant = kwargs.pop('variant', None)
+    template = await sync_to_async(template_registry.get)(template_model, slug=slug, locale=locale, variant=variant)
+    return await template.asend(
         recipient,
         context_data,
         related_objects=related_objects,
@@ -316,3 +928,24 @@ def send(recipient, content, related_objects=None, tag=None, message_controller=
         tag=tag,
         **kwargs
     ).failed
+
+
+async def asend(recipient, content, related_objects=None, tag=None, message_controller=None, **kwargs):
+    """
+    Asynchronous version of the send helper.
+    :param recipient: email or phone number of the recipient
+    :param content: text content of the messages
+    :param related_objects:
+    :param tag: string mark that will be saved with the message
+    :param kwargs: extra attributes that will be stored with messages
+    :param message_controller: controller sender instance
+    :return: True if message was successfully sent or False if message is in error state
+    """
+    message = await message_controller.asend(
+        recipient,
+        content,
+        related_objects=related_objects,
+        tag=tag,
+        **kwargs
+    )
+    return message.failed
@@ -1,12 +1,14 @@
 import logging
 from datetime import timedelta
 
-from chamber.exceptions import PersistenceException
 from django.utils.timezone import now
 
 from pymess.backend import BaseBackend, BaseController
+from pymess.backend import asend as _asend
+from pymess.backend import asend_template as _asend_template
 from pymess.backend import send as _send
 from pymess.backend import send_template as _send_template
+from pymess.backend import send_template_bulk as _send_template_bulk
 from pymess.config import (
     ControllerType, get_dialer_template_model, get_supported_backend_paths, is_turned_on_dialer_batch_sending,
     settings
@@ -26,6 +28,8 @@ class DialerController(BaseController):
     class DialerSendingError(Exception):
         pass
 
+    sending_error_class = DialerSendingError
+
     def get_batch_size(self):
         return settings.DIALER_BATCH_SIZE
 
@@ -39,35 +43,43 @@ class DialerController(BaseController):
         """
         return self.model.State.WAITING
 
-    def create_message(self, recipient, content=None, related_objects=None, tag=None, template=None, is_autodialer=True,
-                       priority=settings.DEFAULT_MESSAGE_PRIORITY, **kwargs):
+    def create_message(self, recipient, content=None, related_objects=None, tag=None, template=None, **kwargs):
+        return super().create_message(
+            recipient=recipient,
+            content=content,
+            related_objects=related_objects,
+            tag=tag,
+            template=template,
+            **kwargs
+        )
+
+    def build_message(self, recipient, content=None, tag=None, template=None, is_autodialer=True,
+                      priority=settings.DEFAULT_MESSAGE_PRIORITY, send_at=None, expires_at=None, **kwargs):
         """
-        Create dialer message which will be logged in the database (content is not needed for this).
+        Build dialer message which will be logged in the database (content is not needed for this).
         :param recipient: phone number of the recipient
-        :param related_objects: list of related objects that will be linked with the dialer message using generic
-        relation
         :param tag: string mark that will be saved with the message
         :param template: template object from which content of the message was created
         :param is_autodialer: True if it's a autodialer call otherwise False
         :param priority: priority of sending message 1 (highest) to 3 (lowest)
+        :param send_at: time after which the message is sent by the batch sender
+        :param expires_at: time after which the message is not sent
         :param kwargs: extra attributes that will be saved with the message
         """
         extra_data = kwargs.pop('extra_data', {})
-        try:
-            return super().create_message(
-                recipient=recipient,
-                content=content,
-                related_objects=related_objects,
-                tag=tag,
-                template=template,
-                state=self.get_initial_dialer_state(recipient),
-                is_autodialer=is_autodialer,
-                priority=priority,
-                extra_data=kwargs,
-                **self.get_backend(recipient).get_extra_message_kwargs(),
-            )
-        except PersistenceException as ex:
-            raise self.DialerSendingError(str(ex))
+        return super().build_message(
+            recipient=recipient,
+            content=content,
+            tag=tag,
+            template=template,
+            state=self.get_initial_dialer_state(recipient),
+            is_autodialer=is_autodialer,
+            priority=priority,
+            send_at=send_at,
+            expires_at=expires_at,
+            extra_data=kwargs,
+            **self.get_backend(recipient).get_extra_message_kwargs(),
+        )
 
     def bulk_check_dialer_status(self):
         """
@@ -107,7 +119,8 @@ class DialerBackend(BaseBackend):
         raise NotImplementedError('Check dialer state is not supported with the backend')
 
 
-def send_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None, send_immediately=False):
+def send_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None, send_immediately=False,
+                  send_at=None, expires_at=None):
     """
     Helper for building and sending dialer message from a template.
     :param recipient: phone number of the recipient
@@ -117,6 +130,8 @@ def send_template(recipient, slug, context_data, locale=None, related_objects=No
         relation
     :param tag: string mark that will be saved with the message
     :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
     :return: dialer message object or None if template cannot be sent
     """
     return _send_template(
@@ -127,7 +142,33 @@ def send_template(recipient, slug, context_data, locale=None, related_objects=No
         related_objects=related_objects,
         tag=tag,
         template_model=get_dialer_template_model(),
-        send_immediately=send_immediately
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
+    )
+
+
+def send_template_bulk(slug, recipients_data, locale=None, tag=None, send_immediately=False, send_at=None,
+                       expires_at=None):
+    """
+    Helper for building and sending dialer messages from a template to more recipients in one bulk.
+    :param slug: slug of a dialer template
+    :param recipients_data: iterable of tuples (recipient, context_data, related_objects)
+    :param tag: string mark that will be saved with messages
+    :param send_immediately: publishes messages regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
+    :return: list of dialer message objects
+    """
+    return _send_template_bulk(
+        slug=slug,
+        recipients_data=recipients_data,
+        locale=locale,
+        tag=tag,
+        template_model=get_dialer_template_model(),
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
     )
 
 
@@ -151,3 +192,54 @@ def send(recipient, content, related_objects=None, tag=None, send_immediately=Fa
         send_immediately=send_immediately,
         **kwargs
     )
+
+
+async def asend_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None,
+                         send_immediately=False, send_at=None, expires_at=None):
+    """
+    Asynchronous version of the send_template helper.
+    :param recipient: phone number of the recipient
+    :param slug: slug of a dialer message template
+    :param context_data: dict of data that will be sent to the template renderer
+    :param related_objects: list of related objects that will be linked with the dialer message using generic
+        relation
+    :param tag: string mark that will be saved with the message
+    :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
+    :return: dialer message object or None if template cannot be sent
+    """
+    return await _asend_template(
+        recipient=recipient,
+        slug=slug,
+        context_data=context_data,
+        locale=locale,
+        related_objects=related_objects,
+        tag=tag,
+        template_model=get_dialer_template_model(),
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
+    )
+
+
+async def asend(recipient, content, related_objects=None, tag=None, send_immediately=False, **kwargs):
+    """
+    Asynchronous version of the send helper.
+    :param recipient: phone number of the recipient
+    :param content: text content of the messages
+    :param related_objects:
+    :param tag: string mark that will be saved with the message
+    :param kwargs: extra attributes that will be stored with messages
+    :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :return: True if dialer was successfully sent or False if message is in error state
+    """
+    return await _asend(
+        recipient=recipient,
+        content=content,
+        related_objects=related_objects,
+        tag=tag,
+        message_controller=DialerController(),
+        send_immediately=send_immediately,
+        **kwargs
+    )
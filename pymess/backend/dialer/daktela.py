@@ -1,15 +1,23 @@
 import re
 
+from concurrent.futures import ThreadPoolExecutor
+from threading import current_thread, main_thread
+
+from asgiref.sync import sync_to_async
+
+from django.db import close_old_connections
 from django.utils import timezone as tz
 from django.utils.translation import gettext as _
 
 from pymess.backend.dialer import DialerBackend
 from pymess.config import settings
 from pymess.enums import DialerMessageState
-from pymess.utils.logged_requests import generate_session
+from pymess.utils.logged_requests import (
+    RETRYABLE_STATUS_CODES, PooledSessionBackendMixin, generate_session, get_retry_after_seconds
+)
 
 
-class DaktelaDialerBackend(DialerBackend):
+class DaktelaDialerBackend(PooledSessionBackendMixin, DialerBackend):
     """
     Dialer backend implementing Daktela service https://www.daktela.com/api/v6/models/campaignsrecords
     """
@@ -30,6 +38,10 @@ class DaktelaDialerBackend(DialerBackend):
             '6': 6,
         },
         'TIMEOUT': 5,  # 5s
+        'POOL_SIZE': 10,  # Maximal number of kept-alive connections
+        'MAX_RETRIES': 0,  # Number of retries of failed connections
+        'RETRY_BACKOFF_FACTOR': 0,
+        'STATUS_CHECK_WORKERS': 10,  # Maximal number of concurrent status requests (should not exceed POOL_SIZE)
     }
 
     def _get_dialer_api_url(self, name=None):
@@ -39,51 +51,75 @@ class DaktelaDialerBackend(DialerBackend):
             base_url=self.config['URL'], name=name, access_token=self.config['ACCESS_TOKEN'],
         )
 
-    def _update_dialer_states(self, messages):
+    def _get_dialer_state_response(self, message):
         """
-        Method uses Daktela API to get info about autodialer call status
-        :param messages: list of dialer messages to update
+        Get Daktela record of the dialer message, method can be called from a worker thread. All status requests
+        share one pool of keep-alive connections.
+        :param message: dialer message
+        :return: response or exception raised by the request
         """
-        for message in messages:
-            name = message.extra_data['name']
-            client_url = self._get_dialer_api_url(name)
-            response = generate_session(
+        try:
+            return generate_session(
                 slug=self.SESSION_SLUG,
                 related_objects=(message,),
-                timeout=self.config['TIMEOUT']
-            ).get(client_url)
-            resp_json = response.json()
-            if response.status_code != 200 and resp_json.get('error'):
-                self._update_message_state_with_error(message, error_message=resp_json.get('error'))
-                continue
-
-            message.extra_data.update({
-                'name': name,
-                'daktela_action': resp_json['result']['action'],
-                'daktela_statuses': resp_json['result']['statuses'],
-            })
-            resp_message_state = resp_json['result']['statuses'][0]['name'] if len(
-                resp_json['result']['statuses']) else resp_json['result']['action']
-            state_mapped = self.config['STATES_MAPPING'][resp_message_state]
-            message_error = resp_json['error'] if len(resp_json['error']) else None
+                timeout=self.config['TIMEOUT'],
+                adapter=self.http_adapter,
+            ).get(self._get_dialer_api_url(message.extra_data['name']))
+        except Exception as ex:
+            return ex
+        finally:
+            if current_thread() is not main_thread():
+                close_old_connections()
+
+    def _get_dialer_state_responses(self, messages):
+        workers = min(self.config['STATUS_CHECK_WORKERS'], len(messages))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(self._get_dialer_state_response, messages))
+        else:
+            return [self._get_dialer_state_response(message) for message in messages]
+
+    def _get_message_changes_from_state_response(self, message, response):
+        resp_json = response.json()
+        if response.status_code != 200 and resp_json.get('error'):
+            return self._get_message_changes_with_state_error(message, error_message=resp_json.get('error'))
+
+        message.extra_data.update({
+            'daktela_action': resp_json['result']['action'],
+            'daktela_statuses': resp_json['result']['statuses'],
+        })
+        resp_message_state = resp_json['result']['statuses'][0]['name'] if len(
+            resp_json['result']['statuses']) else resp_json['result']['action']
+
+        return dict(
+            state=self.config['STATES_MAPPING'][resp_message_state],
+            error=resp_json['error'] if len(resp_json['error']) else None,
+            extra_data=message.extra_data,
+            is_final_state=resp_json['result']['action'] == '5',
+        )
 
-            is_final_state = resp_json['result']['action'] == '5'
+    def _update_dialer_states(self, messages):
+        """
+        Method uses Daktela API to get info about autodialer call status. Records are requested concurrently
+        by at most STATUS_CHECK_WORKERS threads, states are saved with bulk update queries.
+        :param messages: list of dialer messages to update
+        """
+        messages = list(messages)
+        messages_changes = []
+        for message, response in zip(messages, self._get_dialer_state_responses(messages)):
+            if isinstance(response, Exception):
+                messages_changes.append((message, self._get_message_changes_with_state_error(message, response)))
+                continue
 
             try:
-                self._update_message(
-                    message,
-                    state=state_mapped,
-                    error=message_error,
-                    extra_data=message.extra_data,
-                    is_final_state=is_final_state,
-                )
+                messages_changes.append((message, self._get_message_changes_from_state_response(message, response)))
             except Exception as ex:
-                self._update_message_state_with_error(message, error_message=ex)
+                messages_changes.append((message, self._get_message_changes_with_state_error(message, ex)))
                 # Do not re-raise caught exception. We do not know exact exception to catch so we catch them all
-                # and log them into database. Re-raise exception causes transaction rollback (lost of information about
-                # exception).
+                # and log them into database.
+        self._bulk_update_messages(messages_changes)
 
-    def _update_message_state_with_error(self, message, error_message):
+    def _get_message_changes_with_state_error(self, message, error_message):
         is_final_state = message.number_of_status_check_attempts >= settings.DIALER_NUMBER_OF_STATUS_CHECK_ATTEMPTS
         message_kwargs = {
             'state': DialerMessageState.ERROR_UPDATE,
@@ -92,10 +128,56 @@ class DaktelaDialerBackend(DialerBackend):
         }
         if not is_final_state:
             message_kwargs['number_of_status_check_attempts'] = message.number_of_status_check_attempts + 1
-        self._update_message(
-            message,
-            **message_kwargs
-        )
+        return message_kwargs
+
+    def _update_message_state_with_error(self, message, error_message):
+        self._update_message(message, **self._get_message_changes_with_state_error(message, error_message))
+
+    def _get_publish_payload(self, message):
+        payload = {
+            'record_type': (
+                self.config['AUTODIALER_RECORD_TYPE'] if message.is_autodialer
+                else self.config['PREDICTIVE_RECORD_TYPE']
+            ),
+            'number': re.sub(r'^\+', '00', message.recipient),
+            'customFields': {'autodialer_text': [message.content]},
+        }
+        custom_fields = message.extra_data.get('custom_fields')
+        if custom_fields:
+            payload['customFields'].update(**custom_fields)
+        return payload
+
+    def _update_message_from_publish_response(self, message, response):
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            # Service is temporarily unavailable, sending will be retried
+            self._update_message_after_sending_error(
+                message,
+                error=_('Daktela returned invalid response status code: {}').format(response.status_code),
+                retry_after=get_retry_after_seconds(response),
+            )
+            return
+
+        resp_json = response.json()
+        message.extra_data.update({
+            'name': resp_json['result']['name'],
+            'daktela_action': resp_json['result']['action'],
+            'daktela_statuses': resp_json['result']['statuses'],
+        })
+
+        error_message = resp_json.get('error')
+        if error_message:
+            self._update_message_after_sending_error(
+                message,
+                error=', '.join(error_message) if isinstance(error_message, list) else str(error_message),
+                state=DialerMessageState.ERROR
+            )
+        else:
+            self._update_message_after_sending(
+                message,
+                state=DialerMessageState.READY,
+                sent_at=tz.now(),
+                extra_data=message.extra_data,
+            )
 
     def publish_message(self, message):
         """
@@ -104,48 +186,16 @@ class DaktelaDialerBackend(DialerBackend):
         """
         client_url = self._get_dialer_api_url()
         try:
-            payload = {
-                'record_type': (
-                    self.config['AUTODIALER_RECORD_TYPE'] if message.is_autodialer
-                    else self.config['PREDICTIVE_RECORD_TYPE']
-                ),
-                'number': re.sub(r'^\+', '00', message.recipient),
-                'customFields': {'autodialer_text': [message.content]},
-            }
-            custom_fields = message.extra_data.get('custom_fields')
-            if custom_fields:
-                payload['customFields'].update(**custom_fields)
-
             response = generate_session(
                 slug=self.SESSION_SLUG,
                 related_objects=(message,),
-                timeout=self.config['TIMEOUT']
+                timeout=self.config['TIMEOUT'],
+                adapter=self.http_adapter,
             ).post(
                 client_url,
-                json=payload,
+                json=self._get_publish_payload(message),
             )
-            resp_json = response.json()
-
-            message.extra_data.update({
-                'name': resp_json['result']['name'],
-                'daktela_action': resp_json['result']['action'],
-                'daktela_statuses': resp_json['result']['statuses'],
-            })
-
-            error_message = resp_json.get('error')
-            if error_message:
-                self._update_message_after_sending_error(
-                    message,
-                    error=', '.join(error_message) if isinstance(error_message, list) else str(error_message),
-                    state=DialerMessageState.ERROR
-                )
-            else:
-                self._update_message_after_sending(
-                    message,
-                    state=DialerMessageState.READY,
-                    sent_at=tz.now(),
-                    extra_data=message.extra_data,
-                )
+            self._update_message_from_publish_response(message, response)
         except Exception as ex:
             self._update_message_after_sending_error(
                 message,
@@ -154,3 +204,21 @@ class DaktelaDialerBackend(DialerBackend):
             # Do not re-raise caught exception. We do not know exact exception to catch so we catch them all
             # and log them into database. Re-raise exception causes transaction rollback (lost of information about
             # exception).
+
+    async def apublish_message(self, message):
+        """
+        Method uses Daktela API for sending dialer message asynchronously
+        :param message: dialer message
+        """
+        client_url = self._get_dialer_api_url()
+        try:
+            response = await self.get_async_http_client().post(
+                client_url,
+                json=self._get_publish_payload(message),
+            )
+            await sync_to_async(self._update_message_from_publish_response)(message, response)
+        except Exception as ex:
+            await sync_to_async(self._update_message_after_sending_error)(
+                message,
+                error=str(ex)
+            )
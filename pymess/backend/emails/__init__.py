@@ -1,6 +1,9 @@
-from chamber.exceptions import PersistenceException
+from django.db import transaction
 
-from pymess.backend import BaseBackend, send_template as _send_template, BaseController
+from pymess.backend import (
+    BaseBackend, send_template as _send_template, send_template_bulk as _send_template_bulk, BaseController,
+    asend_template as _asend_template
+)
 from pymess.config import (
     ControllerType, get_email_template_model, is_turned_on_email_batch_sending, settings,
 )
@@ -16,6 +19,8 @@ class EmailController(BaseController):
     class EmailSendingError(Exception):
         pass
 
+    sending_error_class = EmailSendingError
+
     def get_batch_size(self):
         return settings.EMAIL_BATCH_SIZE
 
@@ -47,27 +52,66 @@ class EmailController(BaseController):
         :param priority: priority of sending message 1 (highest) to 3 (lowest)
         :param kwargs: extra data that will be saved in JSON format in the extra_data model field
         """
-        try:
-            message = super().create_message(
-                recipient=recipient,
-                content=content,
-                related_objects=related_objects,
-                tag=tag,
-                template=template,
-                sender=sender,
-                sender_name=sender_name,
-                subject=subject,
-                pre_header=pre_header,
-                state=self.get_initial_email_state(recipient),
-                priority=priority,
-                extra_data=kwargs,
-                **self.get_backend(recipient).get_extra_message_kwargs()
-            )
+        message = super().create_message(
+            recipient=recipient,
+            content=content,
+            related_objects=related_objects,
+            tag=tag,
+            template=template,
+            sender=sender,
+            sender_name=sender_name,
+            subject=subject,
+            pre_header=pre_header,
+            priority=priority,
+            **kwargs
+        )
+        if attachments:
+            message.attachments.create_from_tripples(*attachments)
+        return message
+
+    def build_message(self, recipient, content, tag, template, sender, sender_name, subject, pre_header=None,
+                      priority=settings.DEFAULT_MESSAGE_PRIORITY, send_at=None, expires_at=None, **kwargs):
+        """
+        Build e-mail which will be logged in the database, content is stored to the file storage.
+        :param recipient: e-mail address of the receiver
+        :param content: content of the e-mail message
+        :param tag: string mark that will be saved with the message
+        :param template: template object from which content, subject and sender of the message was created
+        :param sender: e-mail address of the sender
+        :param sender_name: friendly name of the sender
+        :param subject: subject of the e-mail message
+        :param pre_header: pre header of the e-mail message
+        :param priority: priority of sending message 1 (highest) to 3 (lowest)
+        :param send_at: time after which the message is sent by the batch sender
+        :param expires_at: time after which the message is not sent
+        :param kwargs: extra data that will be saved in JSON format in the extra_data model field
+        """
+        return super().build_message(
+            recipient=recipient,
+            content=content,
+            tag=tag,
+            template=template,
+            sender=sender,
+            sender_name=sender_name,
+            subject=subject,
+            pre_header=pre_header,
+            state=self.get_initial_email_state(recipient),
+            priority=priority,
+            send_at=send_at,
+            expires_at=expires_at,
+            extra_data=kwargs,
+            **self.get_backend(recipient).get_extra_message_kwargs()
+        )
+
+    @transaction.atomic
+    def bulk_create_messages(self, messages_kwargs):
+        messages_kwargs = [dict(message_kwargs) for message_kwargs in messages_kwargs]
+        messages_attachments = [message_kwargs.pop('attachments', None) for message_kwargs in messages_kwargs]
+        messages = super().bulk_create_messages(messages_kwargs)
+        for message, attachments in zip(messages, messages_attachments):
             if attachments:
                 message.attachments.create_from_tripples(*attachments)
-            return message
-        except PersistenceException as ex:
-            raise self.EmailSendingError(str(ex))
+        return messages
 
     def is_turned_on_batch_sending(self):
         return is_turned_on_email_batch_sending()
@@ -94,7 +138,7 @@ class EmailBackend(BaseBackend):
 
 
 def send_template(recipient, slug, context_data, variant=None, locale=None, related_objects=None, attachments=None,
-                  tag=None, send_immediately=False):
+                  tag=None, send_immediately=False, send_at=None, expires_at=None):
     """
     Helper for building and sending e-mail message from a template.
     :param recipient: e-mail address of the receiver
@@ -105,6 +149,8 @@ def send_template(recipient, slug, context_data, variant=None, locale=None, rela
     :param attachments: list of files that will be sent with the message as attachments
     :param tag: string mark that will be saved with the message
     :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
     :return: e-mail message object or None if template cannot be sent
     """
     return _send_template(
@@ -117,7 +163,36 @@ def send_template(recipient, slug, context_data, variant=None, locale=None, rela
         tag=tag,
         template_model=get_email_template_model(),
         attachments=attachments,
-        send_immediately=send_immediately
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
+    )
+
+
+def send_template_bulk(slug, recipients_data, variant=None, locale=None, attachments=None, tag=None,
+                       send_immediately=False, send_at=None, expires_at=None):
+    """
+    Helper for building and sending e-mail messages from a template to more recipients in one bulk.
+    :param slug: slug of the e-mail template
+    :param recipients_data: iterable of tuples (recipient, context_data, related_objects)
+    :param attachments: list of files that will be sent with every message as attachments
+    :param tag: string mark that will be saved with messages
+    :param send_immediately: publishes messages regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
+    :return: list of e-mail message objects
+    """
+    return _send_template_bulk(
+        slug=slug,
+        recipients_data=recipients_data,
+        locale=locale,
+        variant=variant,
+        tag=tag,
+        template_model=get_email_template_model(),
+        attachments=attachments,
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
     )
 
 
@@ -154,3 +229,71 @@ def send(sender, recipient, subject, content, pre_header=None, sender_name=None,
         message_backend=message_backend,
         **kwargs
     ).failed
+
+
+async def asend_template(recipient, slug, context_data, variant=None, locale=None, related_objects=None,
+                         attachments=None, tag=None, send_immediately=False, send_at=None, expires_at=None):
+    """
+    Asynchronous version of the send_template helper.
+    :param recipient: e-mail address of the receiver
+    :param slug: slug of the e-mail template
+    :param context_data: dict of data that will be sent to the template renderer
+    :param related_objects: list of related objects that will be linked with the e-mail message with generic
+        relation
+    :param attachments: list of files that will be sent with the message as attachments
+    :param tag: string mark that will be saved with the message
+    :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
+    :return: e-mail message object or None if template cannot be sent
+    """
+    return await _asend_template(
+        recipient=recipient,
+        slug=slug,
+        context_data=context_data,
+        locale=locale,
+        variant=variant,
+        related_objects=related_objects,
+        tag=tag,
+        template_model=get_email_template_model(),
+        attachments=attachments,
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
+    )
+
+
+async def asend(sender, recipient, subject, content, pre_header=None, sender_name=None, related_objects=None,
+                attachments=None, tag=None, send_immediately=False, message_backend=None, **kwargs):
+    """
+    Asynchronous version of the send helper.
+    :param sender: e-mail address of the sender
+    :param recipient: e-mail address of the receiver
+    :param subject: subject of the e-mail message
+    :param content: content of the e-mail message
+    :param pre_header: pre header of the e-mail message
+    :param sender_name: friendly name of the sender
+    :param related_objects: list of related objects that will be linked with the e-mail message with generic
+        relation
+    :param tag: string mark that will be saved with the message
+    :param attachments: list of files that will be sent with the message as attachments
+    :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :param message_backend: message backend instance (if not specified controller will choose the backend)
+    :param kwargs: extra data that will be saved in JSON format in the extra_data model field
+    :return: True if e-mail was successfully sent or False if e-mail is in error state
+    """
+    message = await EmailController().asend(
+        sender=sender,
+        recipient=recipient,
+        subject=subject,
+        content=content,
+        pre_header=pre_header,
+        sender_name=sender_name,
+        related_objects=related_objects,
+        tag=tag,
+        attachments=attachments,
+        send_immediately=send_immediately,
+        message_backend=message_backend,
+        **kwargs
+    )
+    return message.failed
@@ -1,5 +1,8 @@
 import os
 import base64
+import hashlib
+
+from collections import defaultdict
 
 import requests
 
@@ -7,6 +10,9 @@ from json.decoder import JSONDecodeError
 
 from enum import Enum
 
+from asgiref.sync import sync_to_async
+
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import gettext
@@ -16,7 +22,7 @@ import mandrill
 from pymess.backend.emails import EmailBackend
 from pymess.enums import EmailMessageState
 from pymess.config import settings
-from pymess.utils.logged_requests import generate_session
+from pymess.utils.logged_requests import AsyncRequestException, PooledSessionBackendMixin, generate_session
 
 
 class MandrillState(str, Enum):
@@ -28,7 +34,7 @@ class MandrillState(str, Enum):
     INVALID = 'INVALID'
 
 
-class MandrillEmailBackend(EmailBackend):
+class MandrillEmailBackend(PooledSessionBackendMixin, EmailBackend):
     """
     E-mail backend implementing Mandrill service (https://mandrillapp.com/api/docs/index.python.html).
     """
@@ -51,66 +57,93 @@ class MandrillEmailBackend(EmailBackend):
         'PRESERVE_RECIPIENTS': False,
         'VIEW_CONTENT_LINK': True,
         'ASYNC': False,
+        'API_URL': 'https://mandrillapp.com/api/1.0/',  # Used only by asynchronous sending
         'TIMEOUT': 5,  # 5s
+        'POOL_SIZE': 10,  # Maximal number of kept-alive connections
+        'MAX_RETRIES': 0,  # Number of retries of failed connections
+        'RETRY_BACKOFF_FACTOR': 0,
+        'MAX_MESSAGES_PER_REQUEST': 1000,  # Maximal number of recipients of messages with the same content
     }
 
+    def _get_serialized_attachment(self, attachment):
+        """
+        Return pair of serialized attachment and digest of its content. The file is read only once, the result is
+        kept with the attachment instance (attachments are prefetched with messages published together).
+        """
+        if not hasattr(attachment, '_mandrill_serialized_attachment'):
+            with attachment.file.open('rb') as attachment_file:
+                content = attachment_file.read()
+            attachment._mandrill_serialized_attachment = (
+                {
+                    'type': attachment.content_type,
+                    'name': attachment.filename or os.path.basename(attachment.file.name),
+                    'content': base64.b64encode(content).decode('utf-8')
+                },
+                hashlib.sha256(content).hexdigest(),
+            )
+        return attachment._mandrill_serialized_attachment
+
     def _serialize_attachments(self, message):
         return [
-            {
-                'type': attachment.content_type,
-                'name': attachment.filename or os.path.basename(attachment.file.name),
-                'content': base64.b64encode(attachment.file.read()).decode('utf-8')
-            } for attachment in message.attachments.all()
+            self._get_serialized_attachment(attachment)[0] for attachment in message.attachments.all()
         ]
 
-    def _create_client(self, message):
+    def _create_client(self, *messages):
         mandrill_client = mandrill.Mandrill(self.config['KEY'])
         mandrill_client.session = generate_session(
             slug='pymess - Mandrill',
-            related_objects=(message,),
-            timeout=self.config['TIMEOUT']
+            related_objects=messages,
+            timeout=self.config['TIMEOUT'],
+            adapter=self.http_adapter,
         )
         return mandrill_client
 
+    def _serialize_message(self, message):
+        return {
+            'to': [{'email': message.recipient}],
+            'from_email': message.sender,
+            'from_name': message.sender_name,
+            'html': message.content,
+            'subject': message.subject,
+            'headers': self.config['HEADERS'],
+            'track_opens': self.config['TRACK_OPENS'],
+            'auto_text': self.config['AUTO_TEXT'],
+            'inline_css': self.config['INLINE_CSS'],
+            'url_strip_qs': self.config['URL_STRIP_QS'],
+            'preserve_recipients': self.config['PRESERVE_RECIPIENTS'],
+            'view_content_link': self.config['VIEW_CONTENT_LINK'],
+            'async': self.config['ASYNC'],
+            'attachments': self._serialize_attachments(message)
+        }
+
+    def _get_message_changes_from_result(self, message, result):
+        mandrill_state = MandrillState(result['status'].upper())
+        state = self.MANDRILL_STATES_MAPPING.get(mandrill_state)
+        error = None
+        if mandrill_state == MandrillState.INVALID:
+            error = gettext('invalid')
+        elif mandrill_state == MandrillState.REJECTED:
+            error = gettext('rejected, mandrill message: "{}"').format(result['reject_reason'])
+
+        extra_sender_data = message.extra_sender_data or {}
+        extra_sender_data['result'] = result
+        return self._get_message_changes_after_sending(
+            message,
+            state=state,
+            sent_at=timezone.now(),
+            extra_sender_data=extra_sender_data,
+            error=error,
+            external_id=result.get('_id')
+        )
+
+    def _update_message_from_result(self, message, result):
+        self._update_message(message, **self._get_message_changes_from_result(message, result))
+
     def publish_message(self, message):
         mandrill_client = self._create_client(message)
         try:
-            result = mandrill_client.messages.send(
-                message={
-                    'to': [{'email': message.recipient}],
-                    'from_email': message.sender,
-                    'from_name': message.sender_name,
-                    'html': message.content,
-                    'subject': message.subject,
-                    'headers': self.config['HEADERS'],
-                    'track_opens': self.config['TRACK_OPENS'],
-                    'auto_text': self.config['AUTO_TEXT'],
-                    'inline_css': self.config['INLINE_CSS'],
-                    'url_strip_qs': self.config['URL_STRIP_QS'],
-                    'preserve_recipients': self.config['PRESERVE_RECIPIENTS'],
-                    'view_content_link': self.config['VIEW_CONTENT_LINK'],
-                    'async': self.config['ASYNC'],
-                    'attachments': self._serialize_attachments(message)
-                },
-            )[0]
-            mandrill_state = MandrillState(result['status'].upper())
-            state = self.MANDRILL_STATES_MAPPING.get(mandrill_state)
-            error = None
-            if mandrill_state == MandrillState.INVALID:
-                error = gettext('invalid')
-            elif mandrill_state == MandrillState.REJECTED:
-                error = gettext('rejected, mandrill message: "{}"').format(result['reject_reason'])
-
-            extra_sender_data = message.extra_sender_data or {}
-            extra_sender_data['result'] = result
-            self._update_message_after_sending(
-                message,
-                state=state,
-                sent_at=timezone.now(),
-                extra_sender_data=extra_sender_data,
-                error=error,
-                external_id=result.get('_id')
-            )
+            result = mandrill_client.messages.send(message=self._serialize_message(message))[0]
+            self._update_message_from_result(message, result)
         except (mandrill.Error, JSONDecodeError, requests.exceptions.RequestException) as ex:
             self._update_message_after_sending_error(
                 message,
@@ -119,6 +152,100 @@ class MandrillEmailBackend(EmailBackend):
             # Do not re-raise caught exception. Re-raise exception causes transaction rollback (lost of information
             # about exception).
 
+    def get_publish_messages_chunk_size(self):
+        return self.config['MAX_MESSAGES_PER_REQUEST']
+
+    def _get_message_content_key(self, message):
+        # The key is computed once, messages are grouped when the number of requests is counted and when they are sent
+        if not hasattr(message, '_mandrill_content_key'):
+            message._mandrill_content_key = (
+                message.sender,
+                message.sender_name,
+                message.subject,
+                message.content,
+                tuple(
+                    (serialized_attachment['type'], serialized_attachment['name'], digest)
+                    for serialized_attachment, digest in (
+                        self._get_serialized_attachment(attachment) for attachment in message.attachments.all()
+                    )
+                ),
+            )
+        return message._mandrill_content_key
+
+    def _get_message_recipient_key(self, message):
+        # Mandrill results are paired with messages by the recipient e-mail which is case insensitive
+        return message.recipient.lower()
+
+    def get_number_of_publish_requests(self, messages):
+        prefetch_related_objects(messages, 'attachments')
+        return len(self._group_messages_with_the_same_content(messages))
+
+    def _get_results_messages_changes(self, messages, results):
+        recipient_results = defaultdict(list)
+        for result in results:
+            recipient_results[result['email'].lower()].append(result)
+
+        messages_changes = []
+        for message in messages:
+            if recipient_results[self._get_message_recipient_key(message)]:
+                messages_changes.append(
+                    (message, self._get_message_changes_from_result(
+                        message, recipient_results[self._get_message_recipient_key(message)].pop(0)
+                    ))
+                )
+            else:
+                messages_changes.append(
+                    (message, self._get_message_changes_after_sending_error(
+                        message, error=gettext('mandrill result of the recipient is missing')
+                    ))
+                )
+        return messages_changes
+
+    def publish_messages(self, messages):
+        """
+        Messages with the same content are sent with one Mandrill call to more recipients. Recipients do not see each
+        other (preserve_recipients is turned off) and per-recipient results are saved with bulk update queries.
+        :param messages: list of e-mail messages
+        """
+        prefetch_related_objects(messages, 'attachments')
+        for messages_group in self._group_messages_with_the_same_content(messages):
+            if len(messages_group) == 1:
+                self.publish_message(messages_group[0])
+                continue
+
+            serialized_message = {
+                **self._serialize_message(messages_group[0]),
+                'to': [{'email': message.recipient} for message in messages_group],
+                'preserve_recipients': False,
+            }
+            try:
+                results = self._create_client(*messages_group).messages.send(message=serialized_message)
+                self._bulk_update_messages(self._get_results_messages_changes(messages_group, results))
+            except (mandrill.Error, JSONDecodeError, requests.exceptions.RequestException) as ex:
+                self._bulk_update_messages([
+                    (message, self._get_message_changes_after_sending_error(message, error=str(ex)))
+                    for message in messages_group
+                ])
+                # Do not re-raise caught exception. Re-raise exception causes transaction rollback (lost of
+                # information about exception).
+
+    async def apublish_message(self, message):
+        try:
+            serialized_message = await sync_to_async(self._serialize_message)(message)
+            response = await self.get_async_http_client().post(
+                '{}messages/send.json'.format(self.config['API_URL']),
+                json={'key': self.config['KEY'], 'message': serialized_message},
+            )
+            result = response.json()
+            if response.status_code != 200:
+                raise mandrill.Error('{}: {}'.format(result.get('name'), result.get('message')))
+            await sync_to_async(self._update_message_from_result)(message, result[0])
+        except (mandrill.Error, JSONDecodeError, AsyncRequestException) as ex:
+            await sync_to_async(self._update_message_after_sending_error)(
+                message,
+                error=str(ex)
+            )
+
     def pull_message_info(self, message):
         if message.external_id:
             mandrill_client = self._create_client(message)
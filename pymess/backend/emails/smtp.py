@@ -1,6 +1,9 @@
 import os
 
-from django.core.mail import EmailMultiAlternatives
+from smtplib import SMTPServerDisconnected
+from threading import local
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.utils import timezone
 
 from pymess.backend.emails import EmailBackend
@@ -8,10 +11,43 @@ from pymess.backend.emails import EmailBackend
 
 class SMTPEmailBackend(EmailBackend):
     """
-    E-mail backend implementing standard SMTP service
+    E-mail backend implementing standard SMTP service. SMTP connection is kept open and reused by next messages
+    published from the same thread, connection is transparently reopened if the server closed it.
     """
 
-    def publish_message(self, message):
+    config = {
+        'KEEP_CONNECTION_OPEN': True,
+        'MAX_MESSAGES_PER_CHUNK': 100,  # Maximal number of messages published with one publish_messages call
+    }
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self._local = local()
+
+    def _get_connection(self):
+        """
+        Returns opened SMTP connection of the current thread
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = get_connection()
+        connection.open()
+        return connection
+
+    def close_connection(self):
+        """
+        Closes SMTP connection of the current thread
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.connection = None
+            try:
+                connection.close()
+            except Exception:
+                # Connection can be already broken, it is not reused anyway
+                pass
+
+    def _build_email_message(self, message):
         email_message = EmailMultiAlternatives(
             message.subject,
             ' ',
@@ -25,11 +61,37 @@ class SMTPEmailBackend(EmailBackend):
                 attachment.file.read().decode('utf-8'),
                 attachment.content_type,
             )
+        return email_message
+
+    def _send_email_message(self, message):
+        """
+        Sends message via opened connection, if the server closed the connection (e.g. after idle timeout) the message
+        is sent once more via a new connection.
+        """
+        email_message = self._build_email_message(message)
+        try:
+            self._get_connection().send_messages([email_message])
+        except (SMTPServerDisconnected, ConnectionError):
+            self.close_connection()
+            self._get_connection().send_messages([email_message])
+
+    def publish_messages(self, messages):
         try:
-            email_message.send()
-            self._update_message_after_sending(message, state=message.State.SENT, sent_at=timezone.now())
-        except Exception as ex:
-            self._update_message_after_sending_error(message, error=str(ex))
-            # Do not re-raise caught exception. We do not know exact exception to catch so we catch them all
-            # and log them into database. Re-raise exception causes transaction rollback (lost of information about
-            # exception).
+            for message in sorted(messages, key=lambda m: m.priority):
+                try:
+                    self._send_email_message(message)
+                    self._update_message_after_sending(message, state=message.State.SENT, sent_at=timezone.now())
+                except Exception as ex:
+                    self._update_message_after_sending_error(message, error=str(ex))
+                    # Do not re-raise caught exception. We do not know exact exception to catch so we catch them all
+                    # and log them into database. Re-raise exception causes transaction rollback (lost of information
+                    # about exception).
+        finally:
+            if not self.config['KEEP_CONNECTION_OPEN']:
+                self.close_connection()
+
+    def publish_message(self, message):
+        self.publish_messages([message])
+
+    def get_publish_messages_chunk_size(self):
+        return self.config['MAX_MESSAGES_PER_CHUNK']
@@ -1,6 +1,6 @@
-from chamber.exceptions import PersistenceException
-
-from pymess.backend import BaseBackend, send_template as _send_template, send as _send, BaseController
+from pymess.backend import BaseBackend, send_template as _send_template, send_template_bulk as _send_template_bulk
+from pymess.backend import send as _send, BaseController
+from pymess.backend import asend as _asend, asend_template as _asend_template
 from pymess.config import (
     ControllerType, get_push_notification_template_model, is_turned_on_push_notification_batch_sending, settings
 )
@@ -16,6 +16,8 @@ class PushNotificationController(BaseController):
     class PushNotificationSendingError(Exception):
         pass
 
+    sending_error_class = PushNotificationSendingError
+
     def get_batch_max_seconds_to_send(self):
         return settings.PUSH_NOTIFICATION_BATCH_MAX_SECONDS_TO_SEND
 
@@ -25,22 +27,6 @@ class PushNotificationController(BaseController):
     def is_turned_on_batch_sending(self):
         return is_turned_on_push_notification_batch_sending()
 
-    def create_message(self, recipient, content, related_objects, tag, template,
-                       priority=settings.DEFAULT_MESSAGE_PRIORITY, **kwargs):
-        try:
-            notification = super().create_message(
-                recipient=recipient,
-                content=content,
-                related_objects=related_objects,
-                template=template,
-                tag=tag,
-                priority=priority,
-                **kwargs
-            )
-            return notification
-        except PersistenceException as ex:
-            raise self.PushNotificationSendingError(str(ex))
-
 
 class PushNotificationBackend(BaseBackend):
 
@@ -51,7 +37,8 @@ class PushNotificationBackend(BaseBackend):
         return settings.PUSH_NOTIFICATION_RETRY_SENDING and is_turned_on_push_notification_batch_sending()
 
 
-def send_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None, send_immediately=None):
+def send_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None, send_immediately=None,
+                  send_at=None, expires_at=None):
     """
     Helper for building and sending push notification message from a template.
     :param recipient: push notification recipient
@@ -61,6 +48,8 @@ def send_template(recipient, slug, context_data, locale=None, related_objects=No
         relation
     :param tag: string mark that will be saved with the message
     :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
     :return: Push notification message object or None if template cannot be sent
     """
     return _send_template(
@@ -71,7 +60,33 @@ def send_template(recipient, slug, context_data, locale=None, related_objects=No
         related_objects=related_objects,
         tag=tag,
         template_model=get_push_notification_template_model(),
-        send_immediately=send_immediately
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
+    )
+
+
+def send_template_bulk(slug, recipients_data, locale=None, tag=None, send_immediately=False, send_at=None,
+                       expires_at=None):
+    """
+    Helper for building and sending push notifications from a template to more recipients in one bulk.
+    :param slug: slug of a push notification template
+    :param recipients_data: iterable of tuples (recipient, context_data, related_objects)
+    :param tag: string mark that will be saved with messages
+    :param send_immediately: publishes messages regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
+    :return: list of push notification objects
+    """
+    return _send_template_bulk(
+        slug=slug,
+        recipients_data=recipients_data,
+        locale=locale,
+        tag=tag,
+        template_model=get_push_notification_template_model(),
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
     )
 
 
@@ -95,3 +110,54 @@ def send(recipient, content, related_objects=None, tag=None, send_immediately=Fa
         send_immediately=send_immediately,
         **kwargs
     )
+
+
+async def asend_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None,
+                         send_immediately=False, send_at=None, expires_at=None):
+    """
+    Asynchronous version of the send_template helper.
+    :param recipient: push notification recipient
+    :param slug: slug of a push notification template
+    :param context_data: dict of data that will be sent to the template renderer
+    :param related_objects: list of related objects that will be linked with the push notification using generic
+        relation
+    :param tag: string mark that will be saved with the message
+    :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
+    :return: push notification object or None if template cannot be sent
+    """
+    return await _asend_template(
+        recipient=recipient,
+        slug=slug,
+        context_data=context_data,
+        locale=locale,
+        related_objects=related_objects,
+        tag=tag,
+        template_model=get_push_notification_template_model(),
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
+    )
+
+
+async def asend(recipient, content, related_objects=None, tag=None, send_immediately=False, **kwargs):
+    """
+    Asynchronous version of the send helper.
+    :param recipient: push notification recipient
+    :param content: text content of the messages
+    :param related_objects:
+    :param tag: string mark that will be saved with the message
+    :param kwargs: extra attributes that will be stored with messages
+    :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :return: True if push notification was successfully sent or False if message is in error state
+    """
+    return await _asend(
+        recipient=recipient,
+        content=content,
+        related_objects=related_objects,
+        tag=tag,
+        message_controller=PushNotificationController(),
+        send_immediately=send_immediately,
+        **kwargs
+    )
@@ -1,7 +1,11 @@
+import json
+
 from http import HTTPStatus
 from json.decoder import JSONDecodeError
 
 import requests
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from onesignal import DeviceNotification, OneSignalClient
 from onesignal.errors import OneSignalAPIError
@@ -9,16 +13,21 @@ from onesignal.errors import OneSignalAPIError
 from pymess.backend.push import PushNotificationBackend
 from pymess.config import settings
 from pymess.enums import PushNotificationMessageState
-from pymess.utils.logged_requests import generate_session
+from pymess.utils.logged_requests import AsyncRequestException, PooledSessionBackendMixin, generate_session
 
 
-class OneSignalPushNotificationBackend(PushNotificationBackend):
+class OneSignalPushNotificationBackend(PooledSessionBackendMixin, PushNotificationBackend):
 
     config = {
         'APP_ID': None,
         'API_KEY': None,
         'LANGUAGE': None,
+        'API_URL': 'https://onesignal.com/api/v1/notifications',  # Used only by asynchronous sending
         'TIMEOUT': 5,  # 5s
+        'POOL_SIZE': 10,  # Maximal number of kept-alive connections
+        'MAX_RETRIES': 0,  # Number of retries of failed connections
+        'RETRY_BACKOFF_FACTOR': 0,
+        'MAX_MESSAGES_PER_REQUEST': 2000,  # Maximal number of recipients of notifications with the same content
     }
 
     def _is_result_partial_error(self, result):
@@ -27,54 +36,160 @@ class OneSignalPushNotificationBackend(PushNotificationBackend):
     def _is_invalid_result(self, result):
         return result.is_error or self._is_result_partial_error(result)
 
-    def publish_message(self, message):
-        onesignal_client = OneSignalClient(self.config['APP_ID'],
-                                           self.config['API_KEY'])
-        onesignal_client.session = generate_session(
-            slug='pymess - OneSignal',
-            related_objects=(message,),
-            timeout=self.config['TIMEOUT']
-        )
-
+    def _get_languages(self):
         languages = {'en'}
         if self.config['LANGUAGE'] is not None:
             languages.add(self.config['LANGUAGE'])
+        return languages
+
+    def _get_notification_data(self, message):
         extra_data = message.extra_data or {}
         if message.redirect_url:
             extra_data['redirectUrl'] = message.redirect_url
-        notification = DeviceNotification(
-            include_external_user_ids=(message.recipient,),
+        return extra_data
+
+    def _get_message_changes_from_result(self, message, body, errors, is_invalid):
+        extra_sender_data = message.extra_sender_data or {}
+        extra_sender_data['result'] = body
+
+        if is_invalid:
+            return self._get_message_changes_after_sending_error(
+                message,
+                state=PushNotificationMessageState.ERROR,
+                error=str(errors),
+                extra_sender_data=extra_sender_data,
+            )
+        else:
+            return self._get_message_changes_after_sending(
+                message,
+                state=PushNotificationMessageState.SENT,
+                sent_at=timezone.now(),
+                extra_sender_data=extra_sender_data,
+            )
+
+    def _update_message_from_result(self, message, body, errors, is_invalid):
+        self._update_message(message, **self._get_message_changes_from_result(message, body, errors, is_invalid))
+
+    def _create_client(self, *messages):
+        onesignal_client = OneSignalClient(self.config['APP_ID'],
+                                           self.config['API_KEY'])
+        onesignal_client.session = generate_session(
+            slug='pymess - OneSignal',
+            related_objects=messages,
+            timeout=self.config['TIMEOUT'],
+            adapter=self.http_adapter,
+        )
+        return onesignal_client
+
+    def _create_notification(self, message, recipients):
+        languages = self._get_languages()
+        return DeviceNotification(
+            include_external_user_ids=recipients,
             contents={language: message.content for language in languages},
             headings={language: message.heading for language in languages},
-            data=extra_data,
+            data=self._get_notification_data(message),
             url=message.url,
             ios_badge_type=DeviceNotification.IOS_BADGE_TYPE_INCREASE,
             ios_badge_count=1,
         )
 
+    def publish_message(self, message):
+        onesignal_client = self._create_client(message)
+        notification = self._create_notification(message, (message.recipient,))
+
         try:
             result = onesignal_client.send(notification)
-
-            extra_sender_data = message.extra_sender_data or {}
-            extra_sender_data['result'] = result.body
-
-            if self._is_invalid_result(result):
-                self._update_message_after_sending_error(
-                    message,
-                    state=PushNotificationMessageState.ERROR,
-                    error=str(result.errors),
-                    extra_sender_data=extra_sender_data,
-                )
-            else:
-                self._update_message_after_sending(
-                    message,
-                    state=PushNotificationMessageState.SENT,
-                    sent_at=timezone.now(),
-                    extra_sender_data=extra_sender_data,
-                )
+            self._update_message_from_result(message, result.body, result.errors, self._is_invalid_result(result))
         except (JSONDecodeError, requests.exceptions.RequestException, OneSignalAPIError) as ex:
             self._update_message_after_sending_error(
                 message, error=str(ex)
             )
             # Do not re-raise caught exception. Re-raise exception causes transaction rollback (loss of information
             # about exception).
+
+    def get_publish_messages_chunk_size(self):
+        return self.config['MAX_MESSAGES_PER_REQUEST']
+
+    def _get_message_content_key(self, message):
+        return (
+            message.content,
+            message.heading,
+            message.url,
+            json.dumps(self._get_notification_data(message), sort_keys=True, cls=DjangoJSONEncoder),
+        )
+
+    def _get_invalid_recipients(self, errors):
+        """
+        Return set of recipients which were rejected or None if the error is not related to concrete recipients
+        """
+        if isinstance(errors, dict) and 'invalid_external_user_ids' in errors:
+            return set(errors['invalid_external_user_ids'])
+        return None
+
+    def _get_result_messages_changes(self, messages, result):
+        invalid_recipients = None if result.is_error else self._get_invalid_recipients(result.errors)
+        return [
+            (message, self._get_message_changes_from_result(
+                message,
+                result.body,
+                result.errors,
+                # errors which are not related to concrete recipients invalidate the whole notification
+                self._is_invalid_result(result) if invalid_recipients is None
+                else message.recipient in invalid_recipients
+            ))
+            for message in messages
+        ]
+
+    def get_number_of_publish_requests(self, messages):
+        return len(self._group_messages_with_the_same_content(messages))
+
+    def publish_messages(self, messages):
+        """
+        Notifications with the same content, heading, URL and data are sent with one API call to more recipients.
+        Recipients rejected by OneSignal are set as failed, results are saved with bulk update queries.
+        :param messages: list of push notification messages
+        """
+        for messages_group in self._group_messages_with_the_same_content(messages):
+            if len(messages_group) == 1:
+                self.publish_message(messages_group[0])
+                continue
+
+            notification = self._create_notification(
+                messages_group[0], tuple(message.recipient for message in messages_group)
+            )
+            try:
+                result = self._create_client(*messages_group).send(notification)
+                self._bulk_update_messages(self._get_result_messages_changes(messages_group, result))
+            except (JSONDecodeError, requests.exceptions.RequestException, OneSignalAPIError) as ex:
+                self._bulk_update_messages([
+                    (message, self._get_message_changes_after_sending_error(message, error=str(ex)))
+                    for message in messages_group
+                ])
+                # Do not re-raise caught exception. Re-raise exception causes transaction rollback (loss of
+                # information about exception).
+
+    async def apublish_message(self, message):
+        languages = self._get_languages()
+        try:
+            response = await self.get_async_http_client().post(
+                self.config['API_URL'],
+                json={
+                    'app_id': self.config['APP_ID'],
+                    'include_external_user_ids': [message.recipient],
+                    'contents': {language: message.content for language in languages},
+                    'headings': {language: message.heading for language in languages},
+                    'data': self._get_notification_data(message),
+                    'url': message.url,
+                    'ios_badgeType': DeviceNotification.IOS_BADGE_TYPE_INCREASE,
+                    'ios_badgeCount': 1,
+                },
+                headers={'Authorization': 'Basic {}'.format(self.config['API_KEY'])},
+            )
+            body = response.json()
+            await sync_to_async(self._update_message_from_result)(
+                message, body, body.get('errors'), response.is_error or bool(body.get('errors'))
+            )
+        except (JSONDecodeError, AsyncRequestException) as ex:
+            await sync_to_async(self._update_message_after_sending_error)(
+                message, error=str(ex)
+            )
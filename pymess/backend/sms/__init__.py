@@ -1,19 +1,25 @@
 import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import timedelta
+from threading import current_thread, main_thread
 
+from django.db import close_old_connections
 from django.utils import timezone
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext_lazy as _
 
-from chamber.exceptions import PersistenceException
 
 from pymess.backend import BaseBackend, BaseController
+from pymess.backend import asend as _asend
+from pymess.backend import asend_template as _asend_template
 from pymess.backend import send as _send
 from pymess.backend import send_template as _send_template
+from pymess.backend import send_template_bulk as _send_template_bulk
 from pymess.config import (
     ControllerType, get_sms_template_model, get_supported_backend_paths, is_turned_on_sms_batch_sending, settings,
 )
 from pymess.models import OutputSMSMessage
+from pymess.utils import chunked
 
 LOGGER = logging.getLogger(__name__)
 
@@ -28,6 +34,8 @@ class SMSController(BaseController):
     class SMSSendingError(Exception):
         pass
 
+    sending_error_class = SMSSendingError
+
     def get_batch_size(self):
         return settings.SMS_BATCH_SIZE
 
@@ -41,36 +49,68 @@ class SMSController(BaseController):
         """
         return self.model.State.WAITING
 
-    def create_message(self, recipient, content, related_objects, tag, template,
-                       priority=settings.DEFAULT_MESSAGE_PRIORITY, **kwargs):
+    def build_message(self, recipient, content, tag, template, priority=settings.DEFAULT_MESSAGE_PRIORITY,
+                      send_at=None, expires_at=None, **kwargs):
         """
-        Create SMS which will be logged in the database.
+        Build SMS which will be logged in the database.
         :param recipient: phone number of the recipient
         :param content: content of the SMS message
-        :param related_objects: list of related objects that will be linked with the SMS message using generic
-        relation
         :param tag: string mark that will be saved with the message
         :param template: template object from which content of the message was created
         :param priority: priority of sending message 1 (highest) to 3 (lowest)
+        :param send_at: time after which the message is sent by the batch sender
+        :param expires_at: time after which the message is not sent
         :param kwargs: extra attributes that will be saved with the message
         """
+        is_voice_message = template.is_voice_message if template else False
+        return super().build_message(
+            recipient=recipient,
+            content=content,
+            tag=tag,
+            template=template,
+            state=self.get_initial_sms_state(recipient),
+            priority=priority,
+            send_at=send_at,
+            expires_at=expires_at,
+            extra_data=kwargs,
+            sender=template.sender_name if template else None,
+            is_voice_message=is_voice_message,
+            **self.get_backend(recipient, is_voice_message=is_voice_message).get_extra_message_kwargs()
+        )
+
+    def _check_sms_states_chunk(self, backend, messages):
+        """
+        Update states of the chunk of messages, method can be called from a worker thread. Error is only logged
+        therefore other chunks are checked.
+        """
         try:
-            is_voice_message = template.is_voice_message if template else False
-            return super().create_message(
-                recipient=recipient,
-                content=content,
-                related_objects=related_objects,
-                tag=tag,
-                template=template,
-                state=self.get_initial_sms_state(recipient),
-                priority=priority,
-                extra_data=kwargs,
-                sender=template.sender_name if template else None,
-                is_voice_message=is_voice_message,
-                **self.get_backend(recipient, is_voice_message=is_voice_message).get_extra_message_kwargs()
-            )
-        except PersistenceException as ex:
-            raise self.SMSSendingError(str(ex))
+            backend.update_sms_states(messages)
+        except Exception as ex:
+            LOGGER.exception(ex)
+        finally:
+            if current_thread() is not main_thread():
+                close_old_connections()
+
+    def _check_sms_states(self, backend, messages_to_check):
+        """
+        Update states of messages in chunks with size defined by PYMESS_SMS_DELIVERY_CHECK_CHUNK_SIZE. Messages are
+        loaded from the database per chunk and at most PYMESS_SMS_DELIVERY_CHECK_WORKERS chunks are checked
+        concurrently.
+        """
+        chunk_size = settings.SMS_DELIVERY_CHECK_CHUNK_SIZE
+        chunks = chunked(messages_to_check.order_by('pk').iterator(chunk_size=chunk_size), chunk_size)
+        workers = settings.SMS_DELIVERY_CHECK_WORKERS
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = set()
+                for chunk in chunks:
+                    if len(futures) >= workers:
+                        # next chunk is loaded only if a worker is free
+                        _, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    futures.add(executor.submit(self._check_sms_states_chunk, backend, chunk))
+        else:
+            for chunk in chunks:
+                self._check_sms_states_chunk(backend, chunk)
 
     def bulk_check_sms_states(self):
         """
@@ -78,8 +118,7 @@ class SMSController(BaseController):
         """
         for backend in get_supported_backend_paths(self.backend_type_name):
             messages_to_check = self.model.objects.filter(state=self.model.State.SENDING, backend=backend)
-            if messages_to_check.exists():
-                import_string(backend)().update_sms_states(messages_to_check)
+            self._check_sms_states(import_string(backend)(), messages_to_check)
 
             idle_output_sms = messages_to_check.filter(
                 created_at__lt=timezone.now() - timedelta(minutes=settings.SMS_IDLE_MESSAGES_TIMEOUT_MINUTES),
@@ -118,7 +157,8 @@ class SMSBackend(BaseBackend):
         return settings.SMS_RETRY_SENDING and is_turned_on_sms_batch_sending()
 
 
-def send_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None, send_immediately=False):
+def send_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None, send_immediately=False,
+                  send_at=None, expires_at=None):
     """
     Helper for building and sending SMS message from a template.
     :param recipient: phone number of the recipient
@@ -129,6 +169,8 @@ def send_template(recipient, slug, context_data, locale=None, related_objects=No
     :param tag: string mark that will be saved with the message
     :return: SMS message object or None if template cannot be sent
     :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
     """
     return _send_template(
         recipient=recipient,
@@ -138,7 +180,33 @@ def send_template(recipient, slug, context_data, locale=None, related_objects=No
         related_objects=related_objects,
         tag=tag,
         template_model=get_sms_template_model(),
-        send_immediately=send_immediately
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
+    )
+
+
+def send_template_bulk(slug, recipients_data, locale=None, tag=None, send_immediately=False, send_at=None,
+                       expires_at=None):
+    """
+    Helper for building and sending SMS messages from a template to more recipients in one bulk.
+    :param slug: slug of a SMS template
+    :param recipients_data: iterable of tuples (recipient, context_data, related_objects)
+    :param tag: string mark that will be saved with messages
+    :param send_immediately: publishes messages regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
+    :return: list of SMS message objects
+    """
+    return _send_template_bulk(
+        slug=slug,
+        recipients_data=recipients_data,
+        locale=locale,
+        tag=tag,
+        template_model=get_sms_template_model(),
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
     )
 
 
@@ -162,3 +230,54 @@ def send(recipient, content, related_objects=None, tag=None, send_immediately=Fa
         send_immediately=send_immediately,
         **kwargs
     )
+
+
+async def asend_template(recipient, slug, context_data, locale=None, related_objects=None, tag=None,
+                         send_immediately=False, send_at=None, expires_at=None):
+    """
+    Asynchronous version of the send_template helper.
+    :param recipient: phone number of the recipient
+    :param slug: slug of a SMS message template
+    :param context_data: dict of data that will be sent to the template renderer
+    :param related_objects: list of related objects that will be linked with the SMS message using generic
+        relation
+    :param tag: string mark that will be saved with the message
+    :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :param send_at: time after which the message is sent by the batch sender
+    :param expires_at: time after which the message is not sent
+    :return: SMS message object or None if template cannot be sent
+    """
+    return await _asend_template(
+        recipient=recipient,
+        slug=slug,
+        context_data=context_data,
+        locale=locale,
+        related_objects=related_objects,
+        tag=tag,
+        template_model=get_sms_template_model(),
+        send_immediately=send_immediately,
+        send_at=send_at,
+        expires_at=expires_at,
+    )
+
+
+async def asend(recipient, content, related_objects=None, tag=None, send_immediately=False, **kwargs):
+    """
+    Asynchronous version of the send helper.
+    :param recipient: phone number of the recipient
+    :param content: text content of the messages
+    :param related_objects:
+    :param tag: string mark that will be saved with the message
+    :param kwargs: extra attributes that will be stored with messages
+    :param send_immediately: publishes the message regardless of the `is_turned_on_batch_sending` result
+    :return: True if SMS was successfully sent or False if message is in error state
+    """
+    return await _asend(
+        recipient=recipient,
+        content=content,
+        related_objects=related_objects,
+        tag=tag,
+        message_controller=SMSController(),
+        send_immediately=send_immediately,
+        **kwargs
+    )
@@ -4,6 +4,8 @@ import requests
 
 from enum import Enum
 
+from asgiref.sync import sync_to_async
+
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.utils.safestring import mark_safe
@@ -13,7 +15,9 @@ from enumfields import IntegerChoicesEnum
 
 from pymess.backend.sms import SMSBackend
 from pymess.enums import OutputSMSMessageState
-from pymess.utils.logged_requests import generate_session
+from pymess.utils.logged_requests import (
+    RETRYABLE_STATUS_CODES, AsyncRequestException, PooledSessionBackendMixin, generate_session, get_retry_after_seconds
+)
 
 
 class RequestType(str, Enum):
@@ -67,7 +71,7 @@ class AtsState(IntegerChoicesEnum):
     XML_INVALID = 705, _('XML invalid')
 
 
-class ATSSMSBackend(SMSBackend):
+class ATSSMSBackend(PooledSessionBackendMixin, SMSBackend):
     """
     SMS backend that implements ATS operator service https://www.atspraha.cz/
     Backend supports check SMS delivery
@@ -82,6 +86,12 @@ class ATSSMSBackend(SMSBackend):
     class ATSSendingError(Exception):
         pass
 
+    class ATSTemporarySendingError(ATSSendingError):
+
+        def __init__(self, message, retry_after=None):
+            super().__init__(message)
+            self.retry_after = retry_after
+
     ATS_STATES_MAPPING = {
         AtsState.NOT_FOUND: OutputSMSMessageState.ERROR,
         AtsState.NOT_SENT: OutputSMSMessageState.SENDING,
@@ -117,6 +127,10 @@ class ATSSMSBackend(SMSBackend):
         'URL': 'http://fik.atspraha.cz/gwfcgi/XMLServerWrapper.fcgi',
         'OPTID': '',
         'TIMEOUT': 5,  # 5s
+        'POOL_SIZE': 10,  # Maximal number of kept-alive connections
+        'MAX_RETRIES': 0,  # Number of retries of failed connections
+        'RETRY_BACKOFF_FACTOR': 0,
+        'MAX_MESSAGES_PER_REQUEST': 100,
     }
 
     def _get_extra_sender_data(self):
@@ -157,6 +171,27 @@ class ATSSMSBackend(SMSBackend):
             }
         )
 
+    def _process_response(self, messages, response, is_sending=False, **change_sms_kwargs):
+        """
+        Checks response of the ATS service and updates SMS messages state according the response.
+        :param messages: list of SMS messages
+        :param response: HTTP response (requests or httpx)
+        :param is_sending: True if method is called after sending message
+        :param change_sms_kwargs: extra kwargs that will be stored to the message object
+        """
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise self.ATSTemporarySendingError(
+                'ATS operator returned invalid response status code: {}'.format(response.status_code),
+                retry_after=get_retry_after_seconds(response),
+            )
+        if response.status_code != 200:
+            raise self.ATSSendingError(
+                'ATS operator returned invalid response status code: {}'.format(response.status_code)
+            )
+        self._update_sms_states_from_response(
+            messages, self._parse_response_codes(response.text), is_sending, **change_sms_kwargs
+        )
+
     def _send_requests(self, messages, request_type, is_sending=False, **change_sms_kwargs):
         """
         Performs the actual POST request for input messages and request type.
@@ -167,23 +202,40 @@ class ATSSMSBackend(SMSBackend):
         """
         requests_xml = self._serialize_messages(messages, request_type)
         try:
-            resp = generate_session(slug='pymess - ATS SMS', related_objects=list(messages)).post(
+            resp = generate_session(
+                slug='pymess - ATS SMS', related_objects=list(messages), adapter=self.http_adapter
+            ).post(
                 self.config['URL'],
                 data=requests_xml,
                 headers={'Content-Type': 'text/xml'},
                 timeout=self.config['TIMEOUT']
             )
-            if resp.status_code != 200:
-                raise self.ATSSendingError(
-                    'ATS operator returned invalid response status code: {}'.format(resp.status_code)
-                )
-            self._update_sms_states_from_response(
-                messages, self._parse_response_codes(resp.text), is_sending, **change_sms_kwargs
-            )
         except requests.exceptions.RequestException as ex:
-            raise self.ATSSendingError(
+            raise self.ATSTemporarySendingError(
                 'ATS operator returned returned exception: {}'.format(str(ex))
             )
+        self._process_response(messages, resp, is_sending, **change_sms_kwargs)
+
+    async def _asend_requests(self, messages, request_type, is_sending=False, **change_sms_kwargs):
+        """
+        Asynchronous version of the _send_requests method.
+        :param messages: list of SMS messages
+        :param request_type: type of the request
+        :param is_sending: True if method is called after sending message
+        :param change_sms_kwargs: extra kwargs that will be stored to the message object
+        """
+        requests_xml = self._serialize_messages(messages, request_type)
+        try:
+            resp = await self.get_async_http_client().post(
+                self.config['URL'],
+                content=requests_xml.encode('utf-8'),
+                headers={'Content-Type': 'text/xml'},
+            )
+        except AsyncRequestException as ex:
+            raise self.ATSTemporarySendingError(
+                'ATS operator returned returned exception: {}'.format(str(ex))
+            )
+        await sync_to_async(self._process_response)(messages, resp, is_sending, **change_sms_kwargs)
 
     def _update_sms_states_from_response(self, messages, parsed_response, is_sending=False, **change_sms_kwargs):
         """
@@ -209,13 +261,14 @@ class ATSSMSBackend(SMSBackend):
                 'ATS operator returned SMS info about unknown uniq: {}'.format(', '.join(map(str, extra_uniq)))
             )
 
+        messages_changes = []
         for uniq, ats_state in parsed_response.items():
             sms = messages_dict[uniq]
             state = self.ATS_STATES_MAPPING.get(ats_state)
             error = ats_state.label if state == OutputSMSMessageState.ERROR else None
             if is_sending:
                 if error:
-                    self._update_message_after_sending_error(
+                    changes = self._get_message_changes_after_sending_error(
                         sms,
                         state=state,
                         error=error,
@@ -223,47 +276,70 @@ class ATSSMSBackend(SMSBackend):
                         **change_sms_kwargs
                     )
                 else:
-                    self._update_message_after_sending(
+                    changes = self._get_message_changes_after_sending(
                         sms,
                         state=state,
                         extra_sender_data={'sender_state': ats_state},
                         **change_sms_kwargs
                     )
             else:
-                self._update_message(
-                    sms,
+                changes = dict(
                     state=state,
                     error=error,
                     extra_sender_data={'sender_state': ats_state},
                     **change_sms_kwargs
                 )
+            messages_changes.append((sms, changes))
+        self._bulk_update_messages(messages_changes)
+
+    def _update_messages_after_sending_error(self, messages, ex):
+        if isinstance(ex, self.ATSTemporarySendingError):
+            # Service is temporarily unavailable, sending will be retried
+            changes_kwargs = dict(error=str(ex), retry_after=ex.retry_after)
+        else:
+            changes_kwargs = dict(state=OutputSMSMessageState.ERROR, error=str(ex))
+        self._bulk_update_messages([
+            (message, self._get_message_changes_after_sending_error(message, **changes_kwargs))
+            for message in messages
+        ])
 
     def publish_messages(self, messages):
-        self._send_requests(messages, request_type=RequestType.SMS, is_sending=True, sent_at=timezone.now())
-
-    def publish_message(self, message):
         try:
             self._send_requests(
-                [message],
+                messages,
                 request_type=RequestType.SMS,
                 is_sending=True,
                 sent_at=timezone.now()
             )
         except self.ATSSendingError as ex:
-            self._update_message_after_sending_error(
-                message,
-                state=OutputSMSMessageState.ERROR,
-                error=str(ex),
-            )
-        except requests.exceptions.RequestException as ex:
-            # Service is probably unavailable sending will be retried
-            self._update_message_after_sending_error(
-                message,
-                error=str(ex)
-            )
+            # Request exceptions are raised as temporary sending errors by the _send_requests method
+            self._update_messages_after_sending_error(messages, ex)
             # Do not re-raise caught exception. Re-raise exception causes transaction rollback (lost of information
             # about exception).
 
+    def publish_message(self, message):
+        self.publish_messages([message])
+
+    async def apublish_messages(self, messages):
+        try:
+            await self._asend_requests(
+                messages,
+                request_type=RequestType.SMS,
+                is_sending=True,
+                sent_at=timezone.now()
+            )
+        except self.ATSSendingError as ex:
+            await sync_to_async(self._update_messages_after_sending_error)(messages, ex)
+
+    async def apublish_message(self, message):
+        await self.apublish_messages([message])
+
+    def get_publish_messages_chunk_size(self):
+        return self.config['MAX_MESSAGES_PER_REQUEST']
+
+    def get_number_of_publish_requests(self, messages):
+        return 1 if messages else 0
+
     def _parse_response_codes(self, xml):
         """
         Finds all <code> tags in the given XML and returns a mapping "uniq" -> "response code" for all SMS.
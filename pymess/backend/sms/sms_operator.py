@@ -4,6 +4,8 @@ import requests
 
 from enum import Enum
 
+from asgiref.sync import sync_to_async
+
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.template.loader import render_to_string
@@ -12,7 +14,9 @@ from enumfields import IntegerChoicesEnum
 
 from pymess.backend.sms import SMSBackend
 from pymess.enums import OutputSMSMessageState
-from pymess.utils.logged_requests import generate_session
+from pymess.utils.logged_requests import (
+    RETRYABLE_STATUS_CODES, AsyncRequestException, PooledSessionBackendMixin, generate_session, get_retry_after_seconds
+)
 from pymess.config import settings
 
 
@@ -47,7 +51,7 @@ class SmsOperatorState(IntegerChoicesEnum):
     NOT_FOUND = 15, _('not found')
 
 
-class SMSOperatorBackend(SMSBackend):
+class SMSOperatorBackend(PooledSessionBackendMixin, SMSBackend):
     """
     SMS backend that implements ATS operator service https://www.sms-operator.cz/
     Backend supports check SMS delivery
@@ -56,6 +60,12 @@ class SMSOperatorBackend(SMSBackend):
     class SMSOperatorSendingError(Exception):
         pass
 
+    class SMSOperatorTemporarySendingError(SMSOperatorSendingError):
+
+        def __init__(self, message, retry_after=None):
+            super().__init__(message)
+            self.retry_after = retry_after
+
     TEMPLATES = {
         'base_sms': 'pymess/sms/sms_operator/base_sms.xml',
         'base_voice': 'pymess/sms/sms_operator/base_voice.xml',
@@ -87,6 +97,10 @@ class SMSOperatorBackend(SMSBackend):
         'VOICE_URL': 'https://www.sms-operator.cz/webservices/voice.ashx',
         'UNIQ_PREFIX': '',
         'TIMEOUT': 5,  # 5s
+        'POOL_SIZE': 10,  # Maximal number of kept-alive connections
+        'MAX_RETRIES': 0,  # Number of retries of failed connections
+        'RETRY_BACKOFF_FACTOR': 0,
+        'MAX_MESSAGES_PER_REQUEST': 100,
     }
 
     URLS = {
@@ -127,6 +141,27 @@ class SMSOperatorBackend(SMSBackend):
             }
         )
 
+    def _process_response(self, messages, response, is_sending=False, **change_sms_kwargs):
+        """
+        Checks response of the SMS operator service and updates SMS messages state according the response.
+        :param messages: list of SMS messages
+        :param response: HTTP response (requests or httpx)
+        :param is_sending: True if method is called after sending message
+        :param change_sms_kwargs: extra kwargs that will be stored to the message object
+        """
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise self.SMSOperatorTemporarySendingError(
+                'SMS operator returned invalid response status code: {}'.format(response.status_code),
+                retry_after=get_retry_after_seconds(response),
+            )
+        if response.status_code != 200:
+            raise self.SMSOperatorSendingError(
+                'SMS operator returned invalid response status code: {}'.format(response.status_code)
+            )
+        self._update_sms_states_from_response(
+            messages, self._parse_response_codes(response.text), is_sending, **change_sms_kwargs
+        )
+
     def _send_requests(self, messages, request_type, is_sending=False, **change_sms_kwargs):
         """
         Performs the actual POST request for input messages and request type.
@@ -140,23 +175,40 @@ class SMSOperatorBackend(SMSBackend):
         url = self.config[url_key]
         
         try:
-            resp = generate_session(slug='pymess - SMS operator', related_objects=list(messages)).post(
+            resp = generate_session(
+                slug='pymess - SMS operator', related_objects=list(messages), adapter=self.http_adapter
+            ).post(
                 url,
                 data=requests_xml.encode('utf-8'),
                 headers={'Content-Type': 'text/xml; charset=utf-8'},
                 timeout=self.config['TIMEOUT']
             )
-            if resp.status_code != 200:
-                raise self.SMSOperatorSendingError(
-                    'SMS operator returned invalid response status code: {}'.format(resp.status_code)
-                )
-            self._update_sms_states_from_response(
-                messages, self._parse_response_codes(resp.text), is_sending, **change_sms_kwargs
-            )
         except requests.exceptions.RequestException as ex:
-            raise self.SMSOperatorSendingError(
+            raise self.SMSOperatorTemporarySendingError(
                 'SMS operator returned returned exception: {}'.format(str(ex))
             )
+        self._process_response(messages, resp, is_sending, **change_sms_kwargs)
+
+    async def _asend_requests(self, messages, request_type, is_sending=False, **change_sms_kwargs):
+        """
+        Asynchronous version of the _send_requests method.
+        :param messages: list of SMS messages
+        :param request_type: type of the request
+        :param is_sending: True if method is called after sending message
+        :param change_sms_kwargs: extra kwargs that will be stored to the message object
+        """
+        requests_xml = self._serialize_messages(messages, request_type)
+        try:
+            resp = await self.get_async_http_client().post(
+                self.config[self.URLS[request_type]],
+                content=requests_xml.encode('utf-8'),
+                headers={'Content-Type': 'text/xml; charset=utf-8'},
+            )
+        except AsyncRequestException as ex:
+            raise self.SMSOperatorTemporarySendingError(
+                'SMS operator returned returned exception: {}'.format(str(ex))
+            )
+        await sync_to_async(self._process_response)(messages, resp, is_sending, **change_sms_kwargs)
 
     def _update_sms_states_from_response(self, messages, parsed_response, is_sending=False, **change_sms_kwargs):
         """
@@ -182,13 +234,14 @@ class SMSOperatorBackend(SMSBackend):
                 'SMS operator returned SMS info about unknown uniq: {}'.format(', '.join(map(str, extra_uniq)))
             )
 
+        messages_changes = []
         for uniq, sms_operator_state in parsed_response.items():
             sms = messages_dict[uniq]
             state = self.SMS_OPERATOR_STATES_MAPPING.get(sms_operator_state)
             error = sms_operator_state.label if state == OutputSMSMessageState.ERROR_UPDATE else None
             if is_sending:
                 if error:
-                    self._update_message_after_sending_error(
+                    changes = self._get_message_changes_after_sending_error(
                         sms,
                         state=state,
                         error=error,
@@ -196,64 +249,93 @@ class SMSOperatorBackend(SMSBackend):
                         **change_sms_kwargs
                     )
                 else:
-                    self._update_message_after_sending(
+                    changes = self._get_message_changes_after_sending(
                         sms,
                         state=state,
                         extra_sender_data={'sender_state': sms_operator_state},
                         **change_sms_kwargs
                     )
             else:
-                self._update_message(
-                    sms,
+                changes = dict(
                     state=state,
                     error=error,
                     extra_sender_data={'sender_state': sms_operator_state},
                     **change_sms_kwargs
                 )
+            messages_changes.append((sms, changes))
+        self._bulk_update_messages(messages_changes)
 
-    def publish_message(self, message):
+    def _update_messages_after_sending_error(self, messages, ex):
+        if isinstance(ex, self.SMSOperatorTemporarySendingError):
+            # Service is temporarily unavailable, sending will be retried
+            changes_kwargs = dict(error=str(ex), retry_after=ex.retry_after)
+        else:
+            changes_kwargs = dict(state=OutputSMSMessageState.ERROR, error=str(ex))
+        self._bulk_update_messages([
+            (message, self._get_message_changes_after_sending_error(message, **changes_kwargs))
+            for message in messages
+        ])
+
+    def _publish_messages(self, messages, request_type):
         try:
-            request_type = RequestType.VOICE_MESSAGE if getattr(message, 'is_voice_message', False) else RequestType.SMS
             self._send_requests(
-                [message],
+                messages,
                 request_type=request_type,
                 is_sending=True,
                 sent_at=timezone.now()
             )
         except self.SMSOperatorSendingError as ex:
-            self._update_message_after_sending_error(
-                message,
-                state=OutputSMSMessageState.ERROR,
-                error=str(ex)
-            )
-        except requests.exceptions.RequestException as ex:
-            self._update_message_after_sending_error(
-                message,
-                error=str(ex)
-            )
+            # Request exceptions are raised as temporary sending errors by the _send_requests method
+            self._update_messages_after_sending_error(messages, ex)
             # Do not re-raise caught exception. Re-raise exception causes transaction rollback (lost of information
             # about exception).
 
-    def publish_messages(self, messages):
-        sent_at = timezone.now()
+    async def _apublish_messages(self, messages, request_type):
+        try:
+            await self._asend_requests(
+                messages,
+                request_type=request_type,
+                is_sending=True,
+                sent_at=timezone.now()
+            )
+        except self.SMSOperatorSendingError as ex:
+            await sync_to_async(self._update_messages_after_sending_error)(messages, ex)
+
+    def _split_voice_messages(self, messages):
         voice_messages = [message for message in messages if getattr(message, 'is_voice_message', False)]
         sms_messages = [message for message in messages if not getattr(message, 'is_voice_message', False)]
+        return voice_messages, sms_messages
+
+    def publish_message(self, message):
+        request_type = RequestType.VOICE_MESSAGE if getattr(message, 'is_voice_message', False) else RequestType.SMS
+        self._publish_messages([message], request_type)
+
+    def publish_messages(self, messages):
+        voice_messages, sms_messages = self._split_voice_messages(messages)
 
         if voice_messages:
-            self._send_requests(
-                voice_messages,
-                request_type=RequestType.VOICE_MESSAGE,
-                is_sending=True,
-                sent_at=sent_at
-            )
+            self._publish_messages(voice_messages, RequestType.VOICE_MESSAGE)
 
         if sms_messages:
-            self._send_requests(
-                sms_messages,
-                request_type=RequestType.SMS,
-                is_sending=True,
-                sent_at=sent_at
-            )
+            self._publish_messages(sms_messages, RequestType.SMS)
+
+    async def apublish_message(self, message):
+        await self.apublish_messages([message])
+
+    async def apublish_messages(self, messages):
+        voice_messages, sms_messages = self._split_voice_messages(messages)
+
+        if voice_messages:
+            await self._apublish_messages(voice_messages, RequestType.VOICE_MESSAGE)
+
+        if sms_messages:
+            await self._apublish_messages(sms_messages, RequestType.SMS)
+
+    def get_publish_messages_chunk_size(self):
+        return self.config['MAX_MESSAGES_PER_REQUEST']
+
+    def get_number_of_publish_requests(self, messages):
+        return len([request_messages for request_messages in self._split_voice_messages(messages) if request_messages])
 
     def _parse_response_codes(self, xml):
         """
@@ -277,8 +359,7 @@ class SMSOperatorBackend(SMSBackend):
         return result
 
     def update_sms_states(self, messages):
-        voice_messages = [message for message in messages if getattr(message, 'is_voice_message', False)]
-        sms_messages = [message for message in messages if not getattr(message, 'is_voice_message', False)]
+        voice_messages, sms_messages = self._split_voice_messages(messages)
 
         if voice_messages:
             self._send_requests(voice_messages, request_type=RequestType.VOICE_MESSAGE_DELIVERY_REQUEST)
@@ -34,6 +34,8 @@ DEFAULTS = {
     'SMS_LOG_IDLE_MESSAGES': True,
     'SMS_SET_ERROR_TO_IDLE_MESSAGES': True,
     'SMS_IDLE_MESSAGES_TIMEOUT_MINUTES': 10,
+    'SMS_DELIVERY_CHECK_CHUNK_SIZE': 1000,
+    'SMS_DELIVERY_CHECK_WORKERS': 1,
     'SMS_BATCH_SENDING': False,
     'SMS_BATCH_SIZE': 20,
     'SMS_BATCH_MAX_NUMBER_OF_SEND_ATTEMPTS': 3,
@@ -111,6 +113,26 @@ DEFAULTS = {
     # General settings
     'DEFAULT_MESSAGE_PRIORITY': 3,
     'SHUTDOWN_DETECTION_FUNCTION': None,
+    'BATCH_CLAIM_SIZE': 10,
+    'BATCH_LEASE_SECONDS': 5 * 60,
+    'BATCH_LOOP_MIN_SLEEP_SECONDS': 1,
+    'BATCH_LOOP_MAX_SLEEP_SECONDS': 30,
+    'BATCH_WORKERS': 1,
+    'BATCH_FAIL_EXPIRED_MESSAGES': True,
+    'EXPIRED_MESSAGES_CHUNK_SIZE': 1000,
+    'BULK_CREATE_BATCH_SIZE': 500,
+    'PUBLISH_ON_COMMIT': False,
+    'PUBLISH_ON_COMMIT_WORKERS': 0,
+    'TEMPLATE_CACHE_SIZE': 1000,
+    'TEMPLATE_REGISTRY_TTL_SECONDS': 0,
+    'TEMPLATE_LOCALE_FALLBACK': False,
+    'TEMPLATE_RENDER_PROCESSES': 1,
+    'TEMPLATE_RENDER_CHUNK_SIZE': 500,
+    'RETRY_BACKOFF_BASE_SECONDS': 60,
+    'RETRY_BACKOFF_MAX_SECONDS': 60 * 60,
+    'RETRY_BACKOFF_JITTER': True,
+    'RATE_LIMIT_STORE': 'pymess.utils.rate_limit.CacheRateLimitStore',
+    'RATE_LIMIT_CACHE_NAME': 'default',
 }
 
 
@@ -175,7 +197,12 @@ def _get_backend_config_dict(backend_type):
 
 def get_backend(backend_type, backend_name):
     backend_from_config = _get_backend_config_dict(backend_type)[backend_name]
-    return import_string(backend_from_config['backend'])(config=backend_from_config.get('config', {}))
+    backend = import_string(backend_from_config['backend'])(config=backend_from_config.get('config', {}))
+    if backend_from_config.get('rate_limit'):
+        backend.set_rate_limit('{}.{}'.format(backend_type.name, backend_name), backend_from_config['rate_limit'])
+    if backend_from_config.get('circuit_breaker'):
+        backend.set_circuit_breaker(backend_from_config['circuit_breaker'])
+    return backend
 
 
 def get_default_sender_backend_name(backend_type):
@@ -183,6 +210,10 @@ def get_default_sender_backend_name(backend_type):
     return getattr(settings, backend_default_name)
 
 
+def get_backend_names(backend_type):
+    return list(_get_backend_config_dict(backend_type).keys())
+
+
 def get_supported_backend_paths(backend_type):
     return [backend_config['backend'] for backend_config_name, backend_config in
             _get_backend_config_dict(backend_type).items()]
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from pymess.management.commands.send_messages_batch import Command as SendMessagesBatchCommand
+
+
+class Command(BaseCommand):
+    """
+    Command for setting waiting messages which cannot be sent anymore as failed.
+    """
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--type', action='store', dest='type', default='email',
+                            help='Tells Django what type of messages should be checked '
+                                 '(email/push-notification/dialer/sms).')
+
+    def handle(self, type, *args, **options):
+        number_of_failed_messages = SendMessagesBatchCommand.controllers[type].fail_expired_messages()
+        self.stdout.write('expired messages: {}'.format(number_of_failed_messages))
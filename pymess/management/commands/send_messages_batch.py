@@ -1,9 +1,12 @@
-import import_string
 import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Event, main_thread, current_thread
 
-from chamber.utils.transaction import smart_atomic
 from django.core.management.base import BaseCommand, CommandError
-from django.db import DatabaseError
+from django.db import DatabaseError, close_old_connections
+from django.utils.module_loading import import_string
 
 from pymess.backend.dialer import DialerController
 from pymess.backend.emails import EmailController
@@ -31,37 +34,95 @@ class Command(BaseCommand):
         self.touched_message_pks = set()
         self.send_message_pks = set()
         self.failed_message_pks = set()
+        self.deferred_message_pks = set()
+        self.number_of_expired_messages = 0
         self.shutdown_detection_function = (
             import_string(settings.SHUTDOWN_DETECTION_FUNCTION) if settings.SHUTDOWN_DETECTION_FUNCTION else None
         )
+        self.shutdown_event = Event()
+        self.executor = None
 
     def add_arguments(self, parser):
         super().add_arguments(parser)
         parser.add_argument('--type', action='store', dest='type', default='email',
                             help='Tells Django what type of messages should be send '
                                  '(email/push-notification/dialer/sms).')
+        parser.add_argument('--claim-size', action='store', dest='claim_size', type=int, default=None,
+                            help='Number of messages which are claimed (locked) with one query.')
+        parser.add_argument('--loop', action='store_true', dest='loop', default=False,
+                            help='Command runs as a daemon and sends messages until it is terminated.')
+        parser.add_argument('--workers', action='store', dest='workers', type=int, default=None,
+                            help='Number of threads which publish chunks of claimed messages concurrently.')
 
-    @smart_atomic
-    def _send_message(self, controller):
-        message = controller.get_waiting_or_retry_messages().exclude(
-            pk__in=self.touched_message_pks
-        ).select_for_update(
-            nowait=True
-        ).order_by('priority', 'created_at').first()
-        if not message or not controller.is_turned_on_batch_sending():
-            return False
-
-        self.touched_message_pks.add(message.pk)
+    def _publish_chunk(self, controller, publish_chunk):
+        """
+        Publish chunk of messages with one backend, method can be called from a worker thread.
+        :return: True if messages were published
+        """
+        backend, messages = publish_chunk
         try:
-            if controller.publish_or_retry_message(message):
-                self.send_message_pks.add(message.pk)
-            else:
-                self.failed_message_pks.add(message.pk)
+            controller.publish_messages_chunk(backend, messages)
+            return True
         except Exception as ex:
             # Rollback should not be applied for already send e-mails
             logger.exception(ex)
-            self.failed_message_pks.add(message.pk)
-        return True
+            # Released messages would be claimed again immediately, they are sent again after the retry delay
+            controller.defer_messages(messages, backend.get_retry_delay_seconds(
+                max(message.number_of_send_attempts for message in messages) + 1
+            ))
+            return False
+        finally:
+            if current_thread() is not main_thread():
+                close_old_connections()
+
+    def _map(self, func, iterable):
+        return self.executor.map(func, iterable) if self.executor else map(func, iterable)
+
+    def _send_messages(self, controller, claim_size):
+        """
+        Claim chunk of messages and send them. Messages are published outside of a DB transaction, claimed messages
+        are leased therefore other workers skip them. Messages are published in bulk if backend supports it.
+        :return: number of claimed messages
+        """
+        if not controller.is_turned_on_batch_sending():
+            return 0
+
+        messages = controller.claim_waiting_or_retry_messages(claim_size, exclude_pks=self.touched_message_pks)
+        try:
+            self.touched_message_pks |= {message.pk for message in messages}
+            self.failed_message_pks |= {message.pk for message in messages}
+            publish_chunks = controller.get_publish_chunks(messages)
+            chunk_message_pks = {message.pk for _, chunk in publish_chunks for message in chunk}
+            deferred_message_pks = {
+                message.pk for message in messages if message.pk not in chunk_message_pks and not message.failed
+            }
+            self.deferred_message_pks |= deferred_message_pks
+            self.failed_message_pks -= deferred_message_pks
+            for (_, chunk), is_published in zip(publish_chunks, self._map(
+                    partial(self._publish_chunk, controller), publish_chunks)):
+                if is_published:
+                    published_message_pks = {message.pk for message in chunk if not message.failed}
+                    self.send_message_pks |= published_message_pks
+                    self.failed_message_pks -= published_message_pks
+        finally:
+            controller.release_messages(messages)
+        return len(messages)
+
+    def _send_batch(self, controller, claim_size):
+        """
+        Send at most batch size of messages. Messages which cannot be sent are set as failed before the batch is sent.
+        :return: number of claimed messages
+        """
+        if settings.BATCH_FAIL_EXPIRED_MESSAGES:
+            self.number_of_expired_messages += controller.fail_expired_messages()
+        batch_size = remaining = controller.get_batch_size()
+        while remaining > 0 and not self._is_system_shutting_down():
+            requested = min(claim_size, remaining)
+            claimed = self._send_messages(controller, requested)
+            remaining -= claimed
+            if claimed < requested:
+                break
+        return batch_size - remaining
 
     def _print_result(self, title, message_pks):
         if message_pks:
@@ -69,22 +130,85 @@ class Command(BaseCommand):
         else:
             self.stdout.write('{}: {}'.format(title, len(message_pks)))
 
+    def _print_results(self):
+        self._print_result('sent messages', self.send_message_pks)
+        self._print_result('failed messages', self.failed_message_pks)
+        if self.deferred_message_pks:
+            self._print_result('deferred messages', self.deferred_message_pks)
+        if self.number_of_expired_messages:
+            self.stdout.write('expired messages: {}'.format(self.number_of_expired_messages))
+
+    def _reset_results(self):
+        self.touched_message_pks = set()
+        self.send_message_pks = set()
+        self.failed_message_pks = set()
+        self.deferred_message_pks = set()
+        self.number_of_expired_messages = 0
+
+    def _handle_shutdown_signal(self, signum, frame):
+        self.shutdown_event.set()
+
     def _is_system_shutting_down(self):
-        return self.shutdown_detection_function is not None and self.shutdown_detection_function()
+        return (
+            self.shutdown_event.is_set()
+            or (self.shutdown_detection_function is not None and self.shutdown_detection_function())
+        )
 
-    def handle(self, type, *args, **options):
+    def _send_in_loop(self, controller, claim_size):
+        """
+        Send messages until the system is shutting down. Command does not sleep if the whole batch was sent, if the
+        queue is empty the sleep time is doubled up to PYMESS_BATCH_LOOP_MAX_SLEEP_SECONDS.
+        """
+        previous_signal_handlers = {
+            signum: signal.signal(signum, self._handle_shutdown_signal) for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        sleep_seconds = settings.BATCH_LOOP_MIN_SLEEP_SECONDS
+        try:
+            while not self._is_system_shutting_down():
+                close_old_connections()
+                self._reset_results()
+                try:
+                    number_of_claimed_messages = self._send_batch(controller, claim_size)
+                except DatabaseError as ex:
+                    logger.exception(ex)
+                    number_of_claimed_messages = 0
+
+                if number_of_claimed_messages:
+                    self._print_results()
+
+                if number_of_claimed_messages >= controller.get_batch_size():
+                    sleep_seconds = settings.BATCH_LOOP_MIN_SLEEP_SECONDS
+                    continue
+                elif number_of_claimed_messages:
+                    sleep_seconds = settings.BATCH_LOOP_MIN_SLEEP_SECONDS
+                else:
+                    sleep_seconds = min(sleep_seconds * 2, settings.BATCH_LOOP_MAX_SLEEP_SECONDS)
+                self.shutdown_event.wait(sleep_seconds)
+        finally:
+            for signum, handler in previous_signal_handlers.items():
+                signal.signal(signum, handler)
+
+    def handle(self, type, claim_size, loop, workers, *args, **options):
         controller = self.controllers[type]
         if not controller.is_turned_on_batch_sending():
             raise CommandError('Batch sending is turned off')
 
+        claim_size = claim_size or settings.BATCH_CLAIM_SIZE
+        workers = workers or settings.BATCH_WORKERS
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
         try:
-            for _ in range(controller.get_batch_size()):
-                if self._is_system_shutting_down():
-                    self.stdout.write("System is shutting down, exitting gracefully.")
-                    break
-                if not self._send_message(controller):
-                    break
-            self._print_result('sent messages', self.send_message_pks)
-            self._print_result('failed messages', self.failed_message_pks)
-        except DatabaseError:
-            self.stdout.write('messages are already locked')
+            if loop:
+                self._send_in_loop(controller, claim_size)
+            else:
+                try:
+                    self._send_batch(controller, claim_size)
+                    self._print_results()
+                except DatabaseError as ex:
+                    logger.exception(ex)
+                    self.stdout.write('messages cannot be claimed')
+        finally:
+            if self.executor:
+                self.executor.shutdown()
+
+        if self._is_system_shutting_down():
+            self.stdout.write("System is shutting down, exitting gracefully.")
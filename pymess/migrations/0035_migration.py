@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pymess', '0034_migration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dialermessage',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='lease expires at'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='lease expires at'),
+        ),
+        migrations.AddField(
+            model_name='outputsmsmessage',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='lease expires at'),
+        ),
+        migrations.AddField(
+            model_name='pushnotificationmessage',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='lease expires at'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pymess', '0035_migration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dialermessage',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='next attempt at'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='next attempt at'),
+        ),
+        migrations.AddField(
+            model_name='outputsmsmessage',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='next attempt at'),
+        ),
+        migrations.AddField(
+            model_name='pushnotificationmessage',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='next attempt at'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:05
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pymess', '0036_migration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dialermessage',
+            name='send_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='send at'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='send_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='send at'),
+        ),
+        migrations.AddField(
+            model_name='outputsmsmessage',
+            name='send_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='send at'),
+        ),
+        migrations.AddField(
+            model_name='pushnotificationmessage',
+            name='send_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='send at'),
+        ),
+        migrations.AddIndex(
+            model_name='dialermessage',
+            index=models.Index(models.F('priority'), django.db.models.functions.comparison.Coalesce('send_at', 'created_at'), condition=models.Q(('state__in', [-1, 99])), name='pymess_dialer_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(models.F('priority'), django.db.models.functions.comparison.Coalesce('send_at', 'created_at'), condition=models.Q(('state__in', [1, 6])), name='pymess_email_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outputsmsmessage',
+            index=models.Index(models.F('priority'), django.db.models.functions.comparison.Coalesce('send_at', 'created_at'), condition=models.Q(('state__in', [1, 9])), name='pymess_sms_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pushnotificationmessage',
+            index=models.Index(models.F('priority'), django.db.models.functions.comparison.Coalesce('send_at', 'created_at'), condition=models.Q(('state__in', [1, 5])), name='pymess_push_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pymess', '0037_migration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dialermessage',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='expires at'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='expires at'),
+        ),
+        migrations.AddField(
+            model_name='outputsmsmessage',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='expires at'),
+        ),
+        migrations.AddField(
+            model_name='pushnotificationmessage',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='expires at'),
+        ),
+    ]
@@ -1,20 +1,27 @@
 from functools import reduce
 from operator import or_ as OR
 
+from asgiref.sync import sync_to_async
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
-from django.db.models import Q
-from django.db.models.functions import Cast
-from django.template import Context, Template
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.db.models.functions import Cast, Coalesce
+from django.template import Context
 from django.template.exceptions import TemplateDoesNotExist, TemplateSyntaxError
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
 from chamber.models import SmartModel
 
 from pymess.config import settings
+from pymess.utils.templates import (
+    compiled_template_cache, render_messages_data_in_processes, template_registry
+)
 
 
 class RelatedObjectQueryset(models.QuerySet):
@@ -89,6 +96,9 @@ class RelatedObjectManager(models.Manager):
 
 class MessageQueryset(models.QuerySet):
 
+    def build(self, **kwargs):
+        return self.model(**kwargs)
+
     def filter_related_object(self, related_object):
         return self.filter(
             related_objects__object_id=str(related_object.pk),
@@ -112,6 +122,36 @@ class MessageManager(models.Manager):
         ).filter_related_object(related_object).exists()
 
 
+def get_queue_states(state_enum):
+    """
+    Return states of messages waiting to send, the queue query must use the same states as the queue index
+    """
+    return [state_enum.WAITING, state_enum.ERROR_RETRY]
+
+
+def get_queue_ordering():
+    """
+    Return ordering in which messages are claimed by the batch sender, scheduled messages are ordered by the time
+    of sending therefore messages scheduled ahead are at the end of their priority
+    """
+    return (F('priority'), Coalesce('send_at', 'created_at'))
+
+
+def get_queue_index(state_enum, name):
+    """
+    Return partial index of messages waiting to send in the order in which they are claimed by the batch sender.
+    The index condition can contain only states, messages which are not due yet (scheduled, waiting for a retry or
+    leased) are in the index too and the claim query skips them while it reads the index.
+    :param state_enum: state enum of the message model
+    :param name: name of the index
+    """
+    return models.Index(
+        *get_queue_ordering(),
+        condition=Q(state__in=get_queue_states(state_enum)),
+        name=name,
+    )
+
+
 class BaseMessage(SmartModel):
 
     sent_at = models.DateTimeField(verbose_name=_('sent at'), null=True, blank=True, editable=False)
@@ -130,12 +170,23 @@ class BaseMessage(SmartModel):
                                                           blank=False, default=0)
     priority = models.PositiveSmallIntegerField(verbose_name=_('priority'), null=False, blank=False,
                                                 default=settings.DEFAULT_MESSAGE_PRIORITY)
+    lease_expires_at = models.DateTimeField(verbose_name=_('lease expires at'), null=True, blank=True,
+                                            editable=False)
+    next_attempt_at = models.DateTimeField(verbose_name=_('next attempt at'), null=True, blank=True, editable=False,
+                                           db_index=True)
+    send_at = models.DateTimeField(verbose_name=_('send at'), null=True, blank=True, editable=False, db_index=True)
+    expires_at = models.DateTimeField(verbose_name=_('expires at'), null=True, blank=True, editable=False,
+                                      db_index=True)
 
     objects = MessageManager.from_queryset(MessageQueryset)()
 
     def __str__(self):
         return self.recipient
 
+    @property
+    def is_scheduled(self):
+        return self.send_at is not None and self.send_at > now()
+
     class Meta:
         abstract = True
         ordering = ('-created_at',)
@@ -168,12 +219,26 @@ class BaseAbstractTemplate(SmartModel):
     is_allowed_duplicate_messages = models.BooleanField(null=False, blank=False, default=True,
                                                         verbose_name=_('Duplicate messages are allowed'))
 
+    # Template registry sets False if there is no disallowed object for the template
+    has_disallowed_objects = True
+
     def _update_context_data(self, context_data, recipient):
         return context_data
 
+    def _get_compiled_template_key(self):
+        if self.pk is None:
+            return None
+        return self._meta.label, self.pk, self.changed_at, getattr(self, 'version', None)
+
+    def get_compiled_template(self, text):
+        """
+        Returns compiled Django template of the text, compiled templates are cached.
+        """
+        return compiled_template_cache.get(self._get_compiled_template_key(), text)
+
     def render_text_template(self, text, context_data, recipient):
         context_data = self._update_context_data(context_data, recipient)
-        return Template(text).render(Context(context_data))
+        return self.get_compiled_template(text).render(Context(context_data))
 
     def render_body(self, context_data, recipient=None):
         return self.render_text_template(self.get_body(), context_data, recipient)
@@ -196,6 +261,7 @@ class BaseAbstractTemplate(SmartModel):
             and (
                 not hasattr(self, 'disallowed_objects')
                 or related_objects is None
+                or not self.has_disallowed_objects
                 or not self.disallowed_objects.filter_from_related_objects(*related_objects).exists()
             )
         )
@@ -212,25 +278,127 @@ class BaseAbstractTemplate(SmartModel):
         else:
             return False
 
+    def _get_related_objects_key(self, related_objects):
+        return frozenset(
+            (ContentType.objects.get_for_model(obj).pk, obj.pk) for obj in related_objects
+        ) if related_objects else None
+
+    def _filter_sendable_recipients_data(self, recipients_data):
+        """
+        Filter recipients for which the template can be sent. Messages created in the same bulk are checked as
+        duplicates too, the same way as they would be checked by sending messages one by one.
+        :param recipients_data: iterable of tuples (recipient, context_data, related_objects)
+        """
+        sent_related_objects_keys = set()
+        for recipient, context_data, related_objects in recipients_data:
+            related_objects_key = (
+                None if self.is_allowed_duplicate_messages else self._get_related_objects_key(related_objects)
+            )
+            if related_objects_key is not None and related_objects_key in sent_related_objects_keys:
+                continue
+            if self.can_send(recipient, related_objects):
+                if related_objects_key is not None:
+                    sent_related_objects_keys.add(related_objects_key)
+                yield recipient, context_data, related_objects
+
     def can_send(self, recipient, related_objects):
         return self.is_active and self.can_send_for_object(related_objects)
 
     def get_controller(self):
         raise NotImplementedError
 
+    def get_message_data(self, recipient, context_data, related_objects=None, tag=None, **kwargs):
+        """
+        Renders the template for the recipient and returns data of the message which are passed to the controller.
+        :param recipient: recipient of the message
+        :param context_data: dict of data that will be sent to the template renderer
+        :param related_objects: list of related objects that will be linked with the message
+        :param tag: string mark that will be saved with the message
+        :param kwargs: extra attributes that will be stored with the message
+        """
+        return dict(
+            recipient=recipient,
+            content=self.render_body(context_data, recipient),
+            related_objects=related_objects,
+            tag=tag,
+            template=self,
+            **kwargs,
+        )
+
     def send(self, recipient, context_data, related_objects=None, tag=None, **kwargs):
         if self.can_send(recipient, related_objects):
             return self.get_controller().send(
-                recipient=recipient,
-                content=self.render_body(context_data, recipient),
-                related_objects=related_objects,
-                tag=tag,
-                template=self,
-                **kwargs,
+                **self.get_message_data(recipient, context_data, related_objects=related_objects, tag=tag, **kwargs)
             )
         else:
             return None
 
+    async def asend(self, recipient, context_data, related_objects=None, tag=None, **kwargs):
+        """
+        Asynchronous version of the send method, template is rendered in a thread.
+        """
+        message_data = await sync_to_async(self._get_message_data_if_can_send)(
+            recipient, context_data, related_objects=related_objects, tag=tag, **kwargs
+        )
+        if message_data is None:
+            return None
+        else:
+            return await self.get_controller().asend(**message_data)
+
+    def _get_message_data_if_can_send(self, recipient, context_data, related_objects=None, tag=None, **kwargs):
+        if self.can_send(recipient, related_objects):
+            return self.get_message_data(recipient, context_data, related_objects=related_objects, tag=tag, **kwargs)
+        else:
+            return None
+
+    def _render_messages_data(self, recipients_data, tag, render_processes, **kwargs):
+        if render_processes > 1:
+            for message_data in render_messages_data_in_processes(
+                    self, recipients_data, tag=tag, processes=render_processes, **kwargs):
+                # template is unpickled in the rendering process, the same instance should be stored with messages
+                message_data['template'] = self
+                yield message_data
+        else:
+            for recipient, context_data, related_objects in recipients_data:
+                yield self.get_message_data(
+                    recipient, context_data, related_objects=related_objects, tag=tag, **kwargs
+                )
+
+    def send_bulk(self, recipients_data, tag=None, send_immediately=False, render_processes=None, **kwargs):
+        """
+        Renders the template for more recipients and sends messages in one bulk. Messages are created with bulk
+        insert queries, messages which cannot be sent (can_send returns False or the message is a duplicate
+        of another message in the bulk) are skipped.
+        :param recipients_data: iterable of tuples (recipient, context_data, related_objects)
+        :param tag: string mark that will be saved with messages
+        :param send_immediately: publishes messages regardless of the `is_turned_on_batch_sending` result
+        :param render_processes: number of processes which render messages, PYMESS_TEMPLATE_RENDER_PROCESSES is used
+            by default
+        :param kwargs: extra attributes that will be stored with messages
+        :return: list of created messages
+        """
+        controller = self.get_controller()
+        render_processes = settings.TEMPLATE_RENDER_PROCESSES if render_processes is None else render_processes
+        messages = controller.bulk_create_messages(
+            self._render_messages_data(
+                self._filter_sendable_recipients_data(recipients_data),
+                tag,
+                render_processes,
+                **kwargs
+            )
+        )
+        if send_immediately or not controller.is_turned_on_batch_sending():
+            controller.bulk_send_messages(messages)
+        return messages
+
+    def _post_save(self, changed, changed_fields, *args, **kwargs):
+        super()._post_save(changed, changed_fields, *args, **kwargs)
+        compiled_template_cache.invalidate(self._meta.label, self.pk)
+
+    def _pre_delete(self, *args, **kwargs):
+        super()._pre_delete(*args, **kwargs)
+        compiled_template_cache.invalidate(self._meta.label, self.pk)
+
     def __str__(self):
         return f"{self.slug} ({self.locale})" if self.locale else self.slug
 
@@ -238,3 +406,15 @@ class BaseAbstractTemplate(SmartModel):
         abstract = True
         unique_together = ("slug", "locale")
         ordering = ('-created_at',)
+
+
+def clear_template_registry(sender, **kwargs):
+    template_registry.clear()
+
+
+def connect_template_registry_invalidation(model):
+    """
+    Registered template registry is cleared if an instance of the model is saved or deleted
+    """
+    post_save.connect(clear_template_registry, sender=model)
+    post_delete.connect(clear_template_registry, sender=model)
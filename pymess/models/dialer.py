@@ -7,7 +7,9 @@ from pymess.config import settings
 from pymess.enums import DialerMessageState
 from pymess.utils import normalize_phone_number
 
-from .common import BaseAbstractTemplate, BaseMessage, BaseRelatedObject
+from .common import (
+    BaseAbstractTemplate, BaseMessage, BaseRelatedObject, connect_template_registry_invalidation, get_queue_index
+)
 
 
 __all__ = (
@@ -56,6 +58,11 @@ class DialerMessage(AbstractDialerMessage):
 
     is_final_state = models.BooleanField(verbose_name=_('is final state'), null=False, default=False)
 
+    class Meta(AbstractDialerMessage.Meta):
+        indexes = (
+            get_queue_index(DialerMessageState, name='pymess_dialer_queue_idx'),
+        )
+
     def __str__(self):
         return '{recipient}, {template_slug}, {state}'.format(
             recipient=self.recipient, template_slug=self.template_slug, state=self.get_state_display(),
@@ -104,3 +111,7 @@ class DialerTemplateDisallowedObject(BaseRelatedObject):
     class Meta(BaseRelatedObject.Meta):
         verbose_name = _('disallowed object of a dialer template')
         verbose_name_plural = _('disallowed objects of dialer templates')
+
+
+connect_template_registry_invalidation(DialerTemplate)
+connect_template_registry_invalidation(DialerTemplateDisallowedObject)
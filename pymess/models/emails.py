@@ -9,14 +9,17 @@ from django.core.files.base import ContentFile
 from django.utils.functional import cached_property
 from django.db import models
 from django.utils.translation import gettext, gettext_lazy as _
-from django.template import Template, Context
+from django.template import Context
 from django.template.exceptions import TemplateSyntaxError, TemplateDoesNotExist
 
 from pymess.config import settings
 from pymess.enums import EmailMessageState
 from pymess.utils.html import raise_error_if_contains_banned_tags
 
-from .common import BaseAbstractTemplate, BaseMessage, BaseRelatedObject, MessageQueryset
+from .common import (
+    BaseAbstractTemplate, BaseMessage, BaseRelatedObject, MessageQueryset, connect_template_registry_invalidation,
+    get_queue_index
+)
 
 
 __all__ = (
@@ -44,9 +47,15 @@ def generate_template_attachment_filename(instance, filename):
 
 class EmailMessageQuerySet(MessageQueryset):
 
-    def create(self, content, **kwargs):
+    def build(self, content, **kwargs):
         message = self.model(**kwargs)
-        message.content_file.save(None, ContentFile(content.encode()))
+        message.content_file.save(None, ContentFile(content.encode()), save=False)
+        message.__dict__['content'] = content
+        return message
+
+    def create(self, content, **kwargs):
+        message = self.build(content, **kwargs)
+        message.save()
         return message
 
 
@@ -89,6 +98,9 @@ class EmailMessage(BaseMessage):
     class Meta(BaseMessage.Meta):
         verbose_name = _('e-mail message')
         verbose_name_plural = _('e-mail messages')
+        indexes = (
+            get_queue_index(EmailMessageState, name='pymess_email_queue_idx'),
+        )
 
     def __str__(self):
         return '{}: {}'.format(self.recipient, self.subject)
@@ -185,11 +197,11 @@ class AbstractEmailTemplate(BaseAbstractTemplate):
 
     def render_subject(self, context_data, recipient=None):
         context_data = self._update_context_data(context_data, recipient)
-        return Template(self.get_subject()).render(Context(context_data))
+        return self.get_compiled_template(self.get_subject()).render(Context(context_data))
 
-    def send(self, recipient, context_data, related_objects=None, tag=None, attachments=None,
-             priority=settings.DEFAULT_MESSAGE_PRIORITY, **kwargs):
-        return super().send(
+    def get_message_data(self, recipient, context_data, related_objects=None, tag=None, attachments=None,
+                         priority=settings.DEFAULT_MESSAGE_PRIORITY, **kwargs):
+        return super().get_message_data(
             recipient=recipient,
             context_data=context_data,
             related_objects=related_objects,
@@ -260,17 +272,22 @@ class EmailTemplate(AbstractEmailTemplate):
     def get_body(self):
         return self._extend_body(self.body) if settings.EMAIL_TEMPLATE_EXTEND_BODY else self.body
 
-    def send(self, recipient, context_data, related_objects=None, tag=None, attachments=None, **kwargs):
-        attachments = [] if attachments is None else attachments
+    def _read_template_attachment(self, template_attachment):
+        # template instance can be shared between threads (template registry), therefore file is always opened again
+        with template_attachment.file.storage.open(template_attachment.file.name, 'rb') as f:
+            return f.read()
+
+    def get_message_data(self, recipient, context_data, related_objects=None, tag=None, attachments=None, **kwargs):
+        attachments = [] if attachments is None else list(attachments)
         attachments += [
             (
                 template_attachment.filename or os.path.basename(template_attachment.file.name),
-                ContentFile(template_attachment.file.read()),
+                ContentFile(self._read_template_attachment(template_attachment)),
                 template_attachment.content_type,
             ) for template_attachment in self.template_attachments.all()
         ]
 
-        return super().send(
+        return super().get_message_data(
             recipient=recipient,
             context_data=context_data,
             related_objects=related_objects,
@@ -308,3 +325,8 @@ class EmailTemplateAttachment(SmartModel):
     class Meta:
         verbose_name = _('e-mail template attachment')
         verbose_name_plural = _('e-mail template attachments')
+
+
+connect_template_registry_invalidation(EmailTemplate)
+connect_template_registry_invalidation(EmailTemplateDisallowedObject)
+connect_template_registry_invalidation(EmailTemplateAttachment)
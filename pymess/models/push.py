@@ -4,7 +4,9 @@ from django.utils.translation import gettext_lazy as _
 from pymess.config import settings
 from pymess.enums import PushNotificationMessageState
 
-from .common import BaseAbstractTemplate, BaseMessage, BaseRelatedObject
+from .common import (
+    BaseAbstractTemplate, BaseMessage, BaseRelatedObject, connect_template_registry_invalidation, get_queue_index
+)
 
 __all__ = (
     'AbstractPushNotificationMessage',
@@ -40,6 +42,11 @@ class AbstractPushNotificationMessage(BaseMessage):
 
 class PushNotificationMessage(AbstractPushNotificationMessage):
 
+    class Meta(AbstractPushNotificationMessage.Meta):
+        indexes = (
+            get_queue_index(PushNotificationMessageState, name='pymess_push_queue_idx'),
+        )
+
     def __str__(self):
         return '{recipient}, {template_slug}, {state}'.format(recipient=self.recipient,
                                                               template_slug=self.template_slug, state=self.state)
@@ -65,14 +72,14 @@ class AbstractPushNotificationTemplate(BaseAbstractTemplate):
         from pymess.backend.push import PushNotificationController
         return PushNotificationController()
 
-    def send(self, recipient, context_data, related_objects=None, tag=None, **kwargs):
-        return super().send(recipient, context_data, related_objects, tag,
-                            state=AbstractPushNotificationMessage.State.WAITING,
-                            heading=self.render_text_template(self.heading, context_data, recipient),
-                            redirect_url=self.render_text_template(
-                                self.redirect_url, context_data, recipient
-                            ) if self.redirect_url is not None else None,
-                            **kwargs)
+    def get_message_data(self, recipient, context_data, related_objects=None, tag=None, **kwargs):
+        return super().get_message_data(recipient, context_data, related_objects, tag,
+                                        state=AbstractPushNotificationMessage.State.WAITING,
+                                        heading=self.render_text_template(self.heading, context_data, recipient),
+                                        redirect_url=self.render_text_template(
+                                            self.redirect_url, context_data, recipient
+                                        ) if self.redirect_url is not None else None,
+                                        **kwargs)
 
     class Meta(BaseAbstractTemplate.Meta):
         abstract = True
@@ -82,3 +89,6 @@ class AbstractPushNotificationTemplate(BaseAbstractTemplate):
 
 class PushNotificationTemplate(AbstractPushNotificationTemplate):
     pass
+
+
+connect_template_registry_invalidation(PushNotificationTemplate)
@@ -7,7 +7,9 @@ from pymess.config import settings
 from pymess.utils import normalize_phone_number
 from pymess.enums import OutputSMSMessageState
 
-from .common import BaseAbstractTemplate, BaseMessage, BaseRelatedObject
+from .common import (
+    BaseAbstractTemplate, BaseMessage, BaseRelatedObject, connect_template_registry_invalidation, get_queue_index
+)
 
 
 __all__ = (
@@ -36,6 +38,9 @@ class OutputSMSMessage(BaseMessage):
     class Meta(BaseMessage.Meta):
         verbose_name = _('output SMS')
         verbose_name_plural = _('output SMS')
+        indexes = (
+            get_queue_index(OutputSMSMessageState, name='pymess_sms_queue_idx'),
+        )
 
     def clean_recipient(self):
         self.recipient = normalize_phone_number(force_str(self.recipient))
@@ -94,3 +99,7 @@ class SMSTemplateDisallowedObject(BaseRelatedObject):
     class Meta(BaseRelatedObject.Meta):
         verbose_name = _('disallowed object of an SMS template')
         verbose_name_plural = _('disallowed objects of SMS templates')
+
+
+connect_template_registry_invalidation(SMSTemplate)
+connect_template_registry_invalidation(SMSTemplateDisallowedObject)
@@ -1,18 +1,36 @@
 from .backend.dialer import send_template as send_dialer_template
+from .backend.dialer import send_template_bulk as send_dialer_template_bulk
 from .backend.dialer import send as send_dialer
+from .backend.dialer import asend_template as asend_dialer_template
+from .backend.dialer import asend as asend_dialer
 
 from .backend.emails import send_template as send_email_template
+from .backend.emails import send_template_bulk as send_email_template_bulk
 from .backend.emails import send as send_email
+from .backend.emails import asend_template as asend_email_template
+from .backend.emails import asend as asend_email
 
 from .backend.sms import send_template as send_sms_template
+from .backend.sms import send_template_bulk as send_sms_template_bulk
 from .backend.sms import send as send_sms
+from .backend.sms import asend_template as asend_sms_template
+from .backend.sms import asend as asend_sms
 
 
 __all__ = (
     'send_dialer_template',
+    'send_dialer_template_bulk',
     'send_dialer',
+    'asend_dialer_template',
+    'asend_dialer',
     'send_email_template',
+    'send_email_template_bulk',
     'send_email',
+    'asend_email_template',
+    'asend_email',
     'send_sms_template',
+    'send_sms_template_bulk',
     'send_sms',
+    'asend_sms_template',
+    'asend_sms',
 )
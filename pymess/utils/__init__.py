@@ -1,3 +1,5 @@
+from itertools import islice
+
 from pymess.config import settings
 
 
@@ -19,3 +21,14 @@ def fullname(o):
     Helper that returns name of the input object with its path.
     """
     return o.__module__ + "." + o.__class__.__name__
+
+
+def chunked(iterable, size):
+    """
+    Helper that splits the input iterable to the lists with maximal length defined by the size.
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
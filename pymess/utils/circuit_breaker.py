@@ -0,0 +1,98 @@
+from collections import deque
+from enum import Enum
+from threading import Lock
+from time import monotonic
+
+
+class CircuitBreakerState(str, Enum):
+
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one backend instance. Breaker is opened if the rate of failed publish calls in the time window
+    exceeds the threshold, requests are not allowed while the breaker is open. After the open interval a limited
+    number of probe requests is allowed (half-open state), successful probe closes the breaker, failed probe opens
+    it again.
+    """
+
+    def __init__(self, failure_rate_threshold=0.5, minimum_number_of_calls=10, window_seconds=60, open_seconds=30,
+                 half_open_max_calls=1):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_number_of_calls = minimum_number_of_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CircuitBreakerState.CLOSED
+        self._calls = deque()
+        self._opened_at = None
+        self._half_open_calls = 0
+        self._lock = Lock()
+
+    def _open(self, now):
+        self.state = CircuitBreakerState.OPEN
+        self._opened_at = now
+        self._calls.clear()
+
+    def _close(self):
+        self.state = CircuitBreakerState.CLOSED
+        self._opened_at = None
+        self._calls.clear()
+
+    def get_open_remaining_seconds(self):
+        """
+        Return number of seconds after which requests refused by the breaker should be retried. It is the rest of
+        the open interval if the breaker is open, the whole open interval if the breaker is half-open (the result of
+        probe requests is not known yet) and 0 if the breaker is closed.
+        """
+        with self._lock:
+            if self.state == CircuitBreakerState.HALF_OPEN:
+                return self.open_seconds
+            elif self.state == CircuitBreakerState.OPEN:
+                return max(self._opened_at + self.open_seconds - monotonic(), 0)
+            else:
+                return 0
+
+    def allow_request(self):
+        """
+        Return True if the request can be sent with the backend.
+        """
+        with self._lock:
+            if self.state == CircuitBreakerState.OPEN:
+                if monotonic() < self._opened_at + self.open_seconds:
+                    return False
+                self.state = CircuitBreakerState.HALF_OPEN
+                self._half_open_calls = 0
+
+            if self.state == CircuitBreakerState.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    return False
+                self._half_open_calls += 1
+            return True
+
+    def record(self, is_success):
+        """
+        Record result of the publish call.
+        :param is_success: False if the call failed
+        """
+        with self._lock:
+            now = monotonic()
+            if self.state == CircuitBreakerState.HALF_OPEN:
+                if is_success:
+                    self._close()
+                else:
+                    self._open(now)
+                return
+            elif self.state == CircuitBreakerState.OPEN:
+                return
+
+            self._calls.append((now, is_success))
+            while self._calls and self._calls[0][0] < now - self.window_seconds:
+                self._calls.popleft()
+            number_of_failures = sum(1 for _, call_is_success in self._calls if not call_is_success)
+            if (len(self._calls) >= self.minimum_number_of_calls
+                    and number_of_failures / len(self._calls) >= self.failure_rate_threshold):
+                self._open(now)
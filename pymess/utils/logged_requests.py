@@ -1,3 +1,16 @@
+import asyncio
+
+from email.utils import parsedate_to_datetime
+from weakref import WeakKeyDictionary
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import cached_property
+from django.utils.timezone import now
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
 class DefaultTimeoutSessionMixin:
 
     def __init__(self, timeout=None, **kwargs):
@@ -24,5 +37,138 @@ except ImportError:
             super().__init__(timeout)
 
 
-def generate_session(slug=None, related_objects=None, timeout=None):
-    return DefaultTimeoutSecuritySession(timeout=timeout, slug=slug, related_objects=related_objects)
+try:
+    import httpx
+
+    AsyncRequestException = httpx.HTTPError
+
+except ImportError:
+    httpx = None
+
+    class AsyncRequestException(Exception):
+        pass
+
+
+# Status codes of temporary errors, the request should be sent again later
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+def get_retry_after_seconds(response):
+    """
+    Return number of seconds from the Retry-After header of the response or None if header is missing or invalid.
+    :param response: requests or httpx response
+    """
+    retry_after = response.headers.get('Retry-After')
+    if not retry_after:
+        return None
+    try:
+        return max(int(retry_after), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - now()).total_seconds(), 0) if retry_at.tzinfo else None
+
+
+def generate_adapter(pool_size=10, max_retries=0, retry_backoff_factor=0):
+    """
+    Create HTTP adapter with a pool of keep-alive connections. Adapter can be shared between more sessions (and
+    threads) therefore connections are reused between requests.
+    :param pool_size: maximal number of connections stored in the pool per host
+    :param max_retries: number of retries of failed connections, non idempotent requests are retried only if
+        the connection to the server cannot be established
+    :param retry_backoff_factor: backoff factor applied between retries
+    """
+    return HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=max_retries, backoff_factor=retry_backoff_factor, raise_on_status=False),
+    )
+
+
+def generate_session(slug=None, related_objects=None, timeout=None, adapter=None):
+    session = DefaultTimeoutSecuritySession(timeout=timeout, slug=slug, related_objects=related_objects)
+    if adapter is not None:
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    return session
+
+
+def generate_async_client(pool_size=10, max_retries=0, timeout=None):
+    """
+    Create asynchronous HTTP client with a pool of keep-alive connections. Client requires httpx library.
+    :param pool_size: maximal number of connections stored in the pool
+    :param max_retries: number of retries of connections which cannot be established
+    :param timeout: default timeout of requests in seconds
+    """
+    if httpx is None:
+        raise ImproperlyConfigured('httpx library must be installed to send messages asynchronously')
+
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            retries=max_retries,
+        ),
+        timeout=timeout,
+    )
+
+
+async def _async_client_lifetime(client):
+    """
+    Asynchronous generator which keeps the client until the event loop shuts down its asynchronous generators
+    (asyncio.run and async_to_sync do it before the loop is closed) or the generator is closed explicitly.
+    """
+    try:
+        yield client
+    finally:
+        await client.aclose()
+
+
+class PooledSessionBackendMixin:
+    """
+    Backend mixin which shares one pool of keep-alive connections between all requests sent by the backend instance.
+    Pool is configured with backend config POOL_SIZE, MAX_RETRIES and RETRY_BACKOFF_FACTOR. Asynchronous requests
+    share one client per event loop, the client is closed together with the event loop.
+    """
+
+    @cached_property
+    def http_adapter(self):
+        return generate_adapter(
+            pool_size=self.config['POOL_SIZE'],
+            max_retries=self.config['MAX_RETRIES'],
+            retry_backoff_factor=self.config['RETRY_BACKOFF_FACTOR'],
+        )
+
+    @cached_property
+    def _async_http_clients(self):
+        return WeakKeyDictionary()
+
+    def get_async_http_client(self):
+        """
+        Return asynchronous HTTP client of the running event loop, client cannot be shared between event loops.
+        Client is closed when the event loop shuts down or with the aclose_async_http_client method.
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_http_clients:
+            lifetime = _async_client_lifetime(generate_async_client(
+                pool_size=self.config['POOL_SIZE'],
+                max_retries=self.config['MAX_RETRIES'],
+                timeout=self.config['TIMEOUT'],
+            ))
+            # The first iteration registers the generator in the running loop and returns the client without
+            # suspending
+            try:
+                lifetime.__anext__().send(None)
+            except StopIteration as ex:
+                self._async_http_clients[loop] = (ex.value, lifetime)
+        return self._async_http_clients[loop][0]
+
+    async def aclose_async_http_client(self):
+        """
+        Close asynchronous HTTP client of the running event loop.
+        """
+        _, lifetime = self._async_http_clients.pop(asyncio.get_running_loop(), (None, None))
+        if lifetime is not None:
+            await lifetime.aclose()
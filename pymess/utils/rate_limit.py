@@ -0,0 +1,154 @@
+import time
+
+from threading import Lock
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from pymess.config import settings
+
+
+class BaseRateLimitStore:
+    """
+    Store of token buckets. Store must be shared between all processes which send messages with the same backend
+    to limit the rate across workers.
+    """
+
+    def _refill(self, state, now, rate, capacity):
+        if state is None:
+            return capacity
+        tokens, updated_at = state
+        return min(capacity, tokens + max(now - updated_at, 0) * rate)
+
+    def _consume_tokens(self, state, tokens, rate, capacity):
+        """
+        Consume tokens from the bucket state.
+        :return: pair (new state of the bucket, number of seconds to wait for tokens or 0 if tokens were consumed)
+        """
+        now = time.time()
+        available_tokens = self._refill(state, now, rate, capacity)
+        if available_tokens >= tokens:
+            return (available_tokens - tokens, now), 0
+        else:
+            return (available_tokens, now), (tokens - available_tokens) / rate
+
+    def consume(self, key, tokens, rate, capacity):
+        """
+        Consume tokens from the bucket identified with the key. Tokens are not consumed if the bucket does not contain
+        enough tokens.
+        :param key: key of the bucket
+        :param tokens: number of consumed tokens
+        :param rate: number of tokens added to the bucket per second
+        :param capacity: maximal number of tokens in the bucket
+        :return: number of seconds to wait for tokens or 0 if tokens were consumed
+        """
+        raise NotImplementedError
+
+
+class InMemoryRateLimitStore(BaseRateLimitStore):
+    """
+    Store which limits rate only in the current process, it should be used for tests or one worker.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = Lock()
+
+    def consume(self, key, tokens, rate, capacity):
+        with self._lock:
+            self._buckets[key], wait_seconds = self._consume_tokens(self._buckets.get(key), tokens, rate, capacity)
+            return wait_seconds
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheRateLimitStore(BaseRateLimitStore):
+    """
+    Store which keeps buckets in the Django cache defined with PYMESS_RATE_LIMIT_CACHE_NAME. Buckets are updated under
+    a lock created with atomic cache add operation, therefore cache shared between processes (memcached, redis or
+    database cache) must be used to limit the rate across workers.
+    """
+
+    lock_timeout = 5
+    lock_sleep_seconds = 0.001
+
+    @property
+    def cache(self):
+        return caches[settings.RATE_LIMIT_CACHE_NAME]
+
+    def consume(self, key, tokens, rate, capacity):
+        cache = self.cache
+        cache_key = 'pymess-rate-limit:{}'.format(key)
+        lock_key = '{}:lock'.format(cache_key)
+        while not cache.add(lock_key, True, timeout=self.lock_timeout):
+            time.sleep(self.lock_sleep_seconds)
+        try:
+            state, wait_seconds = self._consume_tokens(cache.get(cache_key), tokens, rate, capacity)
+            # bucket is full again after capacity / rate seconds, missing state is the full bucket
+            cache.set(cache_key, state, timeout=int(capacity / rate) + 1)
+            return wait_seconds
+        finally:
+            cache.delete(lock_key)
+
+
+_rate_limit_stores = {}
+
+
+def get_rate_limit_store():
+    """
+    Return store defined with PYMESS_RATE_LIMIT_STORE, one store instance is shared in the process.
+    """
+    store_path = settings.RATE_LIMIT_STORE
+    if store_path not in _rate_limit_stores:
+        _rate_limit_stores[store_path] = import_string(store_path)()
+    return _rate_limit_stores[store_path]
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter of one backend. Number of sent messages and number of requests to the provider can be
+    limited separately, bucket capacity (burst) is by default the number of tokens added in one second.
+    """
+
+    def __init__(self, key, messages_per_second=None, requests_per_second=None, messages_burst=None,
+                 requests_burst=None, store=None):
+        self.key = key
+        self.store = store
+        self.buckets = {
+            bucket_name: (rate, burst or max(rate, 1))
+            for bucket_name, rate, burst in (
+                ('messages', messages_per_second, messages_burst),
+                ('requests', requests_per_second, requests_burst),
+            )
+            if rate
+        }
+
+    def get_store(self):
+        return self.store or get_rate_limit_store()
+
+    def _acquire_bucket(self, bucket_name, tokens, sleep):
+        rate, capacity = self.buckets[bucket_name]
+        bucket_key = '{}:{}'.format(self.key, bucket_name)
+        while tokens > 0:
+            # more tokens than the capacity of the bucket would never be available, they are consumed in parts
+            consumed_tokens = min(tokens, capacity)
+            while True:
+                wait_seconds = self.get_store().consume(bucket_key, consumed_tokens, rate, capacity)
+                if not wait_seconds:
+                    break
+                sleep(wait_seconds)
+            tokens -= consumed_tokens
+
+    def acquire(self, number_of_messages, number_of_requests, sleep=None):
+        """
+        Wait until the messages can be sent.
+        :param number_of_messages: number of sent messages
+        :param number_of_requests: number of requests sent to the provider
+        :param sleep: function used for waiting, time.sleep is used by default
+        """
+        sleep = sleep or time.sleep
+        for bucket_name, tokens in (('messages', number_of_messages), ('requests', number_of_requests)):
+            if bucket_name in self.buckets and tokens:
+                self._acquire_bucket(bucket_name, tokens, sleep)
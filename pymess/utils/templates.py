@@ -0,0 +1,199 @@
+import pickle
+
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from threading import Lock
+from time import monotonic
+
+from django.db.models import Q
+from django.template import Template
+
+from pymess.config import settings
+from pymess.utils import chunked
+
+
+class CompiledTemplateCache:
+    """
+    LRU cache of compiled Django templates. Templates are stored with a key which identifies the template instance
+    (model label, primary key, time of the last change, version) and the source text therefore changed template is
+    never rendered from an outdated compiled template.
+    """
+
+    def __init__(self):
+        self._templates = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, source):
+        """
+        Returns compiled template from the cache or compiles the source and stores it to the cache
+        :param key: tuple which identifies the template instance, if key is None the template is not cached
+        :param source: source text of the template
+        """
+        max_size = settings.TEMPLATE_CACHE_SIZE
+        if key is None or not max_size:
+            return Template(source)
+
+        cache_key = (*key, source)
+        with self._lock:
+            template = self._templates.get(cache_key)
+            if template is not None:
+                self._templates.move_to_end(cache_key)
+                return template
+
+        template = Template(source)
+        with self._lock:
+            self._templates[cache_key] = template
+            while len(self._templates) > max_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def invalidate(self, label, pk):
+        """
+        Removes compiled templates of the template instance
+        :param label: model label of the template instance
+        :param pk: primary key of the template instance
+        """
+        with self._lock:
+            for cache_key in [cache_key for cache_key in self._templates if cache_key[:2] == (label, pk)]:
+                del self._templates[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+compiled_template_cache = CompiledTemplateCache()
+
+
+class TemplateRegistry:
+    """
+    Registry of message template instances used for sending templates. Templates are stored in the process memory
+    for PYMESS_TEMPLATE_REGISTRY_TTL_SECONDS with prefetched attachments, the registry is cleared if a template
+    or its related objects are changed.
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = Lock()
+
+    def _get_locales(self, locale):
+        if not settings.TEMPLATE_LOCALE_FALLBACK:
+            return [locale]
+
+        locales = [locale]
+        if locale and '-' in locale:
+            locales.append(locale.split('-')[0])
+        if locale is not None:
+            locales.append(None)
+        return locales
+
+    def _load(self, template_model, slug, locale, variant):
+        locales = self._get_locales(locale)
+        locale_filter = Q(locale__in=[locale for locale in locales if locale is not None])
+        if None in locales:
+            locale_filter |= Q(locale__isnull=True)
+
+        templates_qs = template_model.objects.filter(locale_filter, slug=slug)
+        if variant is not None:
+            templates_qs = templates_qs.filter(variant=variant)
+        if hasattr(template_model, 'template_attachments'):
+            templates_qs = templates_qs.prefetch_related('template_attachments')
+
+        templates = list(templates_qs)
+        for template_locale in locales:
+            locale_templates = [template for template in templates if template.locale == template_locale]
+            if len(locale_templates) > 1:
+                raise template_model.MultipleObjectsReturned(
+                    'more than one {} was found'.format(template_model._meta.object_name)
+                )
+            elif locale_templates:
+                return locale_templates[0]
+        raise template_model.DoesNotExist(
+            '{} matching query does not exist.'.format(template_model._meta.object_name)
+        )
+
+    def get(self, template_model, slug, locale=None, variant=None):
+        """
+        Returns template instance with the slug, locale and variant. If PYMESS_TEMPLATE_LOCALE_FALLBACK is turned
+        on and template with the locale does not exist, template with the language of the locale or template without
+        locale is returned.
+        :param template_model: template model class
+        :param slug: slug of the template
+        :param locale: locale of the template
+        :param variant: variant of the template, variant is not filtered if the value is None
+        """
+        ttl = settings.TEMPLATE_REGISTRY_TTL_SECONDS
+        if not ttl:
+            return self._load(template_model, slug, locale, variant)
+
+        key = (template_model._meta.label, slug, locale, variant)
+        with self._lock:
+            cached = self._templates.get(key)
+        if cached is not None and cached[0] > monotonic():
+            return cached[1]
+
+        template = self._load(template_model, slug, locale, variant)
+        if hasattr(template, 'disallowed_objects'):
+            # Cached template skips disallowed objects query of messages without disallowed objects
+            template.has_disallowed_objects = template.disallowed_objects.model.objects.filter(
+                Q(template=template) | Q(template__isnull=True)
+            ).exists()
+        with self._lock:
+            self._templates[key] = (monotonic() + ttl, template)
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+template_registry = TemplateRegistry()
+
+
+_render_worker_template = None
+
+
+def _init_render_worker(pickled_template):
+    global _render_worker_template
+
+    import django
+    django.setup()
+    _render_worker_template = pickle.loads(pickled_template)
+
+
+def _render_messages_data(recipients_data, tag, kwargs):
+    return [
+        _render_worker_template.get_message_data(
+            recipient, context_data, related_objects=related_objects, tag=tag, **kwargs
+        )
+        for recipient, context_data, related_objects in recipients_data
+    ]
+
+
+def render_messages_data_in_processes(template, recipients_data, tag=None, processes=None, chunk_size=None, **kwargs):
+    """
+    Renders messages data (template get_message_data method) in a pool of processes. Every process holds its own
+    copy of the template with compiled templates. Rendered data are yielded in the order of recipients as soon as
+    the chunk is rendered, the number of chunks rendered at once is limited therefore memory usage is bounded.
+    :param template: template instance
+    :param recipients_data: iterable of tuples (recipient, context_data, related_objects), context data must be
+        picklable
+    :param tag: string mark that will be saved with messages
+    :param processes: number of processes, PYMESS_TEMPLATE_RENDER_PROCESSES is used by default
+    :param chunk_size: number of messages rendered by one task, PYMESS_TEMPLATE_RENDER_CHUNK_SIZE is used by default
+    :param kwargs: extra attributes that will be stored with messages
+    """
+    processes = processes or settings.TEMPLATE_RENDER_PROCESSES
+    chunk_size = chunk_size or settings.TEMPLATE_RENDER_CHUNK_SIZE
+
+    # Processes are spawned because forked process would share DB connections with the parent process
+    with ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'),
+                             initializer=_init_render_worker, initargs=(pickle.dumps(template),)) as executor:
+        futures = deque()
+        for recipients_data_chunk in chunked(recipients_data, chunk_size):
+            futures.append(executor.submit(_render_messages_data, recipients_data_chunk, tag, kwargs))
+            if len(futures) > 2 * processes:
+                yield from futures.popleft().result()
+        while futures:
+            yield from futures.popleft().result()
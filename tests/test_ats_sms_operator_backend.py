@@ -0,0 +1,60 @@
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from asgiref.sync import async_to_sync
+
+from pymess.backend.sms.ats_sms_operator import ATSSMSBackend, AtsState
+from pymess.enums import OutputSMSMessageState
+from pymess.models.sms import OutputSMSMessage
+
+
+@pytest.fixture
+def backend():
+    return ATSSMSBackend(config={
+        'USERNAME': 'user',
+        'PASSWORD': 'pass',
+        'UNIQ_PREFIX': 'pref',
+        'PROJECT_KEYWORD': 'KEYWORD',
+        'OUTPUT_SENDER_NUMBER': '+420111111111',
+        'URL': 'https://ats.example',
+        'TIMEOUT': 1,
+    })
+
+
+@pytest.mark.django_db
+class TestATSSMSBackend:
+
+    def test_apublish_messages_should_send_requests_with_async_client(self, backend):
+        sms, rejected_sms, invalid_sms = (
+            OutputSMSMessage.objects.create(
+                recipient='+420111111111',
+                content='sms',
+                state=OutputSMSMessageState.WAITING,
+            )
+            for _ in range(3)
+        )
+
+        client = Mock(post=AsyncMock(side_effect=[
+            Mock(status_code=200, text=(
+                f'<status><code uniq="pref-{sms.pk}">{AtsState.OK.value}</code>'
+                f'<code uniq="pref-{rejected_sms.pk}">{AtsState.NO_SENDER.value}</code></status>'
+            )),
+            Mock(status_code=500, text=''),
+        ]))
+        with patch.object(backend, 'get_async_http_client', return_value=client):
+            async_to_sync(backend.apublish_messages)([sms, rejected_sms])
+            async_to_sync(backend.apublish_message)(invalid_sms)
+
+        assert [call.args[0] for call in client.post.call_args_list] == [backend.config['URL']] * 2
+        assert f'pref-{sms.pk}' in client.post.call_args_list[0].kwargs['content'].decode('utf-8')
+        sms.refresh_from_db()
+        assert sms.state == OutputSMSMessageState.SENDING
+        assert sms.sent_at is not None
+        assert sms.number_of_send_attempts == 1
+        rejected_sms.refresh_from_db()
+        assert rejected_sms.state == OutputSMSMessageState.ERROR
+        assert rejected_sms.error == AtsState.NO_SENDER.label
+        invalid_sms.refresh_from_db()
+        assert invalid_sms.state == OutputSMSMessageState.ERROR
+        assert invalid_sms.error == 'ATS operator returned invalid response status code: 500'
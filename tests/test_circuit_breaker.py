@@ -0,0 +1,115 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.utils.timezone import now
+
+from pymess.backend.sms import SMSController
+from pymess.backend.sms.dummy import DummySMSBackend
+from pymess.enums import OutputSMSMessageState
+from pymess.management.commands.send_messages_batch import Command
+from pymess.models.sms import OutputSMSMessage
+from pymess.utils.circuit_breaker import CircuitBreaker, CircuitBreakerState
+
+
+class TestCircuitBreaker:
+
+    def test_breaker_should_open_after_failure_rate_exceeds_threshold(self):
+        breaker = CircuitBreaker(failure_rate_threshold=0.5, minimum_number_of_calls=4)
+
+        for is_success in (False, False, True):
+            breaker.record(is_success)
+        assert breaker.state == CircuitBreakerState.CLOSED
+        breaker.record(False)
+        assert breaker.state == CircuitBreakerState.OPEN
+        assert not breaker.allow_request()
+
+    def test_breaker_should_allow_probe_after_open_interval(self):
+        clock = [100]
+        breaker = CircuitBreaker(minimum_number_of_calls=1, open_seconds=30, half_open_max_calls=1)
+
+        with patch('pymess.utils.circuit_breaker.monotonic', side_effect=lambda: clock[0]):
+            breaker.record(False)
+            clock[0] += 10
+            assert not breaker.allow_request()
+            assert breaker.get_open_remaining_seconds() == 20
+
+            clock[0] += 20
+            assert breaker.allow_request()
+            assert breaker.state == CircuitBreakerState.HALF_OPEN
+            assert not breaker.allow_request()
+            assert breaker.get_open_remaining_seconds() == 30
+            breaker.record(False)
+            assert breaker.state == CircuitBreakerState.OPEN
+
+            clock[0] += 30
+            assert breaker.allow_request()
+            breaker.record(True)
+            assert breaker.state == CircuitBreakerState.CLOSED
+            assert breaker.allow_request()
+
+
+@pytest.mark.django_db
+class TestBackendCircuitBreaker:
+
+    def test_batch_sender_should_defer_messages_while_circuit_breaker_is_open(self, settings):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        settings.PYMESS_SMS_BACKENDS = {
+            'default': {
+                'backend': 'pymess.backend.sms.dummy.DummySMSBackend',
+                'circuit_breaker': {'minimum_number_of_calls': 2, 'open_seconds': 30},
+            }
+        }
+        messages = [
+            OutputSMSMessage.objects.create(
+                recipient='+420123456789', content='content', state=OutputSMSMessageState.WAITING
+            )
+            for _ in range(4)
+        ]
+
+        def publish_message(backend, message):
+            backend._update_message_after_sending_error(message, error='error')
+
+        stdout = StringIO()
+        with patch.dict(Command.controllers, {'sms': SMSController()}):
+            with patch.object(DummySMSBackend, 'publish_message', autospec=True, side_effect=publish_message):
+                call_command('send_messages_batch', type='sms', claim_size=1, stdout=stdout)
+
+        for message in messages:
+            message.refresh_from_db()
+        assert [message.state for message in messages] == [
+            OutputSMSMessageState.ERROR_RETRY, OutputSMSMessageState.ERROR_RETRY,
+            OutputSMSMessageState.WAITING, OutputSMSMessageState.WAITING,
+        ]
+        assert [message.number_of_send_attempts for message in messages] == [1, 1, 0, 0]
+        assert all(message.next_attempt_at > now() for message in messages[2:])
+        assert 'failed messages: 2' in stdout.getvalue()
+        assert 'deferred messages: 2' in stdout.getvalue()
+
+    def test_batch_sender_should_defer_messages_refused_by_half_open_circuit_breaker(self, settings):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        settings.PYMESS_SMS_BACKENDS = {
+            'default': {
+                'backend': 'pymess.backend.sms.dummy.DummySMSBackend',
+                'circuit_breaker': {'open_seconds': 30, 'half_open_max_calls': 1},
+            }
+        }
+        message = OutputSMSMessage.objects.create(
+            recipient='+420123456789', content='content', state=OutputSMSMessageState.WAITING
+        )
+        controller = SMSController()
+        circuit_breaker = controller.get_backend(message.recipient).circuit_breaker
+        circuit_breaker.state = CircuitBreakerState.HALF_OPEN
+        circuit_breaker._half_open_calls = 1
+
+        with patch.dict(Command.controllers, {'sms': controller}):
+            with patch.object(DummySMSBackend, 'publish_message') as mock_publish_message:
+                call_command('send_messages_batch', type='sms', stdout=StringIO())
+
+        mock_publish_message.assert_not_called()
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.WAITING
+        assert message.number_of_send_attempts == 0
+        assert message.next_attempt_at > now() + timedelta(seconds=29)
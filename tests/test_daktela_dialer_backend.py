@@ -0,0 +1,154 @@
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+import requests
+
+from asgiref.sync import async_to_sync
+
+from pymess.backend.dialer.daktela import DaktelaDialerBackend
+from pymess.enums import DialerMessageState
+from pymess.models import DialerMessage
+
+
+@pytest.fixture
+def backend():
+    return DaktelaDialerBackend(config={
+        'ACCESS_TOKEN': 'token',
+        'URL': 'https://daktela.example/api/v6/campaignsRecords',
+        'AUTODIALER_RECORD_TYPE': 'autodialer',
+        'STATUS_CHECK_WORKERS': 4,
+    })
+
+
+def get_status_response(action, statuses=(), status_code=200, error=()):
+    response = Mock(status_code=status_code)
+    response.json.return_value = {
+        'result': {'action': action, 'statuses': [{'name': status} for status in statuses]},
+        'error': list(error),
+    }
+    return response
+
+
+@pytest.mark.django_db
+class TestDaktelaDialerBackend:
+
+    def test_update_dialer_states_should_update_states_of_messages_with_bulk_update(
+            self, backend, django_assert_num_queries):
+        final_message = DialerMessage.objects.create(
+            recipient='+420111111111',
+            content='Dialer content',
+            state=DialerMessageState.READY,
+            extra_data={'name': 'record-1'},
+        )
+        ready_message = DialerMessage.objects.create(
+            recipient='+420111111111',
+            content='Dialer content',
+            state=DialerMessageState.READY,
+            extra_data={'name': 'record-2'},
+        )
+        responses = {
+            backend._get_dialer_api_url('record-1'): get_status_response('5', statuses=('4',)),
+            backend._get_dialer_api_url('record-2'): get_status_response('1'),
+        }
+
+        with patch('pymess.backend.dialer.daktela.generate_session') as generate_session_mock:
+            generate_session_mock.return_value.get.side_effect = lambda url: responses[url]
+            with django_assert_num_queries(1):
+                backend._update_dialer_states([final_message, ready_message])
+
+        assert generate_session_mock.return_value.get.call_count == 2
+        assert {call.kwargs['adapter'] for call in generate_session_mock.call_args_list} == {backend.http_adapter}
+        final_message.refresh_from_db()
+        assert final_message.state == DialerMessageState.HANGUP
+        assert final_message.is_final_state
+        assert final_message.extra_data['daktela_action'] == '5'
+        assert final_message.backend == 'pymess.backend.dialer.daktela.DaktelaDialerBackend'
+        ready_message.refresh_from_db()
+        assert ready_message.state == DialerMessageState.READY
+        assert not ready_message.is_final_state
+
+    def test_update_dialer_states_should_isolate_failed_status_requests(self, backend):
+        failed_message = DialerMessage.objects.create(
+            recipient='+420111111111',
+            content='Dialer content',
+            state=DialerMessageState.READY,
+            extra_data={'name': 'record-1'},
+        )
+        invalid_message = DialerMessage.objects.create(
+            recipient='+420111111111',
+            content='Dialer content',
+            state=DialerMessageState.READY,
+            extra_data={'name': 'record-2'},
+        )
+        message = DialerMessage.objects.create(
+            recipient='+420111111111',
+            content='Dialer content',
+            state=DialerMessageState.READY,
+            extra_data={'name': 'record-3'},
+        )
+        responses = {
+            backend._get_dialer_api_url('record-1'): requests.exceptions.ConnectionError('connection failed'),
+            backend._get_dialer_api_url('record-2'): get_status_response(
+                '1', status_code=404, error=('record not found',)
+            ),
+            backend._get_dialer_api_url('record-3'): get_status_response('2'),
+        }
+
+        def get(url):
+            response = responses[url]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with patch('pymess.backend.dialer.daktela.generate_session') as generate_session_mock:
+            generate_session_mock.return_value.get.side_effect = get
+            backend._update_dialer_states([failed_message, invalid_message, message])
+
+        failed_message.refresh_from_db()
+        assert failed_message.state == DialerMessageState.ERROR_UPDATE
+        assert failed_message.error == 'connection failed'
+        assert failed_message.number_of_status_check_attempts == 1
+        invalid_message.refresh_from_db()
+        assert invalid_message.state == DialerMessageState.ERROR_UPDATE
+        assert invalid_message.error == 'record not found'
+        message.refresh_from_db()
+        assert message.state == DialerMessageState.RESCHEDULED_BY_DIALER
+        assert message.number_of_status_check_attempts == 0
+
+    def test_apublish_message_should_send_record_with_async_client(self, backend):
+        message = DialerMessage.objects.create(
+            recipient='+420111111111',
+            content='Dialer content',
+            state=DialerMessageState.WAITING,
+            extra_data={'name': 'record-1'},
+        )
+        failed_message = DialerMessage.objects.create(
+            recipient='+420111111111',
+            content='Dialer content',
+            state=DialerMessageState.WAITING,
+            extra_data={'name': 'record-2'},
+        )
+        response = Mock(status_code=200)
+        response.json.return_value = {
+            'result': {'name': 'record-1', 'action': '1', 'statuses': []},
+            'error': [],
+        }
+        client = Mock(post=AsyncMock(side_effect=[response, ConnectionError('connection failed')]))
+
+        with patch.object(backend, 'get_async_http_client', return_value=client):
+            async_to_sync(backend.apublish_message)(message)
+            async_to_sync(backend.apublish_message)(failed_message)
+
+        assert client.post.call_args_list[0].args[0] == backend._get_dialer_api_url()
+        assert client.post.call_args_list[0].kwargs['json'] == {
+            'record_type': 'autodialer',
+            'number': '00420111111111',
+            'customFields': {'autodialer_text': ['Dialer content']},
+        }
+        message.refresh_from_db()
+        assert message.state == DialerMessageState.READY
+        assert message.sent_at is not None
+        assert message.extra_data['daktela_action'] == '1'
+        failed_message.refresh_from_db()
+        assert failed_message.state == DialerMessageState.ERROR
+        assert failed_message.error == 'connection failed'
@@ -0,0 +1,61 @@
+import pytest
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.core.files.base import ContentFile
+
+from pymess.backend.emails import EmailController, asend
+from pymess.enums import EmailMessageState
+from pymess.models.emails import EmailMessage
+
+
+@pytest.mark.django_db
+class TestEmailController:
+
+    def test_bulk_send_should_create_messages_with_content_files_and_attachments(self):
+        messages = EmailController().bulk_send(
+            ['first@example.com', 'second@example.com'],
+            'Test Content',
+            sender='sender@example.com',
+            sender_name='Sender',
+            subject='Test Subject',
+            attachments=[('attachment.txt', ContentFile(b'attachment'), 'text/plain')],
+        )
+
+        assert len(messages) == 2
+        for message in EmailMessage.objects.filter(pk__in=[message.pk for message in messages]):
+            assert message.content == 'Test Content'
+            assert message.subject == 'Test Subject'
+            assert message.state == EmailMessageState.DEBUG
+            assert message.attachments.count() == 1
+
+    def test_bulk_send_should_not_create_messages_if_attachment_creation_fails(self):
+        with patch('pymess.models.emails.AttachmentManager.create_from_tripple', side_effect=OSError('disk full')):
+            with pytest.raises(OSError):
+                EmailController().bulk_send(
+                    ['first@example.com', 'second@example.com'],
+                    'Test Content',
+                    sender='sender@example.com',
+                    sender_name='Sender',
+                    subject='Test Subject',
+                    attachments=[('attachment.txt', ContentFile(b'attachment'), 'text/plain')],
+                )
+
+        assert not EmailMessage.objects.exists()
+
+    def test_asend_should_create_message_with_attachments_and_publish_it(self):
+        is_failed = async_to_sync(asend)(
+            sender='sender@example.com',
+            recipient='first@example.com',
+            subject='Test Subject',
+            content='Test Content',
+            attachments=[('attachment.txt', ContentFile(b'attachment'), 'text/plain')],
+        )
+
+        assert is_failed is False
+        message = EmailMessage.objects.get()
+        assert message.state == EmailMessageState.DEBUG
+        attachment = message.attachments.get()
+        assert attachment.filename == 'attachment.txt'
+        assert attachment.content_type == 'text/plain'
+        assert attachment.file.read() == b'attachment'
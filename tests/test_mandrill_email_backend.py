@@ -0,0 +1,120 @@
+import sys
+import types
+from unittest.mock import Mock, patch
+
+import pytest
+from django.core.files.base import ContentFile
+from django.db.models.fields.files import FieldFile
+
+mandrill_stub = types.ModuleType('mandrill')
+mandrill_stub.Error = type('Error', (Exception,), {})
+mandrill_stub.UnknownMessageError = type('UnknownMessageError', (mandrill_stub.Error,), {})
+mandrill_stub.Mandrill = Mock()
+sys.modules.setdefault('mandrill', mandrill_stub)
+
+from pymess.backend.emails import mandrill as mandrill_backend  # noqa: E402
+from pymess.backend.emails.mandrill import MandrillEmailBackend  # noqa: E402
+from pymess.enums import EmailMessageState  # noqa: E402
+from pymess.models.emails import EmailMessage  # noqa: E402
+
+
+@pytest.fixture
+def backend():
+    return MandrillEmailBackend(config={'KEY': 'key'})
+
+
+@pytest.mark.django_db
+class TestMandrillEmailBackend:
+
+    def test_publish_messages_should_group_messages_with_the_same_content(self, backend):
+        messages = []
+        for recipient, attachment_content in (('first@example.com', b'attachment'),
+                                              ('second@example.com', b'attachment'),
+                                              ('FIRST@example.com', b'attachment'),
+                                              ('third@example.com', b'other attachment')):
+            message = EmailMessage.objects.create(
+                recipient=recipient,
+                sender='sender@example.com',
+                subject='Subject',
+                content='Content',
+                state=EmailMessageState.WAITING,
+            )
+            message.attachments.create_from_tripple(
+                ('attachment.txt', ContentFile(attachment_content), 'text/plain')
+            )
+            messages.append(message)
+
+        with patch.object(FieldFile, 'open', autospec=True, side_effect=FieldFile.open) as mock_open:
+            assert backend.get_number_of_publish_requests(messages) == 3
+            with patch.object(backend, '_create_client') as mock_create_client:
+                mock_create_client.return_value.messages.send.side_effect = lambda message: [
+                    {'email': recipient['email'].upper(), 'status': 'sent', '_id': recipient['email'].upper()}
+                    for recipient in message['to']
+                ]
+                backend.publish_messages(messages)
+
+        # every attachment file is read only once
+        assert mock_open.call_count == len(messages)
+        mock_send = mock_create_client.return_value.messages.send
+        sent_messages = [call.kwargs['message'] for call in mock_send.call_args_list]
+        assert [[recipient['email'] for recipient in message['to']] for message in sent_messages] == [
+            ['first@example.com', 'second@example.com'], ['FIRST@example.com'], ['third@example.com']
+        ]
+        assert sent_messages[0]['preserve_recipients'] is False
+        assert sent_messages[0]['attachments'] == [
+            {'type': 'text/plain', 'name': 'attachment.txt', 'content': 'YXR0YWNobWVudA=='}
+        ]
+        for message in messages:
+            message.refresh_from_db()
+            assert message.state == EmailMessageState.SENT
+            assert message.external_id == message.recipient.upper()
+
+    def test_publish_messages_should_pair_results_with_messages_by_email(self, backend):
+        sent_message, rejected_message, missing_message = (
+            EmailMessage.objects.create(
+                recipient=recipient,
+                sender='sender@example.com',
+                subject='Subject',
+                content='Content',
+                state=EmailMessageState.WAITING,
+            )
+            for recipient in ('sent@example.com', 'Rejected@example.com', 'missing@example.com')
+        )
+
+        with patch.object(backend, '_create_client') as mock_create_client:
+            mock_create_client.return_value.messages.send.return_value = [
+                {'email': 'rejected@example.com', 'status': 'rejected', '_id': 'rejected', 'reject_reason': 'spam'},
+                {'email': 'sent@example.com', 'status': 'sent', '_id': 'sent'},
+            ]
+            backend.publish_messages([sent_message, rejected_message, missing_message])
+
+        sent_message.refresh_from_db()
+        assert sent_message.state == EmailMessageState.SENT
+        assert sent_message.external_id == 'sent'
+        rejected_message.refresh_from_db()
+        assert rejected_message.state == EmailMessageState.ERROR
+        assert rejected_message.error == 'rejected, mandrill message: "spam"'
+        missing_message.refresh_from_db()
+        assert missing_message.state == EmailMessageState.ERROR
+        assert missing_message.error == 'mandrill result of the recipient is missing'
+
+    def test_publish_messages_should_set_error_to_all_messages_of_failed_group(self, backend):
+        messages = [
+            EmailMessage.objects.create(
+                recipient=recipient,
+                sender='sender@example.com',
+                subject='Subject',
+                content='Content',
+                state=EmailMessageState.WAITING,
+            )
+            for recipient in ('first@example.com', 'second@example.com')
+        ]
+
+        with patch.object(backend, '_create_client') as mock_create_client:
+            mock_create_client.return_value.messages.send.side_effect = mandrill_backend.mandrill.Error('failed')
+            backend.publish_messages(messages)
+
+        for message in messages:
+            message.refresh_from_db()
+            assert message.state == EmailMessageState.ERROR
+            assert message.error == 'failed'
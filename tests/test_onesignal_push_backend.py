@@ -0,0 +1,161 @@
+import sys
+import types
+from unittest.mock import Mock, patch
+
+import pytest
+
+onesignal_stub = types.ModuleType('onesignal')
+onesignal_stub.DeviceNotification = Mock(IOS_BADGE_TYPE_INCREASE='Increase')
+onesignal_stub.OneSignalClient = Mock()
+onesignal_stub.errors = types.ModuleType('onesignal.errors')
+onesignal_stub.errors.OneSignalAPIError = type('OneSignalAPIError', (Exception,), {})
+sys.modules.setdefault('onesignal', onesignal_stub)
+sys.modules.setdefault('onesignal.errors', onesignal_stub.errors)
+
+from pymess.backend.push import onesignal as onesignal_backend  # noqa: E402
+from pymess.backend.push.onesignal import OneSignalPushNotificationBackend  # noqa: E402
+from pymess.enums import PushNotificationMessageState  # noqa: E402
+from pymess.models.push import PushNotificationMessage  # noqa: E402
+
+
+@pytest.fixture
+def backend():
+    return OneSignalPushNotificationBackend(config={'APP_ID': 'app', 'API_KEY': 'key'})
+
+
+@pytest.mark.django_db
+class TestOneSignalPushNotificationBackend:
+
+    def test_group_messages_with_the_same_content_should_group_by_content_key(self, backend):
+        first_message, second_message, other_heading_message, other_data_message = (
+            PushNotificationMessage.objects.create(
+                recipient=recipient,
+                content='Content',
+                heading=heading,
+                redirect_url=redirect_url,
+                state=PushNotificationMessageState.WAITING,
+            )
+            for recipient, heading, redirect_url in (
+                ('first', 'Heading', None),
+                ('second', 'Heading', None),
+                ('third', 'Other heading', None),
+                ('first', 'Heading', '/redirect'),
+            )
+        )
+        messages = [first_message, second_message, other_heading_message, other_data_message]
+
+        assert backend._group_messages_with_the_same_content(messages) == [
+            [first_message, second_message], [other_heading_message], [other_data_message]
+        ]
+        assert backend.get_number_of_publish_requests(messages) == 3
+
+    def test_group_messages_with_the_same_content_should_split_duplicate_recipients(self, backend):
+        first_message, duplicate_message, second_message = (
+            PushNotificationMessage.objects.create(
+                recipient=recipient,
+                content='Content',
+                heading='Heading',
+                state=PushNotificationMessageState.WAITING,
+            )
+            for recipient in ('first', 'first', 'second')
+        )
+
+        assert backend._group_messages_with_the_same_content([first_message, duplicate_message, second_message]) == [
+            [first_message, second_message], [duplicate_message]
+        ]
+
+    def test_publish_messages_should_send_group_with_one_request_and_bulk_update_results(
+            self, backend, django_assert_num_queries):
+        messages = [
+            PushNotificationMessage.objects.create(
+                recipient=recipient,
+                content='Content',
+                heading='Heading',
+                state=PushNotificationMessageState.WAITING,
+            )
+            for recipient in ('first', 'second')
+        ]
+
+        with patch.object(backend, '_create_client') as mock_create_client, \
+                patch.object(backend, '_create_notification') as mock_create_notification:
+            mock_create_client.return_value.send.return_value = Mock(
+                is_error=False, errors=None, body={'id': 'notification'}
+            )
+            with django_assert_num_queries(1):
+                backend.publish_messages(messages)
+
+        mock_create_client.return_value.send.assert_called_once_with(mock_create_notification.return_value)
+        mock_create_notification.assert_called_once_with(messages[0], ('first', 'second'))
+        for message in messages:
+            message.refresh_from_db()
+            assert message.state == PushNotificationMessageState.SENT
+            assert message.sent_at is not None
+            assert message.extra_sender_data['result'] == {'id': 'notification'}
+
+    def test_publish_messages_should_fail_only_invalid_external_user_ids(self, backend):
+        valid_message, invalid_message = (
+            PushNotificationMessage.objects.create(
+                recipient=recipient,
+                content='Content',
+                heading='Heading',
+                state=PushNotificationMessageState.WAITING,
+            )
+            for recipient in ('valid', 'invalid')
+        )
+
+        with patch.object(backend, '_create_client') as mock_create_client, \
+                patch.object(backend, '_create_notification'):
+            mock_create_client.return_value.send.return_value = Mock(
+                is_error=False, errors={'invalid_external_user_ids': ['invalid']}, body={'id': 'notification'}
+            )
+            backend.publish_messages([valid_message, invalid_message])
+
+        valid_message.refresh_from_db()
+        assert valid_message.state == PushNotificationMessageState.SENT
+        invalid_message.refresh_from_db()
+        assert invalid_message.state == PushNotificationMessageState.ERROR
+        assert invalid_message.error == str({'invalid_external_user_ids': ['invalid']})
+
+    def test_publish_messages_should_fail_whole_group_with_error_not_related_to_recipients(self, backend):
+        messages = [
+            PushNotificationMessage.objects.create(
+                recipient=recipient,
+                content='Content',
+                heading='Heading',
+                state=PushNotificationMessageState.WAITING,
+            )
+            for recipient in ('first', 'second')
+        ]
+
+        with patch.object(backend, '_create_client') as mock_create_client, \
+                patch.object(backend, '_create_notification'):
+            mock_create_client.return_value.send.return_value = Mock(
+                is_error=True, errors=['Notification content is invalid'], body={}
+            )
+            backend.publish_messages(messages)
+
+        for message in messages:
+            message.refresh_from_db()
+            assert message.state == PushNotificationMessageState.ERROR
+            assert message.error == str(['Notification content is invalid'])
+
+    def test_publish_messages_should_set_error_to_all_messages_of_failed_request(self, backend):
+        messages = [
+            PushNotificationMessage.objects.create(
+                recipient=recipient,
+                content='Content',
+                heading='Heading',
+                state=PushNotificationMessageState.WAITING,
+            )
+            for recipient in ('first', 'second')
+        ]
+
+        with patch.object(backend, '_create_client') as mock_create_client, \
+                patch.object(backend, '_create_notification'):
+            mock_create_client.return_value.send.side_effect = onesignal_backend.OneSignalAPIError('failed')
+            backend.publish_messages(messages)
+
+        for message in messages:
+            message.refresh_from_db()
+            assert message.state == PushNotificationMessageState.ERROR
+            assert message.error == 'failed'
@@ -0,0 +1,96 @@
+from io import StringIO
+from unittest.mock import Mock, patch
+
+import pytest
+from django.core.management import call_command
+
+from pymess.backend.sms import SMSController
+from pymess.enums import OutputSMSMessageState
+from pymess.management.commands.send_messages_batch import Command
+from pymess.models.sms import OutputSMSMessage
+from pymess.utils.rate_limit import CacheRateLimitStore, InMemoryRateLimitStore, RateLimiter, get_rate_limit_store
+
+
+class TestRateLimiter:
+
+    @pytest.mark.parametrize('store_class', [InMemoryRateLimitStore, CacheRateLimitStore])
+    def test_store_should_consume_tokens_up_to_capacity_and_refill_them_with_rate(self, store_class):
+        store = store_class()
+        with patch('pymess.utils.rate_limit.time.time', return_value=100):
+            assert store.consume('test-bucket', 3, rate=2, capacity=4) == 0
+            assert store.consume('test-bucket', 1, rate=2, capacity=4) == 0
+            assert store.consume('test-bucket', 3, rate=2, capacity=4) == 1.5
+        with patch('pymess.utils.rate_limit.time.time', return_value=101.5):
+            assert store.consume('test-bucket', 3, rate=2, capacity=4) == 0
+            assert store.consume('other-bucket', 4, rate=2, capacity=4) == 0
+
+    def test_acquire_should_wait_for_message_and_request_tokens(self):
+        store = Mock(consume=Mock(side_effect=[0.5, 0, 0, 0]))
+        sleep = Mock()
+
+        RateLimiter('SMS.default', messages_per_second=10, requests_per_second=1, store=store).acquire(
+            15, 1, sleep=sleep
+        )
+
+        sleep.assert_called_once_with(0.5)
+        # messages exceeding the burst are consumed in capacity-sized parts
+        assert [call.args for call in store.consume.call_args_list] == [
+            ('SMS.default:messages', 10, 10, 10),
+            ('SMS.default:messages', 10, 10, 10),
+            ('SMS.default:messages', 5, 10, 10),
+            ('SMS.default:requests', 1, 1, 1),
+        ]
+
+    def test_acquire_should_limit_rate_of_chunks_larger_than_burst(self):
+        clock = [100]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        rate_limiter = RateLimiter('SMS.default', messages_per_second=10, store=InMemoryRateLimitStore())
+        with patch('pymess.utils.rate_limit.time.time', side_effect=lambda: clock[0]):
+            for _ in range(5):
+                rate_limiter.acquire(100, 1, sleep=sleep)
+
+        # burst of 10 messages is sent immediately, the rest of 500 messages is limited to 10 messages per second
+        assert clock[0] - 100 == pytest.approx(49)
+
+
+@pytest.mark.django_db
+class TestBackendRateLimit:
+
+    @pytest.fixture(autouse=True)
+    def in_memory_store(self, settings):
+        settings.PYMESS_RATE_LIMIT_STORE = 'pymess.utils.rate_limit.InMemoryRateLimitStore'
+        yield
+        get_rate_limit_store().clear()
+
+    def test_batch_sender_should_wait_for_rate_limit_of_backend(self, settings):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        settings.PYMESS_SMS_BACKENDS = {
+            'default': {
+                'backend': 'pymess.backend.sms.dummy.DummySMSBackend',
+                'rate_limit': {'messages_per_second': 2},
+            }
+        }
+        messages = [
+            OutputSMSMessage.objects.create(
+                recipient='+420123456789', content='content', state=OutputSMSMessageState.WAITING
+            )
+            for _ in range(3)
+        ]
+        clock = [100]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        with patch.dict(Command.controllers, {'sms': SMSController()}):
+            with patch('pymess.utils.rate_limit.time.time', side_effect=lambda: clock[0]):
+                with patch('pymess.utils.rate_limit.time.sleep', side_effect=sleep) as mock_sleep:
+                    call_command('send_messages_batch', type='sms', stdout=StringIO())
+
+        # burst of two messages is sent immediately, the third message waits for the token
+        mock_sleep.assert_called_once_with(0.5)
+        for message in messages:
+            message.refresh_from_db()
+            assert message.state == OutputSMSMessageState.DEBUG
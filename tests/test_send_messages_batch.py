@@ -0,0 +1,371 @@
+from datetime import timedelta
+from io import StringIO
+from threading import Barrier
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from pymess.backend.sms import SMSController
+from pymess.backend.sms.dummy import DummySMSBackend
+from pymess.enums import OutputSMSMessageState
+from pymess.management.commands.send_messages_batch import Command
+from pymess.models import DialerMessage, EmailMessage, OutputSMSMessage, PushNotificationMessage
+from pymess.models.common import get_queue_ordering, get_queue_states
+
+
+class ConfiguredAttemptsSMSBackend(DummySMSBackend):
+
+    def __init__(self, config):
+        super().__init__(config)
+
+    def get_batch_max_number_of_send_attempts(self):
+        return self.config['MAX_NUMBER_OF_SEND_ATTEMPTS']
+
+
+def create_sms(**kwargs):
+    return OutputSMSMessage.objects.create(**{
+        'recipient': '+420123456789',
+        'content': 'content',
+        'state': OutputSMSMessageState.WAITING,
+        **kwargs,
+    })
+
+
+@pytest.fixture(autouse=True)
+def sms_batch_sending(settings):
+    settings.PYMESS_SMS_BATCH_SENDING = True
+    # controllers cache loaded backends, every test must use its own controller
+    with patch.dict(Command.controllers, {'sms': SMSController()}):
+        yield
+
+
+@pytest.mark.django_db
+class TestSendMessagesBatchCommand:
+
+    def test_command_should_send_waiting_messages_in_claimed_chunks(self):
+        messages = [create_sms() for _ in range(5)]
+
+        with patch.object(SMSController, 'claim_waiting_or_retry_messages',
+                          autospec=True, side_effect=SMSController.claim_waiting_or_retry_messages) as mock_claim:
+            call_command('send_messages_batch', type='sms', claim_size=2, stdout=StringIO())
+
+        assert [call.args[1] for call in mock_claim.call_args_list] == [2, 2, 2]
+        for message in messages:
+            message.refresh_from_db()
+            assert message.state == OutputSMSMessageState.DEBUG
+
+    def test_command_should_send_at_most_batch_size_messages(self, settings):
+        settings.PYMESS_SMS_BATCH_SIZE = 3
+        messages = [create_sms() for _ in range(5)]
+
+        call_command('send_messages_batch', type='sms', claim_size=2, stdout=StringIO())
+
+        assert OutputSMSMessage.objects.filter(state=OutputSMSMessageState.DEBUG).count() == 3
+        assert OutputSMSMessage.objects.filter(state=OutputSMSMessageState.WAITING).count() == 2
+        assert set(
+            OutputSMSMessage.objects.filter(state=OutputSMSMessageState.DEBUG).values_list('pk', flat=True)
+        ) == {message.pk for message in messages[:3]}
+
+    def test_claim_should_order_messages_by_priority(self):
+        low_priority_message = create_sms(priority=3)
+        high_priority_message = create_sms(priority=1)
+
+        controller = SMSController()
+
+        assert controller.claim_waiting_or_retry_messages(2) == [high_priority_message, low_priority_message]
+        controller.release_messages([high_priority_message, low_priority_message])
+        assert controller.claim_waiting_or_retry_messages(
+            2, exclude_pks={high_priority_message.pk}
+        ) == [low_priority_message]
+
+    def test_claim_should_lease_messages_and_skip_leased_ones(self):
+        message = create_sms()
+        controller = SMSController()
+
+        assert controller.claim_waiting_or_retry_messages(1) == [message]
+        message.refresh_from_db()
+        assert message.lease_expires_at is not None
+        assert controller.claim_waiting_or_retry_messages(1) == []
+
+        controller.release_messages([message])
+        message.refresh_from_db()
+        assert message.lease_expires_at is None
+        assert controller.claim_waiting_or_retry_messages(1) == [message]
+
+    def test_claim_should_reclaim_messages_with_expired_lease(self):
+        message = create_sms(lease_expires_at=now() - timedelta(seconds=1))
+
+        assert SMSController().claim_waiting_or_retry_messages(1) == [message]
+
+    def test_command_should_release_lease_of_sent_messages(self):
+        message = create_sms()
+
+        with patch.object(SMSController, 'publish_messages_chunk', side_effect=ValueError):
+            call_command('send_messages_batch', type='sms', stdout=StringIO())
+
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.WAITING
+        assert message.lease_expires_at is None
+
+    def test_command_in_loop_mode_should_back_off_when_queue_is_empty(self, settings):
+        settings.PYMESS_SMS_BATCH_SIZE = 2
+        messages = [create_sms() for _ in range(3)]
+
+        with patch('pymess.management.commands.send_messages_batch.Event.wait') as mock_wait:
+            with patch('pymess.management.commands.send_messages_batch.Command._is_system_shutting_down',
+                       side_effect=lambda: mock_wait.call_count >= 3):
+                call_command('send_messages_batch', type='sms', loop=True, stdout=StringIO())
+
+        # full batch is followed by the next batch immediately, sleep time is doubled when queue is empty
+        assert [call.args[0] for call in mock_wait.call_args_list] == [1, 2, 4]
+        for message in messages:
+            message.refresh_from_db()
+            assert message.state == OutputSMSMessageState.DEBUG
+
+    def test_command_with_workers_should_publish_messages_concurrently(self):
+        messages = [create_sms() for _ in range(4)]
+        barrier = Barrier(4, timeout=5)
+
+        def publish_messages_chunk(backend, messages_chunk):
+            barrier.wait()
+            for message in messages_chunk:
+                if message.pk == messages[0].pk:
+                    message.state = OutputSMSMessageState.ERROR
+
+        with patch.object(SMSController, 'publish_messages_chunk', side_effect=publish_messages_chunk):
+            stdout = StringIO()
+            call_command('send_messages_batch', type='sms', workers=4, claim_size=4, stdout=stdout)
+
+        assert 'sent messages: 3' in stdout.getvalue()
+        assert 'failed messages: 1 ({})'.format(messages[0].pk) in stdout.getvalue()
+
+    def test_command_should_defer_messages_of_failed_chunk(self, settings):
+        settings.PYMESS_RETRY_BACKOFF_JITTER = False
+        settings.PYMESS_RETRY_BACKOFF_BASE_SECONDS = 60
+        message = create_sms()
+
+        with patch.object(SMSController, 'publish_messages_chunk', side_effect=RuntimeError):
+            stdout = StringIO()
+            call_command('send_messages_batch', type='sms', stdout=stdout)
+
+        assert 'failed messages: 1 ({})'.format(message.pk) in stdout.getvalue()
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.WAITING
+        assert message.lease_expires_at is None
+        assert message.next_attempt_at >= now() + timedelta(seconds=59)
+        assert SMSController().claim_waiting_or_retry_messages(10) == []
+
+    def test_command_should_publish_messages_in_chunks_of_backend(self, settings):
+        settings.PYMESS_SMS_BACKENDS = {
+            'default': {
+                'backend': 'pymess.backend.sms.sms_operator.SMSOperatorBackend',
+                'config': {
+                    'USERNAME': 'user',
+                    'PASSWORD': 'pass',
+                    'MAX_MESSAGES_PER_REQUEST': 2,
+                }
+            }
+        }
+        settings.PYMESS_SMS_BATCH_MAX_NUMBER_OF_SEND_ATTEMPTS = 1
+        messages = [create_sms() for _ in range(4)]
+        exceeded_message = create_sms(number_of_send_attempts=2)
+
+        with patch('pymess.backend.sms.sms_operator.SMSOperatorBackend._send_requests') as mock_send_requests:
+            call_command('send_messages_batch', type='sms', claim_size=10, stdout=StringIO())
+
+        assert [call.args[0] for call in mock_send_requests.call_args_list] == [messages[:2], messages[2:]]
+        exceeded_message.refresh_from_db()
+        assert exceeded_message.state == OutputSMSMessageState.ERROR
+        assert exceeded_message.error == 'the number of send attempts exceeded the limit'
+
+    def test_backend_limit_concurrency_should_use_max_concurrency_config(self):
+        backend = DummySMSBackend(config={'MAX_CONCURRENCY': 1})
+
+        with backend.limit_concurrency():
+            assert not backend.limit_concurrency().acquire(blocking=False)
+        assert backend.limit_concurrency().acquire(blocking=False)
+
+    def test_claim_should_skip_retry_messages_before_next_attempt(self):
+        delayed_message = create_sms(
+            state=OutputSMSMessageState.ERROR_RETRY, next_attempt_at=now() + timedelta(minutes=1)
+        )
+        retry_message = create_sms(
+            state=OutputSMSMessageState.ERROR_RETRY, next_attempt_at=now() - timedelta(seconds=1)
+        )
+
+        assert SMSController().claim_waiting_or_retry_messages(2) == [retry_message]
+        assert delayed_message.pk not in SMSController().get_waiting_or_retry_messages().values_list('pk', flat=True)
+
+    def test_claim_should_skip_scheduled_messages_before_send_at(self):
+        scheduled_message = create_sms(send_at=now() + timedelta(hours=1))
+        due_message = create_sms(send_at=now() - timedelta(seconds=1))
+        message = create_sms()
+
+        assert SMSController().claim_waiting_or_retry_messages(3) == [due_message, message]
+        scheduled_message.refresh_from_db()
+        assert scheduled_message.lease_expires_at is None
+
+    def test_publish_error_should_count_age_of_scheduled_message_from_send_at(self, settings):
+        settings.PYMESS_SMS_BATCH_MAX_SECONDS_TO_SEND = 60
+        message = create_sms(send_at=now() - timedelta(seconds=30))
+        OutputSMSMessage.objects.filter(pk=message.pk).update(created_at=now() - timedelta(hours=1))
+        message.refresh_from_db()
+
+        assert SMSController()._get_publish_error(DummySMSBackend(), message) is None
+
+    def test_fail_expired_messages_should_set_messages_which_cannot_be_sent_as_failed(self, settings):
+        settings.PYMESS_SMS_BATCH_MAX_SECONDS_TO_SEND = 60
+        settings.PYMESS_SMS_BATCH_MAX_NUMBER_OF_SEND_ATTEMPTS = 2
+        settings.PYMESS_EXPIRED_MESSAGES_CHUNK_SIZE = 1
+        exhausted_message = create_sms(
+            state=OutputSMSMessageState.ERROR_RETRY, number_of_send_attempts=3,
+            backend='pymess.backend.sms.dummy.DummySMSBackend'
+        )
+        old_message = create_sms()
+        OutputSMSMessage.objects.filter(pk=old_message.pk).update(created_at=now() - timedelta(minutes=2))
+        expired_message = create_sms(expires_at=now() - timedelta(seconds=1))
+        leased_message = create_sms(
+            expires_at=now() - timedelta(seconds=1), lease_expires_at=now() + timedelta(minutes=1)
+        )
+        scheduled_message = create_sms(send_at=now() + timedelta(hours=1))
+        OutputSMSMessage.objects.filter(pk=scheduled_message.pk).update(created_at=now() - timedelta(minutes=2))
+        message = create_sms(expires_at=now() + timedelta(minutes=1))
+
+        assert SMSController().fail_expired_messages() == 3
+
+        for failed_message, error in (
+                (exhausted_message, 'the number of send attempts exceeded the limit'),
+                (old_message, 'the age of the message exceeds the send limit'),
+                (expired_message, 'the message expired')):
+            failed_message.refresh_from_db()
+            assert failed_message.state == OutputSMSMessageState.ERROR
+            assert failed_message.error == error
+        for waiting_message in (leased_message, scheduled_message, message):
+            waiting_message.refresh_from_db()
+            assert waiting_message.state == OutputSMSMessageState.WAITING
+
+    def test_fail_expired_messages_should_use_number_of_send_attempts_of_configured_backend(self, settings):
+        settings.PYMESS_SMS_BACKENDS = {
+            'default': {
+                'backend': 'tests.test_send_messages_batch.ConfiguredAttemptsSMSBackend',
+                'config': {'MAX_NUMBER_OF_SEND_ATTEMPTS': 5},
+            }
+        }
+        exhausted_message = create_sms(
+            state=OutputSMSMessageState.ERROR_RETRY, number_of_send_attempts=6,
+            backend='tests.test_send_messages_batch.ConfiguredAttemptsSMSBackend'
+        )
+        message = create_sms(
+            state=OutputSMSMessageState.ERROR_RETRY, number_of_send_attempts=3,
+            backend='tests.test_send_messages_batch.ConfiguredAttemptsSMSBackend'
+        )
+
+        assert SMSController().fail_expired_messages() == 1
+
+        exhausted_message.refresh_from_db()
+        assert exhausted_message.state == OutputSMSMessageState.ERROR
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.ERROR_RETRY
+
+    def test_command_should_fail_expired_messages_before_sending_batch(self):
+        expired_message = create_sms(expires_at=now() - timedelta(seconds=1))
+        message = create_sms()
+
+        stdout = StringIO()
+        call_command('send_messages_batch', type='sms', stdout=stdout)
+
+        expired_message.refresh_from_db()
+        message.refresh_from_db()
+        assert expired_message.state == OutputSMSMessageState.ERROR
+        assert expired_message.number_of_send_attempts == 0
+        assert message.state == OutputSMSMessageState.DEBUG
+        assert 'expired messages: 1' in stdout.getvalue()
+
+    @pytest.mark.parametrize('number_of_send_attempts,retry_after,expected_delay', [
+        (0, None, 10),
+        (2, None, 40),
+        (5, None, 100),
+        (0, 30, 30),
+    ])
+    def test_sending_error_should_set_next_attempt_with_exponential_backoff(
+            self, settings, number_of_send_attempts, retry_after, expected_delay):
+        settings.PYMESS_RETRY_BACKOFF_BASE_SECONDS = 10
+        settings.PYMESS_RETRY_BACKOFF_MAX_SECONDS = 100
+        settings.PYMESS_RETRY_BACKOFF_JITTER = False
+        settings.PYMESS_SMS_BATCH_MAX_NUMBER_OF_SEND_ATTEMPTS = 10
+        message = create_sms(number_of_send_attempts=number_of_send_attempts)
+        failed_at = now()
+
+        with patch('pymess.backend.now', return_value=failed_at):
+            DummySMSBackend()._update_message_after_sending_error(message, error='error', retry_after=retry_after)
+
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.ERROR_RETRY
+        assert message.next_attempt_at == failed_at + timedelta(seconds=expected_delay)
+
+
+@pytest.mark.django_db
+class TestMessageQueueIndex:
+
+    @pytest.mark.parametrize('model', [DialerMessage, EmailMessage, OutputSMSMessage, PushNotificationMessage])
+    def test_queue_index_should_match_claim_query(self, model):
+        queue_index, = (index for index in model._meta.indexes if index.name.endswith('_queue_idx'))
+
+        assert queue_index.expressions == get_queue_ordering()
+        assert queue_index.condition.children == [('state__in', get_queue_states(model.State))]
+
+    def test_claim_query_should_scan_queue_index_without_sorting(self):
+        OutputSMSMessage.objects.bulk_create(
+            [OutputSMSMessage(recipient='+420123456789', content='content', state=OutputSMSMessageState.SENT)
+             for _ in range(1000)]
+            + [OutputSMSMessage(recipient='+420123456789', content='content', state=OutputSMSMessageState.WAITING)
+               for _ in range(10)]
+        )
+        with CaptureQueriesContext(connection) as captured_queries:
+            SMSController().claim_waiting_or_retry_messages(5)
+        claim_sql, = (query['sql'] for query in captured_queries if query['sql'].startswith('SELECT'))
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            # SQLite uses partial index only if the condition is literal, captured SQL contains literal values
+            cursor.execute('EXPLAIN QUERY PLAN {}'.format(claim_sql))
+            query_plan = ' '.join(row[-1] for row in cursor.fetchall())
+
+        assert 'pymess_sms_queue_idx' in query_plan
+        assert 'TEMP B-TREE' not in query_plan
+
+
+@pytest.mark.django_db
+class TestBackendBulkUpdateMessages:
+
+    def test_bulk_update_messages_should_apply_changes_of_messages_with_one_query(self, django_assert_num_queries):
+        sent_message = create_sms(extra_sender_data={'previous': True})
+        failed_message = create_sms()
+        backend = DummySMSBackend()
+
+        with django_assert_num_queries(1):
+            backend._bulk_update_messages([
+                (sent_message, backend._get_message_changes_after_sending(
+                    sent_message, extra_sender_data={**sent_message.extra_sender_data, 'result': 'ok'},
+                    state=OutputSMSMessageState.SENT, sent_at=now()
+                )),
+                (failed_message, backend._get_message_changes_after_sending_error(
+                    failed_message, state=OutputSMSMessageState.ERROR, error='error'
+                )),
+            ])
+
+        sent_message.refresh_from_db()
+        failed_message.refresh_from_db()
+        assert sent_message.state == OutputSMSMessageState.SENT
+        assert sent_message.extra_sender_data == {'previous': True, 'result': 'ok'}
+        assert sent_message.number_of_send_attempts == 1
+        assert sent_message.backend == 'pymess.backend.sms.dummy.DummySMSBackend'
+        assert sent_message.sent_at is not None
+        assert failed_message.state == OutputSMSMessageState.ERROR
+        assert failed_message.error == 'error'
+        assert failed_message.number_of_send_attempts == 1
+        assert failed_message.sent_at is None
@@ -1,7 +1,16 @@
+import asyncio
 import pytest
+from datetime import timedelta
 from unittest.mock import Mock, patch
 
+from asgiref.sync import async_to_sync
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils.timezone import now
+
+from pymess.backend import _publish_in_thread
 from pymess.backend.sms import SMSController
+from pymess.backend.sms.dummy import DummySMSBackend
 from pymess.enums import OutputSMSMessageState
 from pymess.models.sms import OutputSMSMessage, SMSTemplate
 
@@ -67,3 +76,214 @@ class TestSMSController:
 
         mock_router.get_backend_name.assert_called_once_with('+420123456789', is_voice_message=True)
         mock_get_backend.assert_called_once_with(controller.backend_type_name, 'dummy-backend')
+
+    def test_bulk_create_messages_should_insert_validated_messages_with_related_objects(
+            self, settings, django_assert_num_queries):
+        settings.PYMESS_SMS_USE_ACCENT = False
+        settings.PYMESS_SMS_DEFAULT_PHONE_CODE = '+420'
+        settings.PYMESS_BULK_CREATE_BATCH_SIZE = 2
+        related_object = SMSTemplate.objects.create(slug='related', body='body')
+        ContentType.objects.get_for_model(related_object)
+        controller = SMSController()
+
+        # savepoint, 2 chunks (one query for messages and one query for related objects), savepoint release
+        with django_assert_num_queries(6):
+            messages = controller.bulk_create_messages(
+                dict(
+                    recipient='123 456 78{}'.format(i),
+                    content='Příliš žluťoučký kůň',
+                    related_objects=[related_object],
+                    tag=None,
+                    template=None,
+                )
+                for i in range(3)
+            )
+
+        assert [message.pk for message in messages] == list(
+            OutputSMSMessage.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        for i, message in enumerate(messages):
+            message.refresh_from_db()
+            assert message.recipient == '+42012345678{}'.format(i)
+            assert message.content == 'Prilis zlutoucky kun'
+            assert message.state == OutputSMSMessageState.WAITING
+            assert list(message.related_objects.values_list('object_id', flat=True)) == [str(related_object.pk)]
+
+    def test_bulk_create_messages_should_raise_sending_error_for_invalid_message(self):
+        with pytest.raises(SMSController.SMSSendingError):
+            SMSController().bulk_create_messages([
+                dict(recipient='+420123456789', content='', tag=None, template=None),
+            ])
+        assert not OutputSMSMessage.objects.exists()
+
+    def test_send_with_send_at_should_create_scheduled_message_without_publishing_it(self, settings):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        send_at = now() + timedelta(hours=1)
+
+        with patch('pymess.backend.sms.dummy.DummySMSBackend.publish_message') as mock_publish_message:
+            message = SMSController().send(
+                '+420123456789', 'Prilis zlutoucky kun', send_immediately=True, send_at=send_at
+            )
+
+        mock_publish_message.assert_not_called()
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.WAITING
+        assert message.send_at == send_at
+        assert message.is_scheduled
+        assert message.extra_data == {}
+
+    def test_send_with_send_at_should_raise_sending_error_without_batch_sending(self, settings):
+        settings.PYMESS_SMS_BATCH_SENDING = False
+
+        with pytest.raises(SMSController.SMSSendingError):
+            SMSController().send('+420123456789', 'Prilis zlutoucky kun', send_at=now() + timedelta(hours=1))
+        assert not OutputSMSMessage.objects.exists()
+
+    def test_send_with_publish_on_commit_should_publish_message_after_commit(
+            self, settings, django_capture_on_commit_callbacks):
+        settings.PYMESS_SMS_BATCH_SENDING = False
+        settings.PYMESS_PUBLISH_ON_COMMIT = True
+
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            message = SMSController().send('+420123456789', 'Prilis zlutoucky kun')
+            message.refresh_from_db()
+            assert message.state == OutputSMSMessageState.WAITING
+
+        assert len(callbacks) == 1
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.DEBUG
+
+    def test_send_with_publish_on_commit_should_not_publish_rolled_back_message(
+            self, settings, django_capture_on_commit_callbacks):
+        settings.PYMESS_SMS_BATCH_SENDING = False
+        settings.PYMESS_PUBLISH_ON_COMMIT = True
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    SMSController().send('+420123456789', 'Prilis zlutoucky kun')
+                    raise ValueError
+
+        assert callbacks == []
+        assert not OutputSMSMessage.objects.exists()
+
+    def test_publish_on_commit_should_publish_messages_in_background_thread(
+            self, settings, django_capture_on_commit_callbacks):
+        settings.PYMESS_SMS_BATCH_SENDING = False
+        settings.PYMESS_PUBLISH_ON_COMMIT_WORKERS = 1
+        publish_function = Mock()
+        messages = [Mock()]
+
+        with patch('pymess.backend.get_publish_executor') as mock_get_publish_executor:
+            with django_capture_on_commit_callbacks(execute=True):
+                SMSController().publish_on_commit(publish_function, messages)
+
+        mock_get_publish_executor.return_value.submit.assert_called_once_with(
+            _publish_in_thread, publish_function, messages
+        )
+
+    def test_publish_on_commit_should_log_publish_error_instead_of_raising_it(
+            self, settings, django_capture_on_commit_callbacks):
+        settings.PYMESS_SMS_BATCH_SENDING = False
+        publish_function = Mock(side_effect=ValueError('publish failed'))
+
+        with patch('pymess.backend.LOGGER') as mock_logger:
+            with django_capture_on_commit_callbacks(execute=True):
+                SMSController().publish_on_commit(publish_function, [Mock()])
+
+        publish_function.assert_called_once()
+        mock_logger.exception.assert_called_once()
+
+    def test_send_immediately_with_publish_on_commit_should_lease_message_before_commit(
+            self, settings, django_capture_on_commit_callbacks):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        settings.PYMESS_PUBLISH_ON_COMMIT = True
+        controller = SMSController()
+
+        with django_capture_on_commit_callbacks(execute=False) as callbacks:
+            message = controller.send('+420123456789', 'Prilis zlutoucky kun', send_immediately=True)
+            assert message.lease_expires_at is not None
+            assert controller.claim_waiting_or_retry_messages(10) == []
+
+        callbacks[0]()
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.DEBUG
+        assert message.lease_expires_at is None
+
+    def test_publish_on_commit_should_skip_messages_claimed_by_batch_sender(
+            self, settings, django_capture_on_commit_callbacks):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        settings.PYMESS_PUBLISH_ON_COMMIT = True
+        controller = SMSController()
+        publish_function = Mock()
+        message = OutputSMSMessage.objects.create(
+            recipient='+420123456789', content='content', state=OutputSMSMessageState.WAITING
+        )
+
+        with django_capture_on_commit_callbacks(execute=False) as callbacks:
+            controller.publish_on_commit(publish_function, [message])
+
+        OutputSMSMessage.objects.filter(pk=message.pk).update(lease_expires_at=now() - timedelta(seconds=1))
+        assert controller.claim_waiting_or_retry_messages(10) == [message]
+        callbacks[0]()
+        publish_function.assert_not_called()
+
+    def test_bulk_check_sms_states_should_check_messages_in_chunks(self, settings):
+        settings.PYMESS_SMS_DELIVERY_CHECK_CHUNK_SIZE = 2
+        messages = [
+            OutputSMSMessage.objects.create(
+                recipient='+420123456789',
+                content='content',
+                state=OutputSMSMessageState.SENDING,
+                backend='pymess.backend.sms.dummy.DummySMSBackend',
+            )
+            for _ in range(5)
+        ]
+        checked_chunks = []
+
+        def update_sms_states(self, messages):
+            checked_chunks.append([message.pk for message in messages])
+            if len(checked_chunks) == 1:
+                raise ValueError('invalid response')
+
+        with patch('pymess.backend.sms.dummy.DummySMSBackend.update_sms_states', update_sms_states):
+            SMSController().bulk_check_sms_states()
+
+        assert checked_chunks == [
+            [messages[0].pk, messages[1].pk], [messages[2].pk, messages[3].pk], [messages[4].pk]
+        ]
+
+    def test_bulk_check_sms_states_should_check_chunks_concurrently(self, settings):
+        settings.PYMESS_SMS_DELIVERY_CHECK_CHUNK_SIZE = 2
+        settings.PYMESS_SMS_DELIVERY_CHECK_WORKERS = 2
+        controller = SMSController()
+        backend = Mock()
+        messages_to_check = Mock()
+        messages_to_check.order_by.return_value.iterator.return_value = iter(range(5))
+
+        controller._check_sms_states(backend, messages_to_check)
+
+        messages_to_check.order_by.return_value.iterator.assert_called_once_with(chunk_size=2)
+        assert sorted(call.args[0] for call in backend.update_sms_states.call_args_list) == [[0, 1], [2, 3], [4]]
+
+    def test_apublish_message_should_publish_message_with_synchronous_backend_in_thread(self):
+        message = OutputSMSMessage.objects.create(
+            recipient='+420123456789', content='content', state=OutputSMSMessageState.WAITING
+        )
+        publish_event_loops = []
+
+        def publish_message(self, message):
+            try:
+                publish_event_loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                # synchronous backend is called outside of the event loop
+                publish_event_loops.append(None)
+            publish_message.original(self, message)
+
+        publish_message.original = DummySMSBackend.publish_message
+        with patch.object(DummySMSBackend, 'publish_message', publish_message):
+            async_to_sync(DummySMSBackend().apublish_message)(message)
+
+        assert publish_event_loops == [None]
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.DEBUG
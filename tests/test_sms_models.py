@@ -1,7 +1,12 @@
 import pytest
 from unittest.mock import patch
 
-from pymess.models.sms import OutputSMSMessage
+from asgiref.sync import async_to_sync
+
+from django.template import Template
+
+from pymess.models.sms import OutputSMSMessage, SMSTemplate
+from pymess.sender import asend_sms_template, send_sms_template_bulk
 from pymess.enums import OutputSMSMessageState
 
 
@@ -38,3 +43,87 @@ class TestOutputSMSMessageCleanContent:
             message.clean_content()
 
         assert message.content == 'Příliš žluťoučký kůň úpěl ďábelské ódy'
+
+
+@pytest.mark.django_db
+class TestSMSTemplateRendering:
+
+    def test_render_body_should_reuse_compiled_template_until_template_is_changed(self):
+        template = SMSTemplate.objects.create(slug='greeting', body='Hello {{ name }}')
+
+        with patch('pymess.utils.templates.Template', wraps=Template) as mock_template:
+            assert template.render_body({'name': 'John'}) == 'Hello John'
+            assert template.render_body({'name': 'Jane'}) == 'Hello Jane'
+            assert mock_template.call_count == 1
+
+            template.change_and_save(body='Hi {{ name }}')
+            mock_template.reset_mock()
+            assert template.render_body({'name': 'John'}) == 'Hi John'
+            assert template.render_body({'name': 'Jane'}) == 'Hi Jane'
+            assert mock_template.call_count == 1
+
+    def test_send_sms_template_bulk_should_render_template_for_every_recipient(self, settings):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        SMSTemplate.objects.create(slug='greeting', body='Hello {{ name }}', is_allowed_duplicate_messages=False)
+        related_object = SMSTemplate.objects.create(slug='related', body='body')
+
+        messages = send_sms_template_bulk('greeting', [
+            ('+420111111111', {'name': 'John'}, [related_object]),
+            ('+420222222222', {'name': 'Jane'}, None),
+        ])
+        # duplicate message for the related object is not allowed
+        assert send_sms_template_bulk('greeting', [('+420333333333', {'name': 'Jack'}, [related_object])]) == []
+
+        assert [(message.recipient, message.content, message.state) for message in messages] == [
+            ('+420111111111', 'Hello John', OutputSMSMessageState.WAITING),
+            ('+420222222222', 'Hello Jane', OutputSMSMessageState.WAITING),
+        ]
+        assert OutputSMSMessage.objects.filter_related_object(related_object).get() == messages[0]
+
+    def test_send_sms_template_bulk_should_skip_duplicate_messages_in_the_bulk(self, settings):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        SMSTemplate.objects.create(slug='greeting', body='Hello {{ name }}', is_allowed_duplicate_messages=False)
+        related_object = SMSTemplate.objects.create(slug='related', body='body')
+
+        messages = send_sms_template_bulk('greeting', [
+            ('+420111111111', {'name': 'John'}, [related_object]),
+            ('+420111111111', {'name': 'John'}, [related_object]),
+            ('+420222222222', {'name': 'Jane'}, None),
+            ('+420222222222', {'name': 'Jane'}, None),
+        ])
+
+        assert [(message.recipient, message.content) for message in messages] == [
+            ('+420111111111', 'Hello John'),
+            ('+420222222222', 'Hello Jane'),
+            ('+420222222222', 'Hello Jane'),
+        ]
+        assert OutputSMSMessage.objects.filter_related_object(related_object).get() == messages[0]
+
+    def test_asend_sms_template_should_create_and_publish_message(self, settings):
+        settings.PYMESS_SMS_USE_ACCENT = True
+        SMSTemplate.objects.create(slug='greeting', body='Hello {{ name }}', is_allowed_duplicate_messages=False)
+        related_object = SMSTemplate.objects.create(slug='related', body='body')
+
+        message = async_to_sync(asend_sms_template)('+420111111111', 'greeting', {'name': 'John'},
+                                                    related_objects=[related_object])
+
+        assert message.content == 'Hello John'
+        assert message.state == OutputSMSMessageState.DEBUG
+        assert OutputSMSMessage.objects.filter_related_object(related_object).get() == message
+        assert async_to_sync(asend_sms_template)('+420111111111', 'greeting', {'name': 'John'},
+                                                 related_objects=[related_object]) is None
+
+    def test_send_bulk_should_render_messages_in_processes(self, settings):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        settings.PYMESS_TEMPLATE_RENDER_CHUNK_SIZE = 2
+        template = SMSTemplate.objects.create(slug='greeting', body='Hello {{ name }}')
+
+        messages = template.send_bulk(
+            [('+42011111111{}'.format(i), {'name': 'John {}'.format(i)}, None) for i in range(5)],
+            render_processes=2,
+        )
+
+        assert [(message.recipient, message.content) for message in messages] == [
+            ('+42011111111{}'.format(i), 'Hello John {}'.format(i)) for i in range(5)
+        ]
+        assert all(message.template is template for message in messages)
@@ -1,8 +1,13 @@
-from unittest.mock import Mock, patch, call
+from unittest.mock import AsyncMock, Mock, patch, call
+
+from datetime import timedelta
 
 import pytest
+import requests
 import xml.etree.ElementTree as ET
 
+from asgiref.sync import async_to_sync
+
 from pymess.backend.sms.sms_operator import RequestType, SMSOperatorBackend, SmsOperatorState
 from pymess.enums import OutputSMSMessageState
 from pymess.models.sms import OutputSMSMessage
@@ -216,3 +221,167 @@ class TestSMSOperatorBackend:
 
         assert result[10] == SmsOperatorState.DELIVERED
         assert result[11] == SmsOperatorState.NOT_DELIVERED
+
+    @patch('pymess.backend.sms.sms_operator.generate_session')
+    def test_send_requests_should_share_pooled_http_adapter(self, mock_generate_session, backend):
+        message = OutputSMSMessage.objects.create(
+            recipient='+420123456789',
+            content='content',
+            state=OutputSMSMessageState.WAITING,
+        )
+        session = Mock()
+        session.post.return_value = Mock(
+            status_code=200,
+            text=f'<SmsServices><DataItem><SmsId>pref-{message.pk}</SmsId><Status>0</Status></DataItem></SmsServices>'
+        )
+        mock_generate_session.return_value = session
+
+        backend._send_requests([message], request_type=RequestType.SMS, is_sending=True)
+        backend._send_requests([message], request_type=RequestType.DELIVERY_REQUEST)
+
+        adapters = [call.kwargs['adapter'] for call in mock_generate_session.call_args_list]
+        assert adapters == [backend.http_adapter, backend.http_adapter]
+        assert backend.http_adapter._pool_maxsize == backend.config['POOL_SIZE']
+        assert [call.kwargs['related_objects'] for call in mock_generate_session.call_args_list] == [
+            [message], [message]
+        ]
+
+    def test_apublish_messages_should_send_requests_with_async_client(self, backend):
+        sms = OutputSMSMessage.objects.create(
+            recipient='+420111111111',
+            content='sms',
+            state=OutputSMSMessageState.WAITING,
+        )
+        invalid_sms = OutputSMSMessage.objects.create(
+            recipient='+420222222222',
+            content='sms',
+            state=OutputSMSMessageState.WAITING,
+        )
+
+        client = Mock(post=AsyncMock(side_effect=[
+            Mock(status_code=200, text=(
+                f'<SmsServices><DataItem><SmsId>pref-{sms.pk}</SmsId><Status>0</Status></DataItem></SmsServices>'
+            )),
+            Mock(status_code=500, text=''),
+        ]))
+        with patch.object(backend, 'get_async_http_client', return_value=client):
+            async_to_sync(backend.apublish_messages)([sms])
+            async_to_sync(backend.apublish_message)(invalid_sms)
+
+        assert [call.args[0] for call in client.post.call_args_list] == [backend.config['SMS_URL']] * 2
+        sms.refresh_from_db()
+        assert sms.state == OutputSMSMessageState.DELIVERED
+        assert sms.sent_at is not None
+        invalid_sms.refresh_from_db()
+        assert invalid_sms.state == OutputSMSMessageState.ERROR
+        assert invalid_sms.error == 'SMS operator returned invalid response status code: 500'
+
+    @patch('pymess.backend.sms.sms_operator.generate_session')
+    def test_publish_messages_should_retry_messages_after_temporary_error(self, mock_generate_session, backend,
+                                                                         settings):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        settings.PYMESS_RETRY_BACKOFF_BASE_SECONDS = 1
+        message = OutputSMSMessage.objects.create(
+            recipient='+420111111111',
+            content='sms',
+            state=OutputSMSMessageState.WAITING,
+        )
+        mock_generate_session.return_value.post.return_value = Mock(
+            status_code=503, text='', headers={'Retry-After': '120'}
+        )
+
+        backend.publish_messages([message])
+
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.ERROR_RETRY
+        assert message.number_of_send_attempts == 1
+        assert message.next_attempt_at - message.changed_at >= timedelta(seconds=119)
+
+    @patch('pymess.backend.sms.sms_operator.generate_session')
+    def test_publish_messages_should_retry_messages_after_connection_error(self, mock_generate_session, backend,
+                                                                          settings):
+        settings.PYMESS_SMS_BATCH_SENDING = True
+        settings.PYMESS_RETRY_BACKOFF_BASE_SECONDS = 1
+        message = OutputSMSMessage.objects.create(
+            recipient='+420111111111',
+            content='sms',
+            state=OutputSMSMessageState.WAITING,
+        )
+        mock_generate_session.return_value.post.side_effect = requests.exceptions.ConnectionError('connection failed')
+
+        backend.publish_messages([message])
+
+        message.refresh_from_db()
+        assert message.state == OutputSMSMessageState.ERROR_RETRY
+        assert message.error == 'SMS operator returned returned exception: connection failed'
+        assert message.number_of_send_attempts == 1
+
+    @patch('pymess.backend.sms.sms_operator.generate_session')
+    def test_delivery_request_should_update_states_of_messages_with_bulk_update(
+            self, mock_generate_session, backend, django_assert_num_queries):
+        delivered_sms = OutputSMSMessage.objects.create(
+            recipient='+420111111111',
+            content='sms',
+            state=OutputSMSMessageState.SENDING,
+        )
+        not_delivered_sms = OutputSMSMessage.objects.create(
+            recipient='+420222222222',
+            content='sms',
+            state=OutputSMSMessageState.SENDING,
+        )
+        mock_generate_session.return_value.post.return_value = Mock(
+            status_code=200,
+            text=(
+                f'<SmsServices>'
+                f'<DataItem><SmsId>pref-{delivered_sms.pk}</SmsId><Status>0</Status></DataItem>'
+                f'<DataItem><SmsId>pref-{not_delivered_sms.pk}</SmsId><Status>1</Status></DataItem>'
+                f'</SmsServices>'
+            )
+        )
+
+        with django_assert_num_queries(1):
+            backend.update_sms_states([delivered_sms, not_delivered_sms])
+
+        delivered_sms.refresh_from_db()
+        assert delivered_sms.state == OutputSMSMessageState.DELIVERED
+        assert delivered_sms.error is None
+        assert delivered_sms.extra_sender_data == {'prefix': 'pref', 'sender_state': SmsOperatorState.DELIVERED}
+        not_delivered_sms.refresh_from_db()
+        assert not_delivered_sms.state == OutputSMSMessageState.ERROR_UPDATE
+        assert not_delivered_sms.error == SmsOperatorState.NOT_DELIVERED.label
+
+    def test_async_http_client_should_be_shared_in_event_loop_and_closed_with_it(self, backend):
+        clients = []
+
+        def generate_async_client(**kwargs):
+            clients.append(Mock(aclose=AsyncMock()))
+            return clients[-1]
+
+        async def get_clients():
+            return backend.get_async_http_client(), backend.get_async_http_client()
+
+        with patch('pymess.utils.logged_requests.generate_async_client', side_effect=generate_async_client):
+            first_client, second_client = async_to_sync(get_clients)()
+            assert first_client is second_client
+            assert clients == [first_client]
+            first_client.aclose.assert_awaited_once()
+
+            async_to_sync(get_clients)()
+            assert len(clients) == 2
+            clients[1].aclose.assert_awaited_once()
+
+    def test_aclose_async_http_client_should_close_client_of_event_loop(self, backend):
+        client = Mock(aclose=AsyncMock())
+
+        async def use_and_close_client():
+            assert backend.get_async_http_client() is client
+            await backend.aclose_async_http_client()
+            client.aclose.assert_awaited_once()
+            # closed client is not used anymore
+            assert backend.get_async_http_client() is not client
+
+        with patch('pymess.utils.logged_requests.generate_async_client',
+                   side_effect=[client, Mock(aclose=AsyncMock())]):
+            async_to_sync(use_and_close_client)()
+
+        client.aclose.assert_awaited_once()
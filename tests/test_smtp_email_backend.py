@@ -0,0 +1,75 @@
+from smtplib import SMTPServerDisconnected
+from unittest.mock import patch
+
+import pytest
+
+from pymess.backend.emails.smtp import SMTPEmailBackend
+from pymess.enums import EmailMessageState
+from pymess.models.emails import EmailMessage
+
+
+@pytest.mark.django_db
+class TestSMTPEmailBackend:
+
+    @patch('pymess.backend.emails.smtp.get_connection')
+    def test_publish_messages_should_reuse_one_connection(self, mock_get_connection):
+        messages = [
+            EmailMessage.objects.create(
+                recipient='test@example.com',
+                sender='sender@example.com',
+                subject='Test Subject',
+                content='Test Content',
+                state=EmailMessageState.WAITING,
+            )
+            for _ in range(3)
+        ]
+        backend = SMTPEmailBackend()
+
+        backend.publish_messages(messages[:2])
+        backend.publish_message(messages[2])
+
+        mock_get_connection.assert_called_once()
+        connection = mock_get_connection.return_value
+        assert connection.send_messages.call_count == 3
+        connection.close.assert_not_called()
+        for message in messages:
+            message.refresh_from_db()
+            assert message.state == EmailMessageState.SENT
+
+    @patch('pymess.backend.emails.smtp.get_connection')
+    def test_publish_messages_should_reconnect_if_server_closed_connection(self, mock_get_connection):
+        message = EmailMessage.objects.create(
+            recipient='test@example.com',
+            sender='sender@example.com',
+            subject='Test Subject',
+            content='Test Content',
+            state=EmailMessageState.WAITING,
+        )
+        backend = SMTPEmailBackend()
+        mock_get_connection.return_value.send_messages.side_effect = [SMTPServerDisconnected, 1]
+
+        backend.publish_message(message)
+
+        assert mock_get_connection.call_count == 2
+        mock_get_connection.return_value.close.assert_called_once()
+        message.refresh_from_db()
+        assert message.state == EmailMessageState.SENT
+
+    @patch('pymess.backend.emails.smtp.get_connection')
+    def test_publish_messages_should_close_connection_if_it_should_not_be_kept_open(self, mock_get_connection):
+        message = EmailMessage.objects.create(
+            recipient='test@example.com',
+            sender='sender@example.com',
+            subject='Test Subject',
+            content='Test Content',
+            state=EmailMessageState.WAITING,
+        )
+        backend = SMTPEmailBackend(config={'KEEP_CONNECTION_OPEN': False})
+        mock_get_connection.return_value.send_messages.side_effect = ValueError('invalid')
+
+        backend.publish_message(message)
+
+        mock_get_connection.return_value.close.assert_called_once()
+        message.refresh_from_db()
+        assert message.state == EmailMessageState.ERROR
+        assert message.error == 'invalid'
@@ -0,0 +1,69 @@
+import pytest
+
+from django.contrib.contenttypes.models import ContentType
+
+from pymess.enums import OutputSMSMessageState
+from pymess.models.sms import OutputSMSMessage, SMSTemplate, SMSTemplateDisallowedObject
+from pymess.utils.templates import template_registry
+
+
+@pytest.fixture(autouse=True)
+def registry(settings):
+    settings.PYMESS_TEMPLATE_REGISTRY_TTL_SECONDS = 60
+    template_registry.clear()
+    yield template_registry
+    template_registry.clear()
+
+
+@pytest.mark.django_db
+class TestTemplateRegistry:
+
+    def test_registry_should_cache_template_until_template_is_changed(self, registry, django_assert_num_queries):
+        template = SMSTemplate.objects.create(slug='greeting', body='Hello')
+
+        # template and disallowed objects check
+        with django_assert_num_queries(2):
+            assert registry.get(SMSTemplate, 'greeting') == template
+        with django_assert_num_queries(0):
+            cached_template = registry.get(SMSTemplate, 'greeting')
+            assert cached_template.can_send('+420123456789', [template])
+
+        SMSTemplateDisallowedObject.objects.create(
+            template=template, object_id=template.pk, content_type=ContentType.objects.get_for_model(template)
+        )
+        assert registry.get(SMSTemplate, 'greeting') is not cached_template
+
+        template.change_and_save(body='Hi')
+        assert registry.get(SMSTemplate, 'greeting').body == 'Hi'
+
+    def test_registry_without_cache_should_load_only_template(self, registry, settings, django_assert_num_queries):
+        settings.PYMESS_TEMPLATE_REGISTRY_TTL_SECONDS = 0
+        template = SMSTemplate.objects.create(slug='greeting', body='Hello')
+
+        with django_assert_num_queries(1):
+            loaded_template = registry.get(SMSTemplate, 'greeting')
+            assert loaded_template == template
+            assert loaded_template.can_send('+420123456789', None)
+
+    def test_registry_should_not_be_cleared_with_changes_of_other_models(self, registry, django_assert_num_queries):
+        SMSTemplate.objects.create(slug='greeting', body='Hello')
+        cached_template = registry.get(SMSTemplate, 'greeting')
+
+        OutputSMSMessage.objects.create(
+            recipient='+420123456789', content='Hello', state=OutputSMSMessageState.WAITING
+        ).delete()
+
+        with django_assert_num_queries(0):
+            assert registry.get(SMSTemplate, 'greeting') is cached_template
+
+    def test_registry_should_raise_does_not_exist_for_missing_template(self, registry):
+        with pytest.raises(SMSTemplate.DoesNotExist):
+            registry.get(SMSTemplate, 'greeting', locale='cs')
+
+    def test_registry_should_fallback_to_language_and_default_locale(self, registry, settings):
+        settings.PYMESS_TEMPLATE_LOCALE_FALLBACK = True
+        default_template = SMSTemplate.objects.create(slug='greeting', body='Hello')
+        czech_template = SMSTemplate.objects.create(slug='greeting', locale='cs', body='Ahoj')
+
+        assert registry.get(SMSTemplate, 'greeting', locale='cs-CZ') == czech_template
+        assert registry.get(SMSTemplate, 'greeting', locale='de') == default_template